@@ -5,7 +5,8 @@ Author: Georgios Tsakoumakis
 """
 
 from django.contrib import admin
-from .models import Message, Session
+from .models import ArchivedSession, Message, Session
 
 admin.site.register(Message)
 admin.site.register(Session)
+admin.site.register(ArchivedSession)
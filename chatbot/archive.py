@@ -0,0 +1,167 @@
+"""
+Cold storage for idle chat sessions.
+
+Sessions that have been idle for a number of days are archived: their messages are serialised to JSON,
+compressed with zlib into a single ArchivedSession row and removed from the messages table. A message added
+while a session is being archived stays in the messages table, and is read together with the archived ones.
+Archived sessions can still be opened, and are moved back into the messages table as soon as the user
+continues chatting in them. Archived messages are not covered by the chat history search.
+
+Author: Georgios Tsakoumakis
+"""
+
+import json
+import zlib
+from datetime import timedelta
+from heapq import merge
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Max, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from chatbot.models import ArchivedSession, Message, Session
+
+COMPRESSION_LEVEL = 9
+# Number of messages whose creation date is restored per UPDATE statement
+RESTORE_BATCH_SIZE = 500
+
+
+def compress_messages(messages):
+    """
+    Serialise and compress a sequence of messages.
+    :param messages: Iterable of Message objects ordered by creation date
+    :return: bytes - zlib-compressed JSON list of [message_id, role, text, created_at] rows
+    """
+    rows = [
+        [message.message_id, message.role, message.text, message.created_at.isoformat()]
+        for message in messages
+    ]
+    return zlib.compress(
+        json.dumps(rows, separators=(",", ":")).encode("utf-8"), COMPRESSION_LEVEL
+    )
+
+
+def decompress_messages(archive):
+    """
+    Decompress an archived session into unsaved Message objects.
+    :param archive: ArchivedSession object
+    :return: list of Message objects ordered by creation date
+    """
+    rows = json.loads(zlib.decompress(bytes(archive.data)).decode("utf-8"))
+    return [
+        Message(
+            message_id=message_id,
+            session_id=archive.session_id,
+            role=role,
+            text=text,
+            created_at=parse_datetime(created_at),
+        )
+        for message_id, role, text, created_at in rows
+    ]
+
+
+def get_session_messages(session_id):
+    """
+    Get the messages of a session, reading them from cold storage too if the session is archived.
+    :param session_id: Session ID
+    :return: QuerySet or list of Message objects ordered by creation date
+    """
+    messages = Message.objects.filter(session_id=session_id).order_by(
+        "created_at", "message_id"
+    )
+    archive = ArchivedSession.objects.filter(session_id=session_id).first()
+    if archive is not None:
+        # Messages added while the session was being archived are still in the messages table
+        return list(
+            merge(
+                decompress_messages(archive),
+                messages,
+                key=lambda message: (message.created_at, message.message_id),
+            )
+        )
+    return messages
+
+
+def archive_session(session):
+    """
+    Move the messages of a session into cold storage.
+    :param session: Session object
+    :return: int - number of archived messages, 0 if the session was empty or already archived
+    """
+    with transaction.atomic():
+        if ArchivedSession.objects.filter(session=session).exists():
+            return 0
+        messages = list(
+            Message.objects.select_for_update()
+            .filter(session=session)
+            .order_by("created_at", "message_id")
+        )
+        if not messages:
+            return 0
+        ArchivedSession.objects.create(
+            session=session,
+            data=compress_messages(messages),
+            message_count=len(messages),
+        )
+        # Only the archived messages, a message added since they were read stays in the messages table
+        Message.objects.filter(pk__in=[message.pk for message in messages]).delete()
+    return len(messages)
+
+
+def archive_idle_sessions(days, batch_size=100):
+    """
+    Archive every session whose last message is older than the given number of days.
+    Each session is archived in its own transaction so a long run never holds many locks.
+    :param days: Number of idle days after which a session is archived
+    :param batch_size: Number of sessions fetched per round trip
+    :return: tuple(int, int) - number of archived sessions and messages
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    sessions = (
+        Session.objects.filter(archive__isnull=True)
+        .annotate(last_message_at=Max("message__created_at"))
+        .filter(last_message_at__lt=cutoff)
+        .order_by("session_id")
+    )
+    archived_sessions = archived_messages = 0
+    for session in sessions.iterator(chunk_size=batch_size):
+        count = archive_session(session)
+        if count:
+            archived_sessions += 1
+            archived_messages += count
+    return archived_sessions, archived_messages
+
+
+def rehydrate_session(session):
+    """
+    Move an archived session back into the messages table, keeping message IDs and creation dates.
+    :param session: Session object
+    :return: int - number of restored messages, 0 if the session was not archived
+    """
+    with transaction.atomic():
+        archive = (
+            ArchivedSession.objects.select_for_update()
+            .filter(session=session)
+            .first()
+        )
+        if archive is None:
+            return 0
+        messages = decompress_messages(archive)
+        created_at = [(message.message_id, message.created_at) for message in messages]
+        # bulk_create skips Message.save(), the messages were validated when first saved
+        Message.objects.bulk_create(messages)
+        # auto_now_add overwrites created_at on insert, restore the original dates in batched statements
+        for start in range(0, len(created_at), RESTORE_BATCH_SIZE):
+            batch = created_at[start:start + RESTORE_BATCH_SIZE]
+            Message.objects.filter(
+                message_id__in=[message_id for message_id, _ in batch]
+            ).update(
+                created_at=Case(
+                    *[
+                        When(message_id=message_id, then=Value(date))
+                        for message_id, date in batch
+                    ],
+                    output_field=DateTimeField(),
+                )
+            )
+        archive.delete()
+    return len(messages)
@@ -0,0 +1,239 @@
+"""
+WebSocket consumer for the chatbot.
+
+A browser tab opens one connection to /ws/chatbot/ and sends messages for any of the user's sessions over it.
+The user is authenticated and the sessions they own are loaded once when the connection opens, and the
+chatbot's response is streamed back token by token.
+
+Client frames:
+    {"type": "message", "session_id": 1, "message": "..."}
+Server frames:
+    {"type": "token", "session_id": 1, "text": "..."}
+    {"type": "done", "session_id": 1}
+    {"type": "error", "session_id": 1, "error": "..."}
+
+Author: Georgios Tsakoumakis
+"""
+
+import asyncio
+import json
+import logging
+from http.cookies import SimpleCookie
+from importlib import import_module
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, load_backend
+from django.db import close_old_connections
+from django.http.request import split_domain_port, validate_host
+from django.utils.crypto import constant_time_compare
+from chatbot.archive import rehydrate_session
+from chatbot.llm import stream_reply
+from chatbot.models import Session
+from chatbot.titles import request_title, title_generator
+
+logger = logging.getLogger(__name__)
+
+# Close code sent when the connection is refused (same meaning as HTTP 403)
+CLOSE_FORBIDDEN = 4403
+
+
+def get_header(scope, name):
+    """
+    Get a header from an ASGI scope.
+    :param scope: ASGI connection scope
+    :param name: Lower case header name as bytes
+    :return: str or None
+    """
+    for header, value in scope.get("headers", []):
+        if header == name:
+            return value.decode("latin1")
+    return None
+
+
+def is_allowed_origin(scope):
+    """
+    Check that the connection was opened by a page served from one of the allowed hosts.
+    Browsers do not apply CSRF protection to WebSockets, so cross-site connections are refused here.
+    :param scope: ASGI connection scope
+    :return: bool
+    """
+    origin = get_header(scope, b"origin")
+    if origin is None:
+        # Non-browser clients do not send an origin, they still need a valid session cookie
+        return True
+    host = origin.split("://", 1)[-1]
+    domain, port = split_domain_port(host)
+    allowed_hosts = [host for host in settings.ALLOWED_HOSTS if host]
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = [".localhost", "127.0.0.1", "[::1]"]
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+def get_user(scope):
+    """
+    Load the user attached to the Django session cookie of a connection.
+    :param scope: ASGI connection scope
+    :return: CustomUser or None
+    """
+    cookies = SimpleCookie(get_header(scope, b"cookie") or "")
+    if settings.SESSION_COOKIE_NAME not in cookies:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(cookies[settings.SESSION_COOKIE_NAME].value)
+    try:
+        user_id = session[SESSION_KEY]
+        backend_path = session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return None
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    user = load_backend(backend_path).get_user(user_id)
+    # Sessions are invalidated when the password changes
+    if user is None or not constant_time_compare(
+        session.get(HASH_SESSION_KEY, ""), user.get_session_auth_hash()
+    ):
+        return None
+    return user
+
+
+def get_session_ids(user):
+    """
+    Get the IDs of the sessions owned by a user.
+    :param user: CustomUser object
+    :return: set of session IDs
+    """
+    return set(Session.objects.filter(user=user).values_list("session_id", flat=True))
+
+
+def run_reply(session_id, user_message, emit):
+    """
+    Generate and save the chatbot's response in a worker thread, passing each chunk to emit.
+    :param session_id: Session ID, already checked to belong to the user
+    :param user_message: Text of the user's message
+    :param emit: Callable receiving each chunk of the response
+    :return: None
+    """
+    try:
+        session = Session.objects.get(session_id=session_id)
+        # Move archived sessions back into the messages table before continuing the chat
+        rehydrate_session(session)
+        with title_generator.interactive():
+            for chunk in stream_reply(session, user_message):
+                emit(chunk)
+        request_title(session)
+    finally:
+        close_old_connections()
+
+
+class ChatConsumer:
+    """
+    ASGI application serving the chatbot WebSocket. One instance of the connection state is kept per
+    connection, so the authentication and session ownership checks are not repeated for every message.
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.user = None
+        self.session_ids = set()
+        # Sessions with a response being generated, a session handles one message at a time
+        self.tasks = {}
+
+    @classmethod
+    async def as_asgi(cls, scope, receive, send):
+        """
+        ASGI entry point, creating a consumer for each connection.
+        """
+        await cls(scope, receive, send).run()
+
+    async def run(self):
+        """
+        Handle the connection until the client disconnects.
+        """
+        while True:
+            event = await self.receive()
+            if event["type"] == "websocket.connect":
+                if not await self.connect():
+                    return
+            elif event["type"] == "websocket.receive":
+                await self.receive_frame(event.get("text"))
+            elif event["type"] == "websocket.disconnect":
+                for task in self.tasks.values():
+                    task.cancel()
+                return
+
+    async def connect(self):
+        """
+        Authenticate the connection and load the user's sessions.
+        :return: bool - True if the connection was accepted
+        """
+        if is_allowed_origin(self.scope):
+            self.user = await sync_to_async(get_user)(self.scope)
+        if self.user is None or self.user.is_banned:
+            await self.send({"type": "websocket.close", "code": CLOSE_FORBIDDEN})
+            return False
+        self.session_ids = await sync_to_async(get_session_ids)(self.user)
+        await self.send({"type": "websocket.accept"})
+        return True
+
+    async def send_json(self, data):
+        await self.send({"type": "websocket.send", "text": json.dumps(data)})
+
+    async def receive_frame(self, text):
+        """
+        Handle a frame sent by the client.
+        :param text: Text of the frame
+        """
+        try:
+            data = json.loads(text or "")
+            session_id = int(data.get("session_id"))
+            user_message = str(data.get("message", "")).strip()
+        except (TypeError, ValueError, AttributeError):
+            await self.send_json({"type": "error", "error": "Invalid message"})
+            return
+
+        if data.get("type") != "message" or not user_message:
+            await self.send_json({"type": "error", "session_id": session_id, "error": "Invalid message"})
+            return
+        if session_id not in self.session_ids:
+            # The session may have been created after the connection was opened
+            self.session_ids = await sync_to_async(get_session_ids)(self.user)
+            if session_id not in self.session_ids:
+                await self.send_json({"type": "error", "session_id": session_id, "error": "Session not found"})
+                return
+        if session_id in self.tasks:
+            await self.send_json({"type": "error", "session_id": session_id, "error": "Session is busy"})
+            return
+
+        task = asyncio.ensure_future(self.reply(session_id, user_message))
+        self.tasks[session_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(session_id, None))
+
+    async def reply(self, session_id, user_message):
+        """
+        Stream the chatbot's response to the client as it is generated.
+        :param session_id: Session ID
+        :param user_message: Text of the user's message
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(chunk):
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+        worker = loop.run_in_executor(None, run_reply, session_id, user_message, emit)
+        # Forward chunks until the worker has finished and the queue is drained
+        while not (worker.done() and queue.empty()):
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, worker}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                await self.send_json({"type": "token", "session_id": session_id, "text": getter.result()})
+            else:
+                getter.cancel()
+
+        if worker.exception() is not None:
+            logger.exception("Chatbot response failed", exc_info=worker.exception())
+            await self.send_json({"type": "error", "session_id": session_id, "error": "The chatbot is unavailable"})
+        else:
+            await self.send_json({"type": "done", "session_id": session_id})
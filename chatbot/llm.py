@@ -0,0 +1,88 @@
+"""
+This module wraps the Gemini Pro model used by the chatbot. It is shared by the HTTP views and the WebSocket consumer.
+
+Author: Georgios Tsakoumakis
+"""
+
+import os
+from vertexai.generative_models import Content, GenerativeModel, Part
+import vertexai
+from chatbot.models import Message
+
+SYSTEM_MESSAGE = """
+        Your name is Cyber Justitia.
+        You are a helpful legal assistant who helps people with their legal problems.
+        You are an expert in UK law and Newcastle-upon-Tyne bylaws.
+        IMPORTANT: Do NOT say that you cannot provide legal advice. Instead, say that as a helpful legal assistant,
+        you can provide general information and guidance on legal matters, but not official legal advice.
+        If you don't know the answer, just say that you don't know.
+        """
+
+MODEL_INTRODUCTION = """
+                        I am Cyber Justitia, a helpful legal assistant.
+                        I am an expert in UK law and Newcastle-upon-Tyne bylaws.
+                        I can provide general information and guidance on legal matters, but not official legal advice.
+                        """
+
+
+def get_model():
+    """
+    Initialise Vertex AI and return the generative model used by the chatbot.
+    :return: GenerativeModel object
+    """
+    vertexai.init(project=os.getenv("PROJECT_ID"), location=os.getenv("LOCATION"))
+    return GenerativeModel("gemini-1.0-pro")
+
+
+def start_chat(messages=()):
+    """
+    Start a chat with the system prompt, followed by the given past messages as history.
+    :param messages: Iterable of Message objects ordered by creation date
+    :return: ChatSession object
+    """
+    chat = get_model().start_chat(
+        history=[
+            Content(role="user", parts=[Part.from_text(SYSTEM_MESSAGE)]),
+            Content(role="model", parts=[Part.from_text(MODEL_INTRODUCTION)]),
+        ]
+    )
+    # Add past messages to chat history
+    for message in messages:
+        if message.role == Message.Role.USER:
+            chat.history.append(Content(role="user", parts=[Part.from_text(message.text)]))
+        elif message.role == Message.Role.BOT:
+            chat.history.append(Content(role="model", parts=[Part.from_text(message.text)]))
+    return chat
+
+
+def save_exchange(session, user_message, chatbot_response):
+    """
+    Save a user message and the chatbot's response to a session.
+    The system message is stored once, before the first exchange of the session.
+    :param session: Session object
+    :param user_message: Text of the user's message
+    :param chatbot_response: Text of the chatbot's response
+    :return: None
+    """
+    # Save the system message in the database if it doesn't exist
+    if not Message.objects.filter(session=session, role=Message.Role.SYSTEM).exists():
+        Message.objects.create(session=session, text=SYSTEM_MESSAGE, role=Message.Role.SYSTEM)
+    Message.objects.create(session=session, text=user_message, role=Message.Role.USER)
+    Message.objects.create(session=session, text=chatbot_response, role=Message.Role.BOT)
+
+
+def stream_reply(session, user_message):
+    """
+    Generate the chatbot's response to a message in a session, yielding the text as it is produced.
+    The exchange is saved to the session once the response is complete.
+    :param session: Session object, already rehydrated if it was archived
+    :param user_message: Text of the user's message
+    :return: Generator of str chunks
+    """
+    messages = Message.objects.filter(session=session).order_by("created_at")
+    chat = start_chat(messages)
+    chunks = []
+    for response in chat.send_message(user_message, stream=True):
+        chunks.append(response.text)
+        yield response.text
+    save_exchange(session, user_message, "".join(chunks))
@@ -0,0 +1,25 @@
+"""
+Management command to move idle chat sessions into compressed cold storage.
+
+Usage:
+    python manage.py archive_sessions --days 30
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.core.management.base import BaseCommand
+from chatbot.archive import archive_idle_sessions
+
+
+class Command(BaseCommand):
+    help = "Archive chat sessions that have been idle for more than the given number of days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Number of idle days before archiving")
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        sessions, messages = archive_idle_sessions(options["days"], options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {sessions} session(s) containing {messages} message(s).")
+        )
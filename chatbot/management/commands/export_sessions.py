@@ -0,0 +1,57 @@
+"""
+Management command to export the chat history of a user as NDJSON or JSON.
+
+Usage:
+    python manage.py export_sessions <username> --format ndjson --output history.ndjson.gz --gzip
+
+Author: Georgios Tsakoumakis
+"""
+
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.utils import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_export, gzip_stream
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Stream the chat history of a user to a file or standard output."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="Username of the user to export")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--session", type=int, default=None, help="Only export this session ID")
+        parser.add_argument("--output", default=None, help="Output file, defaults to standard output")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options["username"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        chunks = iter_export(
+            user,
+            options["format"],
+            session_id=options["session"],
+            chunk_size=options["chunk_size"],
+        )
+
+        if options["gzip"]:
+            chunks = gzip_stream(chunks)
+            output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        elif options["output"]:
+            output = open(options["output"], "w", encoding="utf-8")
+        else:
+            output = None
+
+        try:
+            for chunk in chunks:
+                if output is None:
+                    # The command's own stdout appends a newline to every write by default
+                    self.stdout.write(chunk, ending="")
+                else:
+                    output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
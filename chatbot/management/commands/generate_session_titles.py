@@ -0,0 +1,27 @@
+"""
+Management command to generate titles for chat sessions that do not have one.
+The web process titles new sessions in the background, this command catches up on sessions it missed.
+
+Usage:
+    python manage.py generate_session_titles --batch-size 20
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.core.management.base import BaseCommand
+from chatbot.titles import title_sessions, untitled_session_ids
+
+
+class Command(BaseCommand):
+    help = "Generate titles for untitled chat sessions, one model request per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of sessions to title")
+
+    def handle(self, *args, **options):
+        session_ids = list(untitled_session_ids()[: options["limit"]])
+        titled = 0
+        for start in range(0, len(session_ids), options["batch_size"]):
+            titled += title_sessions(session_ids[start:start + options["batch_size"]])
+        self.stdout.write(self.style.SUCCESS(f"Titled {titled} of {len(session_ids)} session(s)."))
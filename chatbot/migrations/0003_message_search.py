@@ -0,0 +1,77 @@
+from django.db import migrations
+
+POSTGRES_FORWARDS = [
+    # btree_gin lets the GIN index also cover session_id, so per-user searches do not scan other users' matches
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    """
+    ALTER TABLE messages ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+    """,
+    "CREATE INDEX messages_search_idx ON messages USING gin (session_id, search_vector)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS messages_search_idx",
+    "ALTER TABLE messages DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE messages_fts USING fts5(
+        text, content='messages', content_rowid='message_id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.message_id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.message_id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.message_id, old.text);
+        INSERT INTO messages_fts(rowid, text) VALUES (new.message_id, new.text);
+    END
+    """,
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == "postgresql":
+            statements = postgres_statements
+        elif vendor == "sqlite":
+            statements = sqlite_statements
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatbot", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
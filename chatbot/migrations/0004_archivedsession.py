@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatbot", "0003_message_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedSession",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archive",
+                        serialize=False,
+                        to="chatbot.session",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("message_count", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Archived Session",
+                "verbose_name_plural": "Archived Sessions",
+                "db_table": "archived_sessions",
+            },
+        ),
+    ]
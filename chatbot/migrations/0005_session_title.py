@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatbot", "0004_archivedsession"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="title",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="title"
+            ),
+        ),
+    ]
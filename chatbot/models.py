@@ -12,7 +12,7 @@ from django.core.exceptions import ValidationError
 class Session(models.Model):
     """
     Session model to store chatbot sessions. Each session is associated with a user.
-    Each session can contain multiple messages.
+    Each session can contain multiple messages. The title is generated in the background from the first exchange.
     """
 
     class Meta:
@@ -23,6 +23,7 @@ class Session(models.Model):
     session_id = models.AutoField(primary_key=True)
     user = models.ForeignKey("users.CustomUser", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True, null=False)
+    title = models.CharField(_("title"), max_length=100, blank=True, default="")
 
     def __str__(self):
         """
@@ -92,3 +93,30 @@ class Message(models.Model):
         """
         self.full_clean()
         super(Message, self).save(*args, **kwargs)
+
+
+class ArchivedSession(models.Model):
+    """
+    ArchivedSession model to store the messages of an idle session in compressed form.
+    While a session is archived its messages are removed from the messages table and kept here as a
+    single zlib-compressed JSON blob. The session is rehydrated when the user continues chatting in it.
+    """
+
+    class Meta:
+        verbose_name = "Archived Session"
+        verbose_name_plural = "Archived Sessions"
+        db_table = "archived_sessions"
+
+    session = models.OneToOneField(
+        Session, on_delete=models.CASCADE, primary_key=True, related_name="archive"
+    )
+    data = models.BinaryField()
+    message_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        String representation of the archived session.
+        :return: str - archived session representation in the format "username_session_id (archived)"
+        """
+        return f"{self.session} (archived)"
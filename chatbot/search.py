@@ -0,0 +1,82 @@
+"""
+Full-text search over the chat history of a user.
+
+On PostgreSQL the messages table carries a generated tsvector column with a GIN index.
+Under the SQLite test/experimental configuration an FTS5 table mirrors the message text instead.
+Both are created by migration 0003_message_search.
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.db import connection
+from chatbot.models import Message
+from justitia.search import (
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
+    SNIPPET_WORDS,
+    fts5_query,
+    headline_options,
+    highlight,
+)
+
+POSTGRES_SEARCH_SQL = """
+    SELECT m.message_id, m.session_id, m.role, m.created_at, hits.rank,
+           ts_headline('english', m.text, hits.query, %s) AS snippet
+    FROM (
+        SELECT msg.message_id, query, ts_rank_cd(msg.search_vector, query) AS rank
+        FROM messages msg, websearch_to_tsquery('english', %s) query
+        WHERE msg.search_vector @@ query
+          AND msg.role <> 'system'
+          AND msg.session_id IN (SELECT session_id FROM sessions WHERE user_id = %s)
+        ORDER BY rank DESC
+        LIMIT %s
+    ) hits
+    JOIN messages m ON m.message_id = hits.message_id
+    ORDER BY hits.rank DESC, m.message_id DESC
+"""
+
+SQLITE_SEARCH_SQL = """
+    SELECT m.message_id, m.session_id, m.role, m.created_at,
+           bm25(messages_fts) AS rank,
+           snippet(messages_fts, 0, %s, %s, '...', %s) AS snippet
+    FROM messages_fts
+    JOIN messages m ON m.message_id = messages_fts.rowid
+    JOIN sessions s ON s.session_id = m.session_id
+    WHERE messages_fts MATCH %s
+      AND m.role <> 'system'
+      AND s.user_id = %s
+    ORDER BY rank, m.message_id DESC
+    LIMIT %s
+"""
+
+
+def search_messages(user, query, limit=20):
+    """
+    Search the messages of a user's sessions, best matches first. System messages are never returned.
+    Each result is a Message with extra "rank" and "snippet" attributes; the snippet is safe to render.
+    :param user: User whose sessions are searched
+    :param query: Search text entered by the user
+    :param limit: Maximum number of results
+    :return: list of Message objects
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+
+    if connection.vendor == "postgresql":
+        results = Message.objects.raw(
+            POSTGRES_SEARCH_SQL, [headline_options(), query, user.pk, limit]
+        )
+    else:
+        match = fts5_query(query)
+        if not match:
+            return []
+        results = Message.objects.raw(
+            SQLITE_SEARCH_SQL,
+            [HIGHLIGHT_START, HIGHLIGHT_STOP, SNIPPET_WORDS, match, user.pk, limit],
+        )
+
+    results = list(results)
+    for result in results:
+        result.snippet = highlight(result.snippet)
+    return results
@@ -0,0 +1,118 @@
+"""
+Test cases for the chatbot WebSocket consumer.
+
+Author: Georgios Tsakoumakis
+"""
+
+import json
+import unittest
+from unittest import mock
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, Client
+from chatbot.consumers import CLOSE_FORBIDDEN, ChatConsumer
+from chatbot.models import Session, Message
+
+CustomUser = get_user_model()
+
+
+def fake_stream_reply(session, user_message):
+    """
+    Stand-in for the Gemini model, streaming a fixed response and saving the exchange.
+    """
+    for chunk in ["Hello", ", ", "world"]:
+        yield chunk
+    Message.objects.create(session=session, text=user_message, role=Message.Role.USER)
+    Message.objects.create(session=session, text="Hello, world", role=Message.Role.BOT)
+
+
+class ChatConsumerTestCase(TransactionTestCase):
+    """
+    Test case for the chatbot WebSocket consumer.
+    """
+
+    def setUp(self):
+        """
+        TCC1: Set up a user, a session and a logged in session cookie for use in the tests.
+        """
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            password='Password123!',
+            email='testuser@example.com'
+        )
+        self.session = Session.objects.create(user=self.user)
+        client = Client()
+        client.force_login(self.user)
+        self.cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def communicator(self, cookie=None):
+        headers = [(b"origin", b"http://localhost")]
+        if cookie:
+            headers.append((b"cookie", f"{settings.SESSION_COOKIE_NAME}={cookie}".encode()))
+        scope = {"type": "websocket", "path": "/ws/chatbot/", "headers": headers}
+        return ApplicationCommunicator(ChatConsumer.as_asgi, scope)
+
+    async def test_connect_without_session_cookie(self):
+        """
+        TCC2: Test that anonymous connections are refused.
+        """
+        communicator = self.communicator()
+        await communicator.send_input({"type": "websocket.connect"})
+        response = await communicator.receive_output(timeout=5)
+        self.assertEqual(response, {"type": "websocket.close", "code": CLOSE_FORBIDDEN})
+
+    async def test_message_streams_tokens(self):
+        """
+        TCC3: Test that a message is answered with streamed tokens and saved to the session.
+        """
+        communicator = self.communicator(self.cookie)
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output(timeout=5))["type"], "websocket.accept")
+
+        with mock.patch("chatbot.consumers.stream_reply", fake_stream_reply), \
+                mock.patch("chatbot.consumers.request_title") as request_title:
+            await communicator.send_input({
+                "type": "websocket.receive",
+                "text": json.dumps({"type": "message", "session_id": self.session.session_id, "message": "Hi"}),
+            })
+            frames = []
+            while not frames or frames[-1]["type"] == "token":
+                output = await communicator.receive_output(timeout=5)
+                frames.append(json.loads(output["text"]))
+
+        self.assertEqual("".join(frame["text"] for frame in frames[:-1]), "Hello, world")
+        self.assertEqual(frames[-1], {"type": "done", "session_id": self.session.session_id})
+        count = await sync_to_async(Message.objects.filter(session=self.session).count)()
+        self.assertEqual(count, 2)
+        request_title.assert_called_once()
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(timeout=5)
+
+    async def test_message_to_another_users_session(self):
+        """
+        TCC4: Test that messages to a session owned by another user are rejected.
+        """
+        other_user = await sync_to_async(CustomUser.objects.create_user)(
+            username='otheruser',
+            password='Password123!',
+            email='otheruser@example.com'
+        )
+        other_session = await sync_to_async(Session.objects.create)(user=other_user)
+        communicator = self.communicator(self.cookie)
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output(timeout=5)
+        await communicator.send_input({
+            "type": "websocket.receive",
+            "text": json.dumps({"type": "message", "session_id": other_session.session_id, "message": "Hi"}),
+        })
+        frame = json.loads((await communicator.receive_output(timeout=5))["text"])
+        self.assertEqual(frame["type"], "error")
+        self.assertEqual(frame["error"], "Session not found")
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
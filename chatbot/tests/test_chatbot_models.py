@@ -4,12 +4,20 @@ Test cases for the Chatbot models.
 Author: Ionut-Valeriu Facaeru
 """
 
+import json
 import unittest
+from unittest import mock
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
-from chatbot.models import Session, Message
+from datetime import timedelta
+from django.utils import timezone
+from chatbot.models import ArchivedSession, Session, Message
+from chatbot import archive
+from chatbot.archive import archive_idle_sessions, archive_session, get_session_messages, rehydrate_session
+from chatbot.titles import TitleGenerator, parse_titles, title_sessions
+from chatbot.utils import iter_export
 
 # Get the CustomUser model
 CustomUser = get_user_model()
@@ -213,6 +221,101 @@ class ChatbotModelTests(TestCase):
         expected_str = f'{long_username_user.username}_{session.session_id}'
         self.assertEqual(str(session), expected_str)
 
+    def test_archive_idle_session(self):
+        """
+        TCM22: Test archiving a session that has been idle for longer than the threshold.
+        """
+        session = Session.objects.create(user=self.user)
+        Message.objects.create(session=session, text='Old question', role=Message.Role.USER)
+        Message.objects.create(session=session, text='Old answer', role=Message.Role.BOT)
+        Message.objects.filter(session=session).update(created_at=timezone.now() - timedelta(days=60))
+        active_session = Session.objects.create(user=self.user)
+        Message.objects.create(session=active_session, text='New question', role=Message.Role.USER)
+
+        self.assertEqual(archive_idle_sessions(days=30), (1, 2))
+        self.assertFalse(Message.objects.filter(session=session).exists())
+        self.assertEqual(ArchivedSession.objects.get(session=session).message_count, 2)
+        self.assertFalse(ArchivedSession.objects.filter(session=active_session).exists())
+        messages = get_session_messages(session.session_id)
+        self.assertEqual([message.text for message in messages], ['Old question', 'Old answer'])
+
+    def test_rehydrate_archived_session(self):
+        """
+        TCM23: Test that rehydrating an archived session restores message IDs and creation dates.
+        """
+        session = Session.objects.create(user=self.user)
+        message = Message.objects.create(session=session, text='Old question', role=Message.Role.USER)
+        old_date = timezone.now() - timedelta(days=60)
+        Message.objects.filter(pk=message.pk).update(created_at=old_date)
+        archive_idle_sessions(days=30)
+
+        self.assertEqual(rehydrate_session(session), 1)
+        self.assertFalse(ArchivedSession.objects.filter(session=session).exists())
+        restored = Message.objects.get(session=session)
+        self.assertEqual(restored.message_id, message.message_id)
+        self.assertEqual(restored.created_at, old_date)
+        self.assertEqual(rehydrate_session(session), 0)
+
+    def test_archive_keeps_new_messages(self):
+        """
+        TCM27: Test that a message added while a session is being archived is not deleted with the archived ones,
+        and is read and exported together with them.
+        """
+        session = Session.objects.create(user=self.user)
+        Message.objects.create(session=session, text='Old question', role=Message.Role.USER)
+        compress_messages = archive.compress_messages
+
+        def compress_and_add(messages):
+            Message.objects.create(session=session, text='New question', role=Message.Role.USER)
+            return compress_messages(messages)
+
+        with mock.patch('chatbot.archive.compress_messages', side_effect=compress_and_add):
+            self.assertEqual(archive_session(session), 1)
+        self.assertEqual(ArchivedSession.objects.get(session=session).message_count, 1)
+        self.assertEqual(list(Message.objects.filter(session=session).values_list('text', flat=True)),
+                         ['New question'])
+        self.assertEqual([message.text for message in get_session_messages(session.session_id)],
+                         ['Old question', 'New question'])
+        exported = json.loads(''.join(iter_export(self.user, 'json')))
+        self.assertEqual(len(exported['sessions']), 1)
+        self.assertEqual([message['text'] for message in exported['sessions'][0]['messages']],
+                         ['Old question', 'New question'])
+
+    def test_title_sessions_in_one_batch(self):
+        """
+        TCM24: Test that titles are generated for a batch of sessions with a single request.
+        """
+        sessions = [Session.objects.create(user=self.user) for _ in range(3)]
+        for number, session in enumerate(sessions[:2]):
+            Message.objects.create(session=session, text=f'Question {number}', role=Message.Role.USER)
+            Message.objects.create(session=session, text=f'Answer {number}', role=Message.Role.BOT)
+        requests = []
+
+        def generate(exchanges):
+            requests.append(exchanges)
+            return {index: f'Title {user_text}' for index, (user_text, bot_text) in enumerate(exchanges)}
+
+        self.assertEqual(title_sessions([session.session_id for session in sessions], generate), 2)
+        self.assertEqual(requests, [[('Question 0', 'Answer 0'), ('Question 1', 'Answer 1')]])
+        titles = [Session.objects.get(pk=session.pk).title for session in sessions]
+        self.assertEqual(titles, ['Title Question 0', 'Title Question 1', ''])
+
+    def test_parse_titles(self):
+        """
+        TCM25: Test parsing the titles returned by the model.
+        """
+        text = '1: "Tenant Deposit Dispute"\n2. Parking fine appeal\nSome extra text\n7: Out of range'
+        self.assertEqual(parse_titles(text, 2), {0: 'Tenant Deposit Dispute', 1: 'Parking fine appeal'})
+
+    def test_title_generator_coalesces_jobs(self):
+        """
+        TCM26: Test that sessions queued several times are titled once and batches are size limited.
+        """
+        generator = TitleGenerator(batch_size=2, delay=0)
+        generator.pending.update([3, 1, 3, 2])
+        self.assertEqual(generator.next_batch(), [1, 2])
+        self.assertEqual(generator.next_batch(), [3])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
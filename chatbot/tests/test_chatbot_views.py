@@ -9,6 +9,8 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from chatbot.models import Session, Message
+from chatbot.archive import archive_session
+import gzip
 import json
 
 CustomUser = get_user_model()
@@ -131,6 +133,113 @@ class ChatbotViewsTestCase(TestCase):
         self.assertRedirects(response, reverse('chatbot_session', kwargs={'session_id': new_session.session_id}))
 
 
+    def test_export_sessions_ndjson(self):
+        """
+        TCV11: Test exporting the chat history as NDJSON.
+        """
+        Message.objects.create(session=self.session, text='Hello', role=Message.Role.USER)
+        Message.objects.create(session=self.session, text='Hi there', role=Message.Role.BOT)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('export_sessions'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['text'] for record in records], ['Hello', 'Hi there'])
+        self.assertTrue(all(record['session_id'] == self.session.session_id for record in records))
+
+    def test_export_sessions_json_gzip(self):
+        """
+        TCV12: Test exporting the chat history as gzip compressed JSON.
+        """
+        other_session = Session.objects.create(user=self.user)
+        Message.objects.create(session=self.session, text='First', role=Message.Role.USER)
+        Message.objects.create(session=other_session, text='Second', role=Message.Role.USER)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('export_sessions'), {'format': 'json', 'gzip': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(len(data['sessions']), 2)
+        self.assertEqual(data['sessions'][1]['messages'][0]['text'], 'Second')
+
+    def test_export_another_users_sessions(self):
+        """
+        TCV13: Test that a non-staff user cannot export another user's chat history.
+        """
+        get_user_model().objects.create_user(
+            username='otheruser',
+            password='Password123!',
+            email='otheruser@example.com'
+        )
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('export_sessions'), {'user': 'otheruser'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_sessions_with_invalid_format(self):
+        """
+        TCV14: Test exporting the chat history with an invalid format.
+        """
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('export_sessions'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_sessions(self):
+        """
+        TCV15: Test searching the messages of the user's sessions.
+        """
+        message = Message.objects.create(session=self.session, text='What are my tenant rights?', role=Message.Role.USER)
+        Message.objects.create(session=self.session, text='Something unrelated', role=Message.Role.USER)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('search_sessions'), {'q': 'tenant'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'chatbot_search.html')
+        results = response.context['results']
+        self.assertEqual([result.message_id for result in results], [message.message_id])
+        self.assertIn('<mark>tenant</mark>', results[0].snippet)
+        self.assertContains(response, '#message-%d' % message.message_id)
+
+    def test_search_sessions_excludes_other_users(self):
+        """
+        TCV16: Test that searching does not return messages from another user's sessions.
+        """
+        other_user = get_user_model().objects.create_user(
+            username='otheruser',
+            password='Password123!',
+            email='otheruser@example.com'
+        )
+        other_session = Session.objects.create(user=other_user)
+        Message.objects.create(session=other_session, text='Private <b>tenant</b> question', role=Message.Role.USER)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('search_sessions'), {'q': 'tenant'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['results']), [])
+
+    def test_access_archived_chatbot_session(self):
+        """
+        TCV17: Test that an archived session is displayed from cold storage and survives creating a new session.
+        """
+        Message.objects.create(session=self.session, text='Archived question', role=Message.Role.USER)
+        archive_session(self.session)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('chatbot_session', kwargs={'session_id': self.session.session_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Archived question')
+        self.client.post(reverse('create_session'))
+        self.assertTrue(Session.objects.filter(session_id=self.session.session_id).exists())
+
+    def test_chatbot_session_shows_titles(self):
+        """
+        TCV18: Test that generated session titles are shown in the sidebar.
+        """
+        self.session.title = 'Tenant deposit dispute'
+        self.session.save()
+        untitled_session = Session.objects.create(user=self.user)
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('chatbot_session', kwargs={'session_id': untitled_session.session_id}))
+        self.assertContains(response, 'Tenant deposit dispute')
+        self.assertContains(response, 'Session 2')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,217 @@
+"""
+Background generation of chat session titles.
+
+After the first exchange of a session its ID is queued. A low priority worker thread waits for jobs to
+accumulate, merges duplicates, and titles a whole batch of sessions with a single model call. It never runs
+while an interactive chat request is being answered, so it does not compete with users for model quota.
+Sessions missed by the worker (for example after a restart) are picked up by the generate_session_titles command.
+
+Author: Georgios Tsakoumakis
+"""
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from django.db import close_old_connections
+from chatbot.llm import get_model
+from chatbot.models import Message, Session
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_LENGTH = 100
+# Characters of each message included in the title prompt
+EXCERPT_LENGTH = 500
+
+TITLE_PROMPT = """
+Write a short title of at most six words for each of the following conversations with a legal assistant.
+Answer with exactly one line per conversation in the format "<number>: <title>" and nothing else.
+"""
+
+TITLE_LINE = re.compile(r"^\s*(\d+)\s*[:.)-]\s*(.+?)\s*$")
+
+
+def first_exchanges(session_ids):
+    """
+    Get the first user message and chatbot response of each session.
+    :param session_ids: Iterable of session IDs
+    :return: dict mapping session ID to a (user text, bot text) tuple, sessions without a response are left out
+    """
+    exchanges = {}
+    messages = (
+        Message.objects.filter(
+            session_id__in=session_ids,
+            role__in=[Message.Role.USER, Message.Role.BOT],
+        )
+        .order_by("session_id", "created_at")
+        .values_list("session_id", "role", "text")
+    )
+    for session_id, role, text in messages:
+        user_text, bot_text = exchanges.get(session_id, (None, None))
+        if role == Message.Role.USER and user_text is None:
+            user_text = text
+        elif role == Message.Role.BOT and bot_text is None and user_text is not None:
+            bot_text = text
+        exchanges[session_id] = (user_text, bot_text)
+    return {
+        session_id: exchange
+        for session_id, exchange in exchanges.items()
+        if exchange[1] is not None
+    }
+
+
+def generate_titles(exchanges):
+    """
+    Ask the model for a title for each exchange, using one request for the whole batch.
+    :param exchanges: list of (user text, bot text) tuples
+    :return: dict mapping the index of each exchange to its title
+    """
+    prompt = [TITLE_PROMPT]
+    for number, (user_text, bot_text) in enumerate(exchanges, start=1):
+        prompt.append(
+            f"{number}.\nUser: {user_text[:EXCERPT_LENGTH]}\nAssistant: {bot_text[:EXCERPT_LENGTH]}\n"
+        )
+    response = get_model().generate_content("\n".join(prompt))
+    return parse_titles(response.text, len(exchanges))
+
+
+def parse_titles(text, count):
+    """
+    Parse the "<number>: <title>" lines returned by the model.
+    :param text: Model response
+    :param count: Number of exchanges in the request
+    :return: dict mapping the index of each exchange to its title
+    """
+    titles = {}
+    for line in text.splitlines():
+        match = TITLE_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count:
+            title = match.group(2).strip("\"'*` ")
+            if title:
+                titles[int(match.group(1)) - 1] = title[:TITLE_MAX_LENGTH]
+    return titles
+
+
+def title_sessions(session_ids, generate=generate_titles):
+    """
+    Generate and store titles for the given sessions that do not have one yet.
+    :param session_ids: Iterable of session IDs
+    :param generate: Callable turning a list of exchanges into a dict of titles
+    :return: int - number of titled sessions
+    """
+    untitled = Session.objects.filter(session_id__in=list(session_ids), title="")
+    exchanges = first_exchanges(untitled.values_list("session_id", flat=True))
+    if not exchanges:
+        return 0
+    ordered_ids = sorted(exchanges)
+    titles = generate([exchanges[session_id] for session_id in ordered_ids])
+    sessions = [
+        Session(session_id=ordered_ids[index], title=title)
+        for index, title in titles.items()
+    ]
+    Session.objects.bulk_update(sessions, ["title"])
+    return len(sessions)
+
+
+def untitled_session_ids():
+    """
+    Get the IDs of sessions that have a chatbot response but no title.
+    :return: QuerySet of session IDs
+    """
+    return (
+        Session.objects.filter(title="", message__role=Message.Role.BOT)
+        .distinct()
+        .order_by("session_id")
+        .values_list("session_id", flat=True)
+    )
+
+
+class TitleGenerator:
+    """
+    Queue of sessions waiting for a title, processed by a single daemon thread.
+    """
+
+    def __init__(self, batch_size=10, delay=30, generate=generate_titles):
+        """
+        :param batch_size: Maximum number of sessions titled per model request
+        :param delay: Seconds to wait for more jobs before processing a batch
+        :param generate: Callable turning a list of exchanges into a dict of titles
+        """
+        self.batch_size = batch_size
+        self.delay = delay
+        self.generate = generate
+        self.pending = set()
+        self.active_chats = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def enqueue(self, session_id):
+        """
+        Queue a session for titling. Queuing the same session twice results in a single job.
+        :param session_id: Session ID
+        """
+        with self.condition:
+            self.pending.add(session_id)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="session-titles", daemon=True
+                )
+                self.thread.start()
+            self.condition.notify_all()
+
+    @contextmanager
+    def interactive(self):
+        """
+        Context manager marking an interactive chat request, during which no titles are generated.
+        """
+        with self.condition:
+            self.active_chats += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active_chats -= 1
+                self.condition.notify_all()
+
+    def next_batch(self):
+        """
+        Wait until there are jobs and no interactive chat is running, then take the next batch.
+        :return: list of session IDs
+        """
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+        # Let jobs that arrive close together be merged into the same batch
+        time.sleep(self.delay)
+        with self.condition:
+            while self.active_chats:
+                self.condition.wait()
+            batch = sorted(self.pending)[: self.batch_size]
+            self.pending.difference_update(batch)
+        return batch
+
+    def run(self):
+        """
+        Worker loop processing batches until the process exits.
+        """
+        while True:
+            batch = self.next_batch()
+            try:
+                title_sessions(batch, self.generate)
+            except Exception:
+                logger.exception("Failed to generate titles for sessions %s", batch)
+            finally:
+                close_old_connections()
+
+
+title_generator = TitleGenerator()
+
+
+def request_title(session):
+    """
+    Queue a session for titling if it does not have a title yet.
+    :param session: Session object
+    """
+    if not session.title:
+        title_generator.enqueue(session.session_id)
@@ -12,4 +12,6 @@ urlpatterns = [
     path("process/", views.process_chat_message, name="process_chat_message"),
     path("<int:session_id>/", views.chatbot_session, name="chatbot_session"),
     path("create_session/", views.create_session, name="create_session"),
+    path("export/", views.export_sessions, name="export_sessions"),
+    path("search/", views.search_sessions, name="search_sessions"),
 ]
@@ -0,0 +1,151 @@
+"""
+Utility functions for the chatbot app.
+
+Author: Georgios Tsakoumakis
+"""
+
+import json
+import zlib
+from heapq import merge
+from chatbot.archive import decompress_messages
+from chatbot.models import ArchivedSession, Message
+
+# Number of rows fetched per round trip when streaming exports
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ("ndjson", "json")
+
+
+def export_messages(user, session_id=None):
+    """
+    Build the queryset used to export a user's chat history. Rows are returned as dictionaries so that
+    no model instances are built while streaming.
+    :param user: User whose sessions are exported
+    :param session_id: Optional session ID to restrict the export to a single session
+    :return: QuerySet of message dictionaries ordered by session and creation date
+    """
+    messages = Message.objects.filter(session__user=user)
+    if session_id is not None:
+        messages = messages.filter(session_id=session_id)
+    return messages.order_by("session_id", "created_at", "message_id").values(
+        "session_id",
+        "session__created_at",
+        "message_id",
+        "role",
+        "text",
+        "created_at",
+    )
+
+
+def archived_export_rows(user, session_id=None):
+    """
+    Yield export rows for the user's archived sessions, decompressing one session at a time.
+    :param user: User whose sessions are exported
+    :param session_id: Optional session ID to restrict the export to a single session
+    :return: Generator of message dictionaries ordered by session and creation date
+    """
+    archives = ArchivedSession.objects.filter(session__user=user).select_related("session")
+    if session_id is not None:
+        archives = archives.filter(session_id=session_id)
+    for archive in archives.order_by("session_id").iterator(chunk_size=1):
+        for message in decompress_messages(archive):
+            yield {
+                "session_id": archive.session_id,
+                "session__created_at": archive.session.created_at,
+                "message_id": message.message_id,
+                "role": message.role,
+                "text": message.text,
+                "created_at": message.created_at,
+            }
+
+
+def _message_record(row):
+    """
+    Convert an exported message row into a JSON serialisable dictionary.
+    :param row: Message row from export_messages
+    :return: dict
+    """
+    return {
+        "message_id": row["message_id"],
+        "role": row["role"],
+        "text": row["text"],
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+def iter_ndjson(rows):
+    """
+    Serialise exported message rows as newline delimited JSON, one message per line.
+    :param rows: Iterable of message rows
+    :return: Generator of str chunks
+    """
+    for row in rows:
+        record = {"session_id": row["session_id"]}
+        record.update(_message_record(row))
+        yield json.dumps(record) + "\n"
+
+
+def iter_json(rows):
+    """
+    Serialise exported message rows as a single JSON document grouped by session.
+    Only the current row is held in memory, so the output can be arbitrarily large.
+    :param rows: Iterable of message rows, with the rows of each session next to each other
+    :return: Generator of str chunks
+    """
+    yield '{"sessions": ['
+    current_session = None
+    for row in rows:
+        if row["session_id"] != current_session:
+            # Close the previous session before opening the next one
+            if current_session is not None:
+                yield "]},"
+            current_session = row["session_id"]
+            yield '{"session_id": %d, "created_at": %s, "messages": [' % (
+                current_session,
+                json.dumps(row["session__created_at"].isoformat()),
+            )
+        else:
+            yield ","
+        yield json.dumps(_message_record(row))
+    if current_session is not None:
+        yield "]}"
+    yield "]}\n"
+
+
+def iter_export(user, export_format="ndjson", session_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a user's chat history in the requested format using a server-side cursor.
+    :param user: User whose sessions are exported
+    :param export_format: Either "ndjson" or "json"
+    :param session_id: Optional session ID to restrict the export to a single session
+    :param chunk_size: Number of rows fetched from the database per round trip
+    :raises ValueError: If the export format is not supported
+    :return: Generator of str chunks
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    # Both sources are ordered by session and creation date, merging them keeps the rows of a session together
+    # when some of its messages were added while it was being archived
+    rows = merge(
+        export_messages(user, session_id).iterator(chunk_size=chunk_size),
+        archived_export_rows(user, session_id),
+        key=lambda row: (row["session_id"], row["created_at"], row["message_id"]),
+    )
+    if export_format == "json":
+        return iter_json(rows)
+    return iter_ndjson(rows)
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress a stream of str chunks into gzip bytes on the fly.
+    :param chunks: Iterable of str chunks
+    :param level: zlib compression level
+    :return: Generator of bytes
+    """
+    # wbits=31 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -5,16 +5,19 @@ The views include the chatbot home page, chatbot session page, and the chatbot m
 Author: Georgios Tsakoumakis
 """
 
-import os
-from django.shortcuts import render, redirect
-from chatbot.models import Session, Message
-from django.http import JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404
+from chatbot.models import ArchivedSession, Session, Message
+from chatbot.archive import get_session_messages, rehydrate_session
+from chatbot.llm import save_exchange, start_chat
+from chatbot.search import search_messages
+from chatbot.titles import request_title, title_generator
+from chatbot.utils import EXPORT_FORMATS, iter_export, gzip_stream
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 import json
-from vertexai.generative_models import Content, GenerativeModel, Part
-import vertexai
 from users.decorators import ban_forbidden
+from users.models import CustomUser
 
 
 @login_required
@@ -28,13 +31,16 @@ def chatbot_session(request, session_id):
     """
     # Check if the user is authenticated
     if request.user.is_authenticated:
-        # Retrieve session IDs associated with the logged-in user
-        session_ids = Session.objects.filter(user_id=request.user.id).values_list(
-            "session_id", flat=True
+        # Retrieve the sessions associated with the logged-in user, with their titles for the sidebar
+        user_sessions = list(
+            Session.objects.filter(user_id=request.user.id)
+            .order_by("session_id")
+            .values("session_id", "title")
         )
+        session_ids = [session["session_id"] for session in user_sessions]
 
         # Store session IDs in the session object
-        request.session["session_ids"] = list(session_ids)
+        request.session["session_ids"] = session_ids
 
         # Check if the session ID belongs to the list of session IDs in the session object
         if session_id not in request.session.get("session_ids", []):
@@ -45,15 +51,15 @@ def chatbot_session(request, session_id):
         # Redirect to chatbot home page without storing history in session
         return redirect("chatbot_home")
 
-    # Retrieve the messages associated with the session
-    messages = Message.objects.filter(session_id=session_id).order_by("created_at")
+    # Retrieve the messages associated with the session, decompressing them if the session is archived
+    messages = get_session_messages(session_id)
     # Render the chatbot interface for the session
     return render(
         request,
         "chatbot_session.html",
         {
             "chat_messages": messages,
-            "user_sessions": session_ids,
+            "user_sessions": user_sessions,
             "current_session": session_id,
         },
     )
@@ -108,85 +114,27 @@ def process_chat_message(request):
         data = json.loads(request.body)
         user_message = data.get("message")
 
-        # Process the user's message and generate a response from the chatbot
-        system_message = """
-        Your name is Cyber Justitia.
-        You are a helpful legal assistant who helps people with their legal problems.
-        You are an expert in UK law and Newcastle-upon-Tyne bylaws.
-        IMPORTANT: Do NOT say that you cannot provide legal advice. Instead, say that as a helpful legal assistant,
-        you can provide general information and guidance on legal matters, but not official legal advice.
-        If you don't know the answer, just say that you don't know.
-        """
-
-        # Initialize the chatbot model
-        PROJECT_ID = os.getenv("PROJECT_ID")
-        LOCATION = os.getenv("LOCATION")
-
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        model = GenerativeModel("gemini-1.0-pro")
-
-        chat = model.start_chat(
-            history=[
-                Content(
-                    role="user",
-                    parts=[Part.from_text(system_message)],
-                ),
-                Content(
-                    role="model",
-                    parts=[
-                        Part.from_text(
-                            """
-                        I am Cyber Justitia, a helpful legal assistant. 
-                        I am an expert in UK law and Newcastle-upon-Tyne bylaws.
-                        I can provide general information and guidance on legal matters, but not official legal advice.
-                        """
-                        )
-                    ],
-                ),
-            ]
-        )
-
+        session = None
+        messages = []
         # Add past messages to chat history
         if request.user.is_authenticated:
             # Retrieve the session ID
             session_id = data.get("session_id")
             # Retrieve the session object from the database
             session = Session.objects.get(session_id=session_id)
+            # Move archived sessions back into the messages table before continuing the chat
+            rehydrate_session(session)
             # Obtain messages from the session
             messages = Message.objects.filter(session=session).order_by("created_at")
 
-            if messages:
-                for message in messages:
-                    content = None
-                    if message.role == Message.Role.USER:
-                        content = Content(
-                            role="user", parts=[Part.from_text(message.text)]
-                        )
-                    elif message.role == Message.Role.BOT:
-                        content = Content(
-                            role="model", parts=[Part.from_text(message.text)]
-                        )
-
-                    if content:
-                        chat.history.append(content)
-
-        # Generate a response from the chatbot
-        chatbot_response = chat.send_message(user_message).text
+        # Process the user's message and generate a response from the chatbot
+        with title_generator.interactive():
+            chat = start_chat(messages)
+            chatbot_response = chat.send_message(user_message).text
         # Don't save to session for anonymous users
-        if request.user.is_authenticated:
-            # Save the system message in the database if it doesn't exist
-            if not Message.objects.filter(session=session, role=Message.Role.SYSTEM):
-                Message.objects.create(
-                    session=session, text=system_message, role=Message.Role.SYSTEM
-                )
-            # Save the user's message in the database
-            Message.objects.create(
-                session=session, text=user_message, role=Message.Role.USER
-            )
-            # Save the chatbot's response in the database
-            Message.objects.create(
-                session=session, text=chatbot_response, role=Message.Role.BOT
-            )
+        if session is not None:
+            save_exchange(session, user_message, chatbot_response)
+            request_title(session)
 
         # Return the chatbot response in JSON format
         return JsonResponse({"response": chatbot_response})
@@ -210,9 +158,11 @@ def create_session(request):
             "session_id", flat=True
         )
 
-        # Delete sessions that have no messages
+        # Delete sessions that have no messages, archived sessions keep their messages in cold storage
         for session in session_ids:
-            if not Message.objects.filter(session_id=session):
+            if not Message.objects.filter(session_id=session) and not ArchivedSession.objects.filter(
+                session_id=session
+            ).exists():
                 Session.objects.filter(session_id=session).delete()
                 # Delete session from session_ids queryset
                 session_ids = session_ids.exclude(session_id=session)
@@ -225,3 +175,61 @@ def create_session(request):
 
     # Return an error response if the user is not authenticated
     return JsonResponse({"error": "User is not authenticated"}, status=403)
+
+
+@login_required
+@ban_forbidden(redirect_url="/banned/")
+def export_sessions(request):
+    """
+    This view streams the chat history of the logged-in user as NDJSON or JSON.
+    Staff members can export the history of another user with the "user" parameter.
+    The response is built row by row, so memory use does not depend on the size of the history.
+    :param request: Request object
+    :return: Streaming response with the exported chat history
+    """
+    export_format = request.GET.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": "Invalid export format"}, status=400)
+
+    user = request.user
+    username = request.GET.get("user")
+    if username and username != user.username:
+        if not user.is_staff:
+            return JsonResponse({"error": "Forbidden"}, status=403)
+        user = get_object_or_404(CustomUser, username=username)
+
+    session_id = request.GET.get("session_id")
+    if session_id is not None:
+        if not session_id.isdigit():
+            return JsonResponse({"error": "Invalid session ID"}, status=400)
+        session_id = int(session_id)
+
+    chunks = iter_export(user, export_format, session_id=session_id)
+    filename = f"{user.username}_sessions.{export_format}"
+    content_type = "application/x-ndjson" if export_format == "ndjson" else "application/json"
+    if request.GET.get("gzip") in ("1", "true"):
+        chunks = gzip_stream(chunks)
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@ban_forbidden(redirect_url="/banned/")
+def search_sessions(request):
+    """
+    This view searches the messages of the logged-in user's sessions and lists the best matches.
+    Each result links to the position of the message inside its session.
+    :param request: Request object
+    :return: Rendered search results page
+    """
+    query = request.GET.get("q", "").strip()
+    results = search_messages(request.user, query) if query else []
+    return render(
+        request,
+        "chatbot_search.html",
+        {"query": query, "results": results},
+    )
@@ -10,3 +10,7 @@ from django.apps import AppConfig
 class ForumConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "forum"
+
+    def ready(self):
+        # Connect the signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,261 @@
+"""
+Autocompletion of post titles.
+
+The titles of visible posts are kept in an in-memory prefix trie, built on first use. Every word of a title is
+indexed, so "dep" suggests "Tenancy deposit". Each node only keeps the IDs of the NODE_POSTS newest posts with a
+word starting with its prefix, so memory stays bounded and a suggestion reads a short list. Posts created, edited
+or deleted in this process update the trie through the signal handlers in forum/signals.py. Posts created by
+other processes are added incrementally when the search version, kept in the shared cache, changes. The whole
+trie is rebuilt periodically in a background thread, to drop posts deleted or renamed elsewhere and to refill
+nodes whose newest posts were removed. Requests keep using the current trie meanwhile, and the changes made to it
+during the rebuild are applied again to the new trie before it replaces the current one.
+
+Author: Georgios Tsakoumakis
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from django.db import connection
+from .models import Post
+from .search import normalise_query, search_version
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which the trie is rebuilt from the database
+REBUILD_INTERVAL = 900
+MIN_PREFIX_LENGTH = 2
+# Number of newest posts kept by each node
+NODE_POSTS = 100
+
+
+class TrieNode:
+    """
+    Node of the prefix trie, holding the IDs of the newest posts with a title word starting with the node's
+    prefix, in ascending order.
+    """
+    __slots__ = ("children", "post_ids")
+
+    def __init__(self):
+        self.children = {}
+        self.post_ids = []
+
+
+class TitleTrie:
+    """
+    Prefix trie over the words of post titles.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        # Title and slug of every indexed post
+        self.posts = {}
+        # Posts containing each complete word, used for the words before the one being typed
+        self.words = {}
+        self.max_post_id = 0
+        self.version = None
+        self.built_at = None
+        # Changes made while the trie is rebuilt, applied again to the new trie, or None
+        self.changes = None
+        self.lock = threading.Lock()
+        # Held while the trie is rebuilt, so that concurrent requests do not all rebuild it
+        self.rebuild_lock = threading.Lock()
+
+    @staticmethod
+    def split(title):
+        return set(normalise_query(title).split())
+
+    def add(self, post_id, title, slug):
+        """
+        Index the title of a post, replacing its previous title if it was edited
+        :param post_id: ID of the post
+        :param title: Title of the post
+        :param slug: Slug of the post, used to link suggestions
+        """
+        with self.lock:
+            if self.changes is not None:
+                self.changes.append((post_id, title, slug))
+            self._add(post_id, title, slug)
+
+    def _add(self, post_id, title, slug):
+        """
+        Index the title of a post, the caller holding the lock
+        :param post_id: ID of the post
+        :param title: Title of the post
+        :param slug: Slug of the post
+        """
+        if self.posts.get(post_id) == (title, slug):
+            return
+        self._remove(post_id)
+        self.posts[post_id] = (title, slug)
+        self.max_post_id = max(self.max_post_id, post_id)
+        visited = set()
+        for word in self.split(title):
+            self.words.setdefault(word, set()).add(post_id)
+            node = self.root
+            for character in word:
+                node = node.children.setdefault(character, TrieNode())
+                # Words sharing a prefix reach the same nodes
+                if id(node) in visited:
+                    continue
+                visited.add(id(node))
+                if len(node.post_ids) >= NODE_POSTS and post_id < node.post_ids[0]:
+                    continue
+                insort(node.post_ids, post_id)
+                if len(node.post_ids) > NODE_POSTS:
+                    del node.post_ids[0]
+
+    def remove(self, post_id):
+        """
+        Remove a post from the trie, pruning nodes left without posts
+        :param post_id: ID of the post
+        """
+        with self.lock:
+            if self.changes is not None:
+                self.changes.append((post_id, None, None))
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        """
+        Remove a post from the trie, the caller holding the lock
+        :param post_id: ID of the post
+        """
+        entry = self.posts.pop(post_id, None)
+        if entry is None:
+            return
+        prefixes = set()
+        for word in self.split(entry[0]):
+            self.words[word].discard(post_id)
+            if not self.words[word]:
+                del self.words[word]
+            prefixes.update(word[:length] for length in range(1, len(word) + 1))
+        # Longest prefixes first, so children are pruned before their parents are checked
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            parent = self.root
+            for character in prefix[:-1]:
+                parent = parent.children[character]
+            node = parent.children[prefix[-1]]
+            index = bisect_left(node.post_ids, post_id)
+            if index < len(node.post_ids) and node.post_ids[index] == post_id:
+                del node.post_ids[index]
+            # A node emptied while older posts below it were dropped keeps its children until the next rebuild
+            if not node.post_ids and not node.children:
+                del parent.children[prefix[-1]]
+
+    def suggest(self, text, limit=8):
+        """
+        Suggest titles for partially typed text. Earlier words must match title words exactly, the last word
+        is completed. The newest posts are suggested first, among the NODE_POSTS newest completing the last word.
+        :param text: Text typed by the user
+        :param limit: Maximum number of suggestions
+        :return: list of (post_id, title, slug) tuples
+        """
+        words = normalise_query(text).split()
+        if not words or len(words[-1]) < MIN_PREFIX_LENGTH:
+            return []
+        with self.lock:
+            node = self.root
+            for character in words[-1]:
+                node = node.children.get(character)
+                if node is None:
+                    return []
+            earlier = [self.words.get(word, set()) for word in words[:-1]]
+            suggestions = []
+            for post_id in reversed(node.post_ids):
+                if all(post_id in posts for posts in earlier):
+                    suggestions.append((post_id, *self.posts[post_id]))
+                    if len(suggestions) == limit:
+                        break
+            return suggestions
+
+    def sync(self):
+        """
+        Bring the trie up to date: build it on first use, otherwise add the posts created since the last sync
+        if the search version has changed. Rebuilding an old trie is left to rebuild_if_due().
+        """
+        version = search_version()
+        if not self.is_built:
+            # Requests arriving during the first build wait for it instead of building the trie again
+            with self.rebuild_lock:
+                if not self.is_built:
+                    self.rebuild(version)
+        elif version != self.version:
+            posts = Post.objects.visible().filter(post_id__gt=self.max_post_id)
+            for post_id, title, slug in posts.values_list("post_id", "title", "slug").iterator():
+                self.add(post_id, title, slug)
+            self.version = version
+
+    def rebuild(self, version=None):
+        """
+        Rebuild the trie from every visible post. Posts added or removed meanwhile are added or removed again in
+        the new trie before it replaces the current one.
+        :param version: Search version the rebuild corresponds to
+        """
+        with self.lock:
+            self.changes = []
+        trie = TitleTrie()
+        try:
+            posts = Post.objects.visible().values_list("post_id", "title", "slug")
+            for post_id, title, slug in posts.iterator(chunk_size=2000):
+                trie._add(post_id, title, slug)
+        except Exception:
+            with self.lock:
+                self.changes = None
+            raise
+        with self.lock:
+            for post_id, title, slug in self.changes:
+                if title is None:
+                    trie._remove(post_id)
+                else:
+                    trie._add(post_id, title, slug)
+            self.changes = None
+            self.root, self.posts, self.words = trie.root, trie.posts, trie.words
+            self.max_post_id = trie.max_post_id
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def rebuild_if_due(self):
+        """
+        Start rebuilding the trie in a background thread if it is older than REBUILD_INTERVAL, unless it is
+        already being rebuilt
+        :return: Thread rebuilding the trie, or None
+        """
+        if not self.is_built or time.monotonic() - self.built_at <= REBUILD_INTERVAL:
+            return None
+        if not self.rebuild_lock.acquire(blocking=False):
+            return None
+        thread = threading.Thread(target=self._rebuild_in_background, name="title-trie-rebuild", daemon=True)
+        thread.start()
+        return thread
+
+    def _rebuild_in_background(self):
+        """
+        Rebuild the trie in the thread started by rebuild_if_due(), which holds the rebuild lock
+        """
+        try:
+            self.rebuild(search_version())
+        except Exception:
+            logger.exception("Failed to rebuild the title trie")
+        finally:
+            # The thread's own database connection
+            connection.close()
+            self.rebuild_lock.release()
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+
+title_trie = TitleTrie()
+
+
+def suggest_titles(text, limit=8):
+    """
+    Suggest post titles for partially typed search text
+    :param text: Text typed by the user
+    :param limit: Maximum number of suggestions
+    :return: list of (post_id, title, slug) tuples
+    """
+    title_trie.sync()
+    return title_trie.suggest(text, limit)
@@ -0,0 +1,140 @@
+"""
+Conditional GET for forum pages and the RSS feed.
+
+Pages carry an ETag and a Last-Modified header derived from the time of the last change to what they show, so a
+client revalidating its copy with If-None-Match or If-Modified-Since gets a 304 Not Modified after one small
+query, without the page's own queries or rendering. These functions are used with Django's condition decorator.
+
+The forum-wide marker is the latest updated_at of the posts, read from its index. A post's updated_at changes
+when the post is saved or voted on and when a comment is added to it or deleted, so the marker covers everything
+shown by the listings and the feed. A post page also shows its comments, whose own updated_at changes when they
+are saved or voted on. Pages depend on the viewer as well (login links, delete buttons), so their ETag includes
+the user. View counts are not part of the validators: they are kept outside the posts table, and a client
+revalidating a page was already counted when it fetched it.
+
+Author: Georgios Tsakoumakis
+"""
+
+import hashlib
+from django.db.models import Max, OuterRef, Subquery
+from .models import Post, Comment
+from .rankings import WINDOWED_SORTS, WINDOWS
+
+
+def make_etag(changed_at, viewer=""):
+    """
+    Build an ETag from the time of the last change to a page
+    :param changed_at: Date and time of the last change, or None
+    :param viewer: Identifies the user the page was rendered for, empty for pages shown to everyone
+    :return: str, or None if changed_at is None
+    """
+    if changed_at is None:
+        return None
+    return hashlib.md5(f"{viewer}|{changed_at.isoformat()}".encode("utf-8")).hexdigest()
+
+
+def viewer(request):
+    """
+    Identify the user a page is rendered for
+    :param request: Request object
+    :return: str
+    """
+    return f"user:{request.user.pk}" if request.user.is_authenticated else "anonymous"
+
+
+def is_windowed(request):
+    """
+    Whether a listing is limited to recent posts with ?t=. Its posts change as time passes, so it cannot be
+    validated by the time of the last change.
+    :param request: Request object
+    :return: bool
+    """
+    return request.GET.get("sort") in WINDOWED_SORTS and WINDOWS.get(request.GET.get("t")) is not None
+
+
+def forum_changed_at(request):
+    """
+    Get the time of the last change to any post, read once per request
+    :param request: Request object
+    :return: datetime, or None if there are no posts
+    """
+    if not hasattr(request, "forum_changed_at"):
+        request.forum_changed_at = Post.objects.aggregate(changed_at=Max("updated_at"))["changed_at"]
+    return request.forum_changed_at
+
+
+def post_changed_at(request, slug):
+    """
+    Get the time of the last change to a post or its comments, read once per request with one query
+    :param request: Request object
+    :param slug: Slug of the post
+    :return: datetime, or None if the post does not exist
+    """
+    if not hasattr(request, "post_changed_at"):
+        latest_comment = (
+            Comment.objects.filter(post=OuterRef("pk")).order_by("-updated_at").values("updated_at")[:1]
+        )
+        row = (
+            Post.objects.filter(slug=slug)
+            .annotate(comments_changed_at=Subquery(latest_comment))
+            .values("updated_at", "comments_changed_at")
+            .first()
+        )
+        request.post_changed_at = row and max(filter(None, row.values()))
+    return request.post_changed_at
+
+
+def listing_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified of the forum listing
+    :param request: Request object
+    :return: datetime or None
+    """
+    return None if is_windowed(request) else forum_changed_at(request)
+
+
+def listing_etag(request, *args, **kwargs):
+    """
+    ETag of the forum listing
+    :param request: Request object
+    :return: str or None
+    """
+    return None if is_windowed(request) else make_etag(forum_changed_at(request), viewer(request))
+
+
+def post_last_modified(request, slug, *args, **kwargs):
+    """
+    Last-Modified of a post page and of its comment fragments
+    :param request: Request object
+    :param slug: Slug of the post
+    :return: datetime or None
+    """
+    return post_changed_at(request, slug)
+
+
+def post_etag(request, slug, *args, **kwargs):
+    """
+    ETag of a post page and of its comment fragments
+    :param request: Request object
+    :param slug: Slug of the post
+    :return: str or None
+    """
+    return make_etag(post_changed_at(request, slug), viewer(request))
+
+
+def feed_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified of the RSS feed
+    :param request: Request object
+    :return: datetime or None
+    """
+    return forum_changed_at(request)
+
+
+def feed_etag(request, *args, **kwargs):
+    """
+    ETag of the RSS feed, the same for every reader
+    :param request: Request object
+    :return: str or None
+    """
+    return make_etag(forum_changed_at(request))
@@ -0,0 +1,154 @@
+"""
+Near-duplicate detection of new posts with MinHash and locality sensitive hashing.
+
+A post is reduced to its set of shingles: every run of SHINGLE_SIZE consecutive words of its title and text. The
+Jaccard similarity of two posts, the share of shingles they have in common, is estimated from their MinHash
+signatures: the minimum of each of PERMUTATIONS random hash functions over the shingles, two posts agreeing on a
+minimum with probability equal to their similarity. Signatures are stored as PERMUTATIONS 32 bit integers.
+
+Comparing a new post with every signature would scan the table, so signatures are split into BANDS bands of
+ROWS values, each band hashed to an indexed key. Posts sharing at least one band key are candidates, found with
+one query on the key index and compared by their full signatures, those sharing the most band keys first. With 16 bands of 4 rows, posts with a
+similarity of 0.7 are candidates 99% of the time, posts with a similarity of 0.3 only 12% of the time.
+
+Signatures of new and edited posts are stored by the post_saved signal handler and removed when posts are
+deleted. The index_signatures command stores the signatures of existing posts.
+
+Author: Georgios Tsakoumakis
+"""
+
+import hashlib
+import re
+import zlib
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.utils.html import strip_tags
+from .models import PostBand, PostSignature
+
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS = 4
+PERMUTATIONS = BANDS * ROWS
+# Lowest estimated Jaccard similarity for a post to be reported as a near-duplicate
+DUPLICATE_THRESHOLD = 0.6
+# Most candidates compared with a new post
+MAX_CANDIDATES = 50
+MAX_DUPLICATES = 3
+# Hash functions (a * x + b) mod PRIME, the same in every process
+PRIME = (1 << 31) - 1
+_generator = np.random.default_rng(20240601)
+HASH_A = _generator.integers(1, PRIME, size=PERMUTATIONS, dtype=np.uint64)
+HASH_B = _generator.integers(0, PRIME, size=PERMUTATIONS, dtype=np.uint64)
+WORD = re.compile(r"\w+")
+
+
+def shingles(title, text):
+    """
+    Get the shingles of a post
+    :param title: Title of the post
+    :param text: Text of the post, which may contain HTML
+    :return: set of str
+    """
+    words = WORD.findall(f"{title} {strip_tags(text)}".lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[index:index + SHINGLE_SIZE]) for index in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(title, text):
+    """
+    Compute the MinHash signature of a post
+    :param title: Title of the post
+    :param text: Text of the post
+    :return: numpy array of PERMUTATIONS uint32 values
+    """
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) % PRIME for shingle in shingles(title, text)), dtype=np.uint64
+    )
+    return ((HASH_A[:, None] * hashes[None, :] + HASH_B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    """
+    Hash each band of a signature to a key, the band's number included so that bands only match their own kind
+    :param signature: MinHash signature
+    :return: list of BANDS signed 64 bit integers
+    """
+    return [
+        int.from_bytes(
+            hashlib.blake2b(bytes([band]) + values.astype("<u4").tobytes(), digest_size=8).digest(),
+            "little",
+            signed=True,
+        )
+        for band, values in enumerate(signature.reshape(BANDS, ROWS))
+    ]
+
+
+def encode(signature):
+    """
+    :param signature: MinHash signature
+    :return: bytes - stored form of the signature
+    """
+    return signature.astype("<u4").tobytes()
+
+
+def decode(data):
+    """
+    :param data: Stored form of a signature
+    :return: numpy array of uint32
+    """
+    return np.frombuffer(bytes(data), dtype="<u4")
+
+
+def index_signatures(posts):
+    """
+    Store the signatures and band keys of posts, replacing any stored before
+    :param posts: Iterable of Post objects
+    :return: int - number of posts indexed
+    """
+    signatures, bands = [], []
+    for post in posts:
+        signature = minhash(post.title, post.text)
+        signatures.append(PostSignature(post_id=post.pk, signature=encode(signature)))
+        bands.extend(PostBand(post_id=post.pk, key=key) for key in band_keys(signature))
+    with transaction.atomic():
+        PostSignature.objects.filter(post_id__in=[signature.post_id for signature in signatures]).delete()
+        PostSignature.objects.bulk_create(signatures, batch_size=1000)
+        PostBand.objects.bulk_create(bands, batch_size=5000)
+    return len(signatures)
+
+
+def unindex_signature(post):
+    """
+    Remove the signature and band keys of a post
+    :param post: Post object
+    """
+    PostSignature.objects.filter(post_id=post.pk).delete()
+
+
+def find_duplicates(title, text, exclude=None):
+    """
+    Find visible posts that are near-duplicates of a title and text, with one query on the band key index
+    :param title: Title of the new post
+    :param text: Text of the new post
+    :param exclude: ID of a post to leave out, e.g. the post itself
+    :return: list of (Post, float) - the most similar posts and their estimated Jaccard similarity, most similar
+        first
+    """
+    signature = minhash(title, text)
+    candidates = (
+        PostSignature.objects.filter(bands__key__in=band_keys(signature), post__is_deleted=False)
+        .exclude(post_id=exclude)
+        .annotate(matches=Count("bands"))
+        .order_by("-matches", "post_id")
+        .select_related("post")
+        .only("signature", "post__title", "post__slug")[:MAX_CANDIDATES]
+    )
+    duplicates = []
+    for candidate in candidates:
+        similarity = float(np.mean(decode(candidate.signature) == signature))
+        if similarity >= DUPLICATE_THRESHOLD:
+            duplicates.append((candidate.post, similarity))
+    duplicates.sort(key=lambda duplicate: -duplicate[1])
+    return duplicates[:MAX_DUPLICATES]
@@ -66,7 +66,8 @@ class CreatePostForm(forms.ModelForm):
 
 class CreateCommentForm(forms.Form):
     """
-    Form for creating a new comment. It includes a field for the comment text.
+    Form for creating a new comment. It includes a field for the comment text and, for replies, the comment
+    being replied to.
     """
 
     comment = forms.CharField(
@@ -77,6 +78,8 @@ class CreateCommentForm(forms.Form):
             "max_length": _("Comment cannot exceed 40000 characters."),
         },
     )
+    # ID of the comment being replied to, empty for comments on the post
+    parent = forms.IntegerField(required=False, widget=forms.HiddenInput)
 
     def clean_comment(self):
         """
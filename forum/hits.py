@@ -0,0 +1,238 @@
+"""
+Buffered view counting for posts.
+
+Recording a view with django-hitcount runs several queries and writes a Hit row and the post's HitCount row in
+the request, so popular posts contend for the same row. Views are instead deduplicated in the shared cache, one
+view per viewer and post within HITCOUNT_KEEP_HIT_ACTIVE: a key is added for the viewer and post, expiring at the
+end of the window, and the view is only counted if the key did not exist yet. Nothing is written to the database
+while serving the view, and keys of past views expire on their own. Counted views are kept in an in-process
+buffer, written to the HitCount table in bulk with one UPDATE ... SET hits = hits + n per distinct increment, at
+most every FLUSH_INTERVAL seconds.
+Flushing runs when a request finishes, after its response has been sent, and when a gunicorn worker exits (see
+gunicorn.conf.py). Individual Hit rows are no longer recorded. With FORUM_BUFFER_HITS set to False, as under
+tests, every counted view is written at once.
+
+Displayed counts are read from a cached copy of the stored count plus the views still waiting in the buffer.
+
+Author: Georgios Tsakoumakis
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from hitcount.models import BlacklistIP, BlacklistUserAgent
+from hitcount.utils import get_hitcount_model, get_ip
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of the buffered views
+FLUSH_INTERVAL = 10
+# Number of buffered posts that triggers a write before the interval has passed
+FLUSH_THRESHOLD = 500
+# Seconds the stored view counts and the hitcount blacklists are cached for
+COUNT_CACHE_TIMEOUT = 300
+
+
+def hit_window():
+    """
+    Get the number of seconds during which repeated views by the same viewer are not counted
+    :return: int
+    """
+    keep_active = getattr(settings, "HITCOUNT_KEEP_HIT_ACTIVE", {"days": 7})
+    return int(timedelta(**keep_active).total_seconds())
+
+
+def viewer_key(request):
+    """
+    Identify the viewer of a request: the user if logged in, otherwise the session, otherwise the IP address and
+    user agent. Anonymous visitors do not get a session just for being counted.
+    :param request: Request object
+    :return: str
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if request.session.session_key:
+        return f"session:{request.session.session_key}"
+    agent = request.headers.get("User-Agent", "")[:255]
+    return "ip:" + hashlib.sha256(f"{get_ip(request)}|{agent}".encode("utf-8")).hexdigest()
+
+
+def view_key(post_id, viewer):
+    """
+    Get the cache key marking a viewer's counted view of a post
+    :param post_id: ID of the viewed post
+    :param viewer: Viewer, as identified by viewer_key()
+    :return: str
+    """
+    return f"forum-view:{post_id}:{viewer}"
+
+
+def is_new_view(post_id, viewer):
+    """
+    Record a view of a post, unless the viewer's last counted view of it is within the hit window
+    :param post_id: ID of the viewed post
+    :param viewer: Viewer, as identified by viewer_key()
+    :return: bool - whether the view is counted
+    """
+    # add() only stores the key if it is missing, atomically in the shared cache, and it expires with the window
+    return cache.add(view_key(post_id, viewer), 1, hit_window())
+
+
+def is_blacklisted(request):
+    """
+    Check the request against django-hitcount's IP address and user agent blacklists, cached for a while
+    :param request: Request object
+    :return: bool
+    """
+    blacklists = cache.get_or_set(
+        "forum-hit-blacklists",
+        lambda: (
+            set(BlacklistIP.objects.values_list("ip", flat=True)),
+            set(BlacklistUserAgent.objects.values_list("user_agent", flat=True)),
+        ),
+        COUNT_CACHE_TIMEOUT,
+    )
+    ips, user_agents = blacklists
+    return get_ip(request) in ips or request.headers.get("User-Agent", "")[:255] in user_agents
+
+
+def count_key(post_id):
+    """
+    Get the cache key of a post's stored view count
+    :param post_id: ID of the post
+    :return: str
+    """
+    return f"forum-hits:{post_id}"
+
+
+class HitBuffer:
+    """
+    Views of posts waiting to be written to the HitCount table.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL, threshold=FLUSH_THRESHOLD):
+        """
+        :param interval: Seconds between writes of the buffered views
+        :param threshold: Number of buffered posts that triggers a write before the interval has passed
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def add(self, post_id):
+        """
+        Buffer a view of a post
+        :param post_id: ID of the viewed post
+        """
+        with self.lock:
+            self.pending[post_id] += 1
+
+    def buffered(self, post_id):
+        """
+        Get the number of views of a post waiting in the buffer
+        :param post_id: ID of the post
+        :return: int
+        """
+        return self.pending.get(post_id, 0)
+
+    def is_due(self):
+        """
+        Whether the buffered views should be written now
+        :return: bool
+        """
+        return bool(self.pending) and (
+            len(self.pending) >= self.threshold or time.monotonic() - self.flushed_at >= self.interval
+        )
+
+    def flush(self):
+        """
+        Write the buffered views to the HitCount table, creating missing rows, and bring the cached counts up
+        to date. Views are put back in the buffer if the write fails.
+        :return: int - number of views written
+        """
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            write_hits(pending)
+        except Exception:
+            logger.exception("Failed to write %d buffered post views", sum(pending.values()))
+            with self.lock:
+                self.pending.update(pending)
+            return 0
+        for post_id, views in pending.items():
+            try:
+                cache.incr(count_key(post_id), views)
+            except ValueError:
+                # Not cached, the next read loads the stored count
+                pass
+        return sum(pending.values())
+
+
+def write_hits(pending):
+    """
+    Add views to the HitCount rows of posts
+    :param pending: Counter mapping post IDs to their number of new views
+    """
+    hit_count_model = get_hitcount_model()
+    content_type = ContentType.objects.get_for_model(Post)
+    with transaction.atomic():
+        hit_count_model.objects.bulk_create(
+            [hit_count_model(content_type=content_type, object_pk=post_id) for post_id in pending],
+            ignore_conflicts=True,
+        )
+        by_views = {}
+        for post_id, views in pending.items():
+            by_views.setdefault(views, []).append(post_id)
+        for views, post_ids in by_views.items():
+            hit_count_model.objects.filter(content_type=content_type, object_pk__in=post_ids).update(
+                hits=F("hits") + views
+            )
+
+
+def stored_hits(post_id):
+    """
+    Get the stored number of views of a post, cached for a while
+    :param post_id: ID of the post
+    :return: int
+    """
+    def load():
+        return (
+            get_hitcount_model()
+            .objects.filter(content_type=ContentType.objects.get_for_model(Post), object_pk=post_id)
+            .values_list("hits", flat=True)
+            .first()
+            or 0
+        )
+
+    return cache.get_or_set(count_key(post_id), load, COUNT_CACHE_TIMEOUT)
+
+
+hit_buffer = HitBuffer()
+
+
+def record_view(request, post):
+    """
+    Count a view of a post, unless the viewer has viewed it recently or is blacklisted
+    :param request: Request object
+    :param post: Post object
+    :return: int - number of views of the post, including buffered ones
+    """
+    if not is_blacklisted(request) and is_new_view(post.pk, viewer_key(request)):
+        hit_buffer.add(post.pk)
+        if not getattr(settings, "FORUM_BUFFER_HITS", True):
+            hit_buffer.flush()
+    return stored_hits(post.pk) + hit_buffer.buffered(post.pk)
@@ -0,0 +1,129 @@
+"""
+Management command to time the near-duplicate check of new posts on a large seeded forum.
+
+Posts with generated text are created and their signatures indexed inside a transaction that is rolled back
+afterwards, so the database is left unchanged. The check is timed for near-duplicates of seeded posts, with a few
+words changed, and for new text, and the plan of its candidate query is shown: it should be read from the band key
+index, not by scanning the signatures.
+
+Usage:
+    python manage.py benchmark_duplicates --posts 1000000
+
+Author: Georgios Tsakoumakis
+"""
+
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from forum.duplicates import band_keys, find_duplicates, index_signatures, minhash
+from forum.models import Post, PostSignature
+
+BATCH_SIZE = 2000
+VOCABULARY_SIZE = 5000
+WORDS_PER_POST = 60
+
+
+def generate_text(rng, vocabulary):
+    """
+    :param rng: Random number generator
+    :param vocabulary: Words to pick from
+    :return: str - random words
+    """
+    return " ".join(rng.choice(vocabulary) for _ in range(WORDS_PER_POST))
+
+
+def seed_posts(user, posts, rng, vocabulary):
+    """
+    Create posts with random text and index their signatures
+    :param user: Author of the posts
+    :param posts: Number of posts
+    :param rng: Random number generator
+    :param vocabulary: Words of the text
+    :return: list of (title, text) of some of the posts, to be used as probes
+    """
+    now = timezone.now()
+    next_post = (Post.objects.aggregate(last=Max("post_id"))["last"] or 0) + 1
+    samples = []
+    for start in range(0, posts, BATCH_SIZE):
+        batch = [
+            Post(
+                post_id=number,
+                title=f"Benchmark post {number}",
+                slug=f"benchmark-post-{number}",
+                text=generate_text(rng, vocabulary),
+                user=user,
+                created_at=now,
+                updated_at=now,
+            )
+            for number in range(next_post + start, next_post + min(start + BATCH_SIZE, posts))
+        ]
+        Post.objects.bulk_create(batch)
+        index_signatures(batch)
+        samples.append((batch[0].title, batch[0].text))
+    return samples
+
+
+def edit_text(rng, text, vocabulary, changes):
+    """
+    :param rng: Random number generator
+    :param text: Text to edit
+    :param vocabulary: Words to put in
+    :param changes: Number of words replaced
+    :return: str - the text with some words replaced
+    """
+    words = text.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    return " ".join(words)
+
+
+class Command(BaseCommand):
+    help = "Time the near-duplicate check of new posts on a large seeded forum."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000, help="Number of posts")
+        parser.add_argument("--probes", type=int, default=100, help="Number of checks timed of each kind")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = [f"word{index}" for index in range(VOCABULARY_SIZE)]
+        with transaction.atomic():
+            user = get_user_model().objects.create(
+                username="duplicate-benchmark", email="duplicate-benchmark@example.com"
+            )
+            start = time.perf_counter()
+            samples = seed_posts(user, options["posts"], rng, vocabulary)
+            self.stdout.write(f"Seeded and indexed {options['posts']} posts in {time.perf_counter() - start:.1f} s")
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+            probes = {
+                "Near-duplicates": [
+                    (title, edit_text(rng, text, vocabulary, 2))
+                    for title, text in (rng.choice(samples) for _ in range(options["probes"]))
+                ],
+                "New posts": [
+                    ("A new question", generate_text(rng, vocabulary)) for _ in range(options["probes"])
+                ],
+            }
+            for name, posts in probes.items():
+                times, found = [], 0
+                for title, text in posts:
+                    start = time.perf_counter()
+                    found += bool(find_duplicates(title, text))
+                    times.append(time.perf_counter() - start)
+                times.sort()
+                self.stdout.write(
+                    f"{name}: {statistics.median(times) * 1000:.2f} ms median, "
+                    f"{times[int(len(times) * 0.95)] * 1000:.2f} ms p95, duplicates found for {found}/{len(posts)}"
+                )
+            keys = band_keys(minhash(*probes["New posts"][0]))
+            self.stdout.write("\nCandidate query:")
+            self.stdout.write(PostSignature.objects.filter(bands__key__in=keys, post__is_deleted=False).explain())
+            transaction.set_rollback(True)
@@ -0,0 +1,135 @@
+"""
+Management command to show the query plans of the forum's listing queries on a large seeded forum.
+
+Posts and comments are generated from a seed, a share of them deleted, inside a transaction that is rolled back
+afterwards, so the database is left unchanged. The planner statistics are refreshed with ANALYZE before each
+query is explained and timed. Every listing should be read from one of the partial indexes on visible posts and
+comments or on root comments in index order, without a sort step. On PostgreSQL a post's comment count is an index-only scan; SQLite
+does not treat a partial index as covering when its condition's column is not stored in it.
+
+Usage:
+    python manage.py benchmark_indexes --posts 10000000 --comments 2
+
+Author: Georgios Tsakoumakis
+"""
+
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from forum.models import Comment, Post
+from forum.rankings import SORTS
+
+BATCH_SIZE = 5000
+# Plan steps showing a query sorts its rows instead of reading them in index order
+SORT_STEPS = ("USE TEMP B-TREE FOR ORDER BY", "Sort")
+
+
+def seed_forum(users, posts, comments, deleted, seed):
+    """
+    Create posts and comments in batches, spread over the past year
+    :param users: Authors of the posts and comments
+    :param posts: Number of posts
+    :param comments: Number of comments on each post
+    :param deleted: Share of posts and comments marked as deleted
+    :param seed: Seed of the generated data
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    next_post = (Post.objects.aggregate(last=Max("post_id"))["last"] or 0) + 1
+    for start in range(0, posts, BATCH_SIZE):
+        batch = []
+        for number in range(next_post + start, next_post + min(start + BATCH_SIZE, posts)):
+            created_at = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            batch.append(
+                Post(
+                    post_id=number,
+                    title=f"Benchmark post {number}",
+                    slug=f"benchmark-post-{number}",
+                    text="Benchmark text",
+                    user=rng.choice(users),
+                    created_at=created_at,
+                    updated_at=created_at,
+                    is_deleted=rng.random() < deleted,
+                    score=rng.randint(-20, 200),
+                )
+            )
+        Post.objects.bulk_create(batch)
+        Comment.objects.bulk_create(
+            [
+                Comment(
+                    post=post,
+                    user=rng.choice(users),
+                    text="Benchmark comment",
+                    created_at=post.created_at + timedelta(seconds=rng.randrange(7 * 24 * 3600)),
+                    updated_at=post.created_at,
+                    is_deleted=rng.random() < deleted,
+                )
+                for post in batch
+                for _ in range(comments)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+
+class Command(BaseCommand):
+    help = "Explain and time the forum's listing queries on a large seeded forum."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000, help="Number of posts")
+        parser.add_argument("--comments", type=int, default=2, help="Number of comments on each post")
+        parser.add_argument("--users", type=int, default=100, help="Number of authors")
+        parser.add_argument("--deleted", type=float, default=0.1, help="Share of deleted posts and comments")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = get_user_model().objects.bulk_create(
+                [
+                    get_user_model()(username=f"index-benchmark-{index}", email=f"index-benchmark-{index}@example.com")
+                    for index in range(options["users"])
+                ]
+            )
+            if connection.vendor != "postgresql":
+                # Only PostgreSQL returns the IDs of bulk created rows
+                users = list(get_user_model().objects.filter(username__startswith="index-benchmark-"))
+            start = time.perf_counter()
+            seed_forum(users, options["posts"], options["comments"], options["deleted"], options["seed"])
+            self.stdout.write(f"Seeded {options['posts']} posts and {options['posts'] * options['comments']} "
+                              f"comments in {time.perf_counter() - start:.1f} s")
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            self.benchmark(users[0], options["repeat"])
+            transaction.set_rollback(True)
+
+    def benchmark(self, user, repeat):
+        post = Post.objects.for_listing().first()
+        listing = Post.objects.for_listing().order_by(*SORTS["new"])
+        queries = {
+            "Forum listing": listing[:6],
+            "Forum listing, next page": listing.filter(created_at__lt=post.created_at)[:6],
+            "Latest posts feed": Post.objects.for_listing()[:5],
+            "Comments of a post": (
+                Comment.objects.displayed_roots().filter(post=post).order_by("-created_at", "-comment_id")[:21]
+            ),
+            "Comment count of a post": Comment.objects.visible().filter(post=post).values("pk"),
+            "Recent posts of a user": Post.objects.for_listing().filter(user=user)[:3],
+            "Recent comments of a user": Comment.objects.for_listing().filter(user=user)[:3],
+        }
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                times.append(time.perf_counter() - start)
+            sorted_rows = any(step in plan for step in SORT_STEPS)
+            self.stdout.write(f"\n{name}: {statistics.median(times) * 1000:.2f} ms (median of {repeat})"
+                              f"{', SORTS ROWS' if sorted_rows else ''}")
+            self.stdout.write(plan)
@@ -0,0 +1,121 @@
+"""
+Management command to time loading and rendering a large comment thread.
+
+A post with one thread of the given number of comments is created inside a transaction that is rolled back
+afterwards, so the database is left unchanged.
+
+Usage:
+    python manage.py benchmark_threads --comments 10000
+
+Author: Georgios Tsakoumakis
+"""
+
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from forum.forms import CommentVoteForm
+from forum.models import Comment, Post, MAX_COMMENT_DEPTH, PATH_STEP
+from forum.threads import DISPLAY_DEPTH, load_threads
+
+
+def create_thread(post, user, size, seed):
+    """
+    Create a thread of comments, each replying to one of the 50 comments before it
+    :param post: Post object
+    :param user: Author of the comments
+    :param size: Number of comments in the thread, the root included
+    :param seed: Seed of the random reply structure
+    :return: Comment - root of the thread
+    """
+    rng = random.Random(seed)
+    # IDs are given explicitly so that paths are known before inserting
+    next_id = (Comment.objects.aggregate(last=Max("comment_id"))["last"] or 0) + 1
+    comments = []
+    for index in range(size):
+        parent = None
+        if comments:
+            parent = rng.choice(comments[-50:])
+            while parent.depth + 1 >= MAX_COMMENT_DEPTH:
+                parent = parent.parent
+        comment_id = next_id + index
+        comments.append(
+            Comment(
+                comment_id=comment_id,
+                post=post,
+                user=user,
+                text=f"Reply number {index}",
+                parent=parent,
+                thread_id=next_id,
+                depth=parent.depth + 1 if parent else 0,
+                path=(parent.path if parent else "") + str(comment_id).zfill(PATH_STEP),
+            )
+        )
+    Comment.objects.bulk_create(comments, batch_size=500)
+    return comments[0]
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting queries, without the query log's limit on the number of queries kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Time loading, assembling and rendering a large comment thread."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=10000, help="Number of comments in the thread")
+        parser.add_argument("--depth", type=int, default=DISPLAY_DEPTH, help="Levels of replies shown")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                username="thread-benchmark", email="thread-benchmark@example.com"
+            )
+            post = Post.objects.create(title="Thread benchmark", text="Thread benchmark", user=user)
+            root = create_thread(post, user, options["comments"], options["seed"])
+            self.benchmark(post, root, options["depth"], options["repeat"])
+            transaction.set_rollback(True)
+
+    def benchmark(self, post, root, depth, repeat):
+        request = RequestFactory().get(post.get_url())
+        request.user = AnonymousUser()
+        load_times, render_times = [], []
+        for _ in range(repeat):
+            queries, render_queries = QueryCounter(), QueryCounter()
+            start = time.perf_counter()
+            with connection.execute_wrapper(queries):
+                thread = load_threads([root], depth)
+            load_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with connection.execute_wrapper(render_queries):
+                render_to_string(
+                    "comments.html",
+                    {"post": post, "thread": thread, "comment_vote_form": CommentVoteForm()},
+                    request=request,
+                )
+            render_times.append(time.perf_counter() - start)
+
+        self.stdout.write(f"Thread of {Comment.objects.filter(thread=root).count()} comments, "
+                          f"{len(thread)} shown up to {depth} levels of replies")
+        self.stdout.write(f"Load and assemble: {statistics.median(load_times) * 1000:.1f} ms "
+                          f"(median of {repeat}), {queries.count} query(ies)")
+        self.stdout.write(f"Render: {statistics.median(render_times) * 1000:.1f} ms "
+                          f"(median of {repeat}), {render_queries.count} query(ies)")
@@ -0,0 +1,35 @@
+"""
+Management command to store the MinHash signatures of existing posts, used to warn about near-duplicate posts.
+New posts are indexed as they are created, so it only needs to be run once, or after changing the signature
+parameters in forum/duplicates.py.
+
+Usage:
+    python manage.py index_signatures
+
+Author: Georgios Tsakoumakis
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from forum.duplicates import index_signatures
+from forum.models import Post
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Store the MinHash signatures of every visible post."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        indexed = 0
+        batch = []
+        for post in Post.objects.visible().only("title", "text").iterator(chunk_size=BATCH_SIZE):
+            batch.append(post)
+            if len(batch) == BATCH_SIZE:
+                indexed += index_signatures(batch)
+                batch = []
+        indexed += index_signatures(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored the signatures of {indexed} post(s) in {time.perf_counter() - start:.1f} s."
+        ))
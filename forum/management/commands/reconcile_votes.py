@@ -0,0 +1,29 @@
+"""
+Management command to fix post and comment vote counters that have drifted from the vote tables.
+
+Usage:
+    python manage.py reconcile_votes
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.core.management.base import BaseCommand
+from forum.models import Post, Comment
+from forum.utils import reconcile_vote_counters, refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Recount post and comment votes and correct drifted vote counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = reconcile_vote_counters(Post, options["batch_size"])
+        comments = reconcile_vote_counters(Comment, options["batch_size"])
+        if posts:
+            # Rankings follow the corrected counters
+            refresh_rankings(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Corrected vote counters of {posts} post(s) and {comments} comment(s).")
+        )
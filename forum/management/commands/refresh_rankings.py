@@ -0,0 +1,25 @@
+"""
+Management command to recompute the hot and controversial rankings of every post.
+
+Rankings are kept up to date when votes are cast, so this is only needed after vote counters are corrected
+by reconcile_votes or the ranking formulas change.
+
+Usage:
+    python manage.py refresh_rankings
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.core.management.base import BaseCommand
+from forum.utils import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Recompute the hot and controversial rankings of every post."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = refresh_rankings(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated the rankings of {posts} post(s)."))
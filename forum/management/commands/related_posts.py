@@ -0,0 +1,38 @@
+"""
+Management command to compute the related posts shown on post pages.
+
+Run it in full periodically, e.g. nightly, and with --new every few minutes so that new posts get their related
+posts and appear among those of the existing posts. A full run also refreshes the stored vocabulary, which --new
+vectorises the new posts with.
+
+Usage:
+    python manage.py related_posts
+    python manage.py related_posts --new
+
+Author: Georgios Tsakoumakis
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from forum.related import compute_related, new_post_ids
+
+
+class Command(BaseCommand):
+    help = "Compute the related posts of every post, or only of the posts added since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--new", action="store_true", help="Only compute the posts added since the last run")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["new"]:
+            post_ids = new_post_ids()
+            if not post_ids:
+                self.stdout.write("No new posts.")
+                return
+            posts = compute_related(post_ids)
+        else:
+            posts = compute_related()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored the related posts of {posts} post(s) in {time.perf_counter() - start:.1f} s."
+        ))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:09
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def vote_count(vote_model, target_field, vote_type):
+    votes = (
+        vote_model.objects.filter(**{target_field: OuterRef("pk"), "vote_type": vote_type})
+        .values(target_field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(votes), Value(0))
+
+
+def backfill_vote_counters(apps, schema_editor):
+    for model_name, vote_model_name, target_field in (
+        ("Post", "PostVote", "post"),
+        ("Comment", "CommentVote", "comment"),
+    ):
+        model = apps.get_model("forum", model_name)
+        vote_model = apps.get_model("forum", vote_model_name)
+        model.objects.update(
+            upvote_count=vote_count(vote_model, target_field, "up"),
+            downvote_count=vote_count(vote_model, target_field, "down"),
+        )
+        model.objects.update(score=F("upvote_count") - F("downvote_count"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="downvote_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="score",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="upvote_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="downvote_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="score",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="upvote_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counters, migrations.RunPython.noop),
+    ]
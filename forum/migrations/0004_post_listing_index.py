@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0003_vote_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["created_at", "post_id"], name="posts_created_at_idx"
+            ),
+        ),
+    ]
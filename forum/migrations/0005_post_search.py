@@ -0,0 +1,67 @@
+from django.db import migrations
+
+POSTGRES_FORWARDS = [
+    # Title matches rank above text matches
+    """
+    ALTER TABLE posts ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', text), 'B')
+        ) STORED
+    """,
+    "CREATE INDEX posts_search_idx ON posts USING gin (search_vector) WHERE NOT is_deleted",
+    """
+    ALTER TABLE comments ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+    """,
+    "CREATE INDEX comments_search_idx ON comments USING gin (search_vector) WHERE NOT is_deleted",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS comments_search_idx",
+    "ALTER TABLE comments DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS posts_search_idx",
+    "ALTER TABLE posts DROP COLUMN IF EXISTS search_vector",
+]
+
+# Django rebuilds SQLite tables when columns are added, which would drop triggers on posts and comments,
+# so the FTS5 tables are standalone and kept current by the signal handlers in forum/signals.py
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE posts_fts USING fts5(title, text, tokenize='porter unicode61')",
+    "INSERT INTO posts_fts(rowid, title, text) SELECT post_id, title, text FROM posts",
+    "CREATE VIRTUAL TABLE comments_fts USING fts5(text, tokenize='porter unicode61')",
+    "INSERT INTO comments_fts(rowid, text) SELECT comment_id, text FROM comments",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TABLE IF EXISTS comments_fts",
+    "DROP TABLE IF EXISTS posts_fts",
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == "postgresql":
+            statements = postgres_statements
+        elif vendor == "sqlite":
+            statements = sqlite_statements
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0004_post_listing_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+import re
+from django.db import migrations, models
+
+
+def count_existing_slugs(apps, schema_editor):
+    """
+    Start the counters above the suffixes already used by existing posts
+    """
+    Post = apps.get_model("forum", "Post")
+    SlugCounter = apps.get_model("forum", "SlugCounter")
+    counts = {}
+    for slug in Post.objects.values_list("slug", flat=True).iterator():
+        counts.setdefault(slug, 0)
+        match = re.fullmatch(r"(.+)-(\d+)", slug)
+        if match:
+            base, suffix = match.group(1), int(match.group(2))
+            counts[base] = max(counts.get(base, 0), suffix)
+    SlugCounter.objects.bulk_create(
+        [SlugCounter(base=base, count=count) for base, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0005_post_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlugCounter",
+            fields=[
+                (
+                    "base",
+                    models.SlugField(max_length=256, primary_key=True, serialize=False),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Slug Counter",
+                "verbose_name_plural": "Slug Counters",
+                "db_table": "slug_counters",
+            },
+        ),
+        migrations.RunPython(count_existing_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0006_slug_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "is_deleted", "created_at"],
+                name="comments_post_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "is_deleted", "score"], name="comments_post_score_idx"
+            ),
+        ),
+    ]
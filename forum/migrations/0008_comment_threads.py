@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def start_threads(apps, schema_editor):
+    """
+    Make every existing comment the root of its own thread
+    """
+    Comment = apps.get_model("forum", "Comment")
+    batch = []
+    for comment in Comment.objects.only("pk").iterator(chunk_size=1000):
+        comment.thread_id = comment.pk
+        comment.path = str(comment.pk).zfill(PATH_STEP)
+        batch.append(comment)
+        if len(batch) == 1000:
+            Comment.objects.bulk_update(batch, ["thread", "path"])
+            batch = []
+    Comment.objects.bulk_update(batch, ["thread", "path"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0007_comment_listing_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="forum.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(blank=True, editable=False, max_length=250),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="thread",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="forum.comment",
+            ),
+        ),
+        migrations.RunPython(start_threads, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["thread", "path"], name="comments_thread_path_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:11
+
+from django.conf import settings
+from django.db import migrations, models
+from forum.rankings import post_rankings
+
+
+def rank_existing_posts(apps, schema_editor):
+    Post = apps.get_model("forum", "Post")
+    posts = []
+    for post in Post.objects.only(
+        "pk", "created_at", "upvote_count", "downvote_count"
+    ).iterator():
+        for field, value in post_rankings(
+            post.upvote_count, post.downvote_count, post.created_at
+        ).items():
+            setattr(post, field, value)
+        posts.append(post)
+    Post.objects.bulk_update(posts, ["hot_rank", "controversy"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0008_comment_threads"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="controversy",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="hot_rank",
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(rank_existing_posts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["hot_rank", "post_id"], name="posts_hot_rank_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["score", "post_id"], name="posts_score_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["controversy", "post_id"], name="posts_controversy_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0009_post_rankings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:24
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def date_existing_rows(apps, schema_editor):
+    # Rows existing before the field was added are dated by their creation
+    for model_name in ("Post", "Comment"):
+        apps.get_model("forum", model_name).objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0010_fragment_versions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(date_existing_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "updated_at"], name="comments_post_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["updated_at"], name="posts_updated_at_idx"),
+        ),
+    ]
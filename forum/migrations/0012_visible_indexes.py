@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0011_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="comment",
+            name="comments_post_created_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="comment",
+            name="comments_post_score_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="post",
+            name="posts_created_at_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="post",
+            name="posts_hot_rank_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="post",
+            name="posts_score_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="post",
+            name="posts_controversy_idx",
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["post", "-created_at", "-comment_id"],
+                name="comments_visible_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["post", "-score", "-comment_id"],
+                name="comments_visible_score_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["user", "-created_at"],
+                name="comments_user_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["-created_at", "-post_id"],
+                name="posts_visible_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["user", "-created_at"],
+                name="posts_user_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["hot_rank", "post_id"],
+                name="posts_hot_rank_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["score", "post_id"],
+                name="posts_score_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["controversy", "post_id"],
+                name="posts_controversy_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:37
+
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Concat, Length, Substr
+from forum.models import EXCERPT_LENGTH
+
+
+def excerpt_existing_posts(apps, schema_editor):
+    # One UPDATE, so the texts are not loaded into Python
+    Post = apps.get_model("forum", "Post")
+    Post.objects.annotate(text_length=Length("text")).update(
+        excerpt=Case(
+            When(
+                text_length__gt=EXCERPT_LENGTH,
+                then=Concat(Substr("text", 1, EXCERPT_LENGTH), Value("...")),
+            ),
+            default=F("text"),
+            output_field=models.CharField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0012_visible_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt",
+            field=models.CharField(blank=True, editable=False, max_length=123),
+        ),
+        migrations.RunPython(excerpt_existing_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0013_post_excerpt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedPost",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_posts",
+                        to="forum.post",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="forum.post",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Related Post",
+                "verbose_name_plural": "Related Posts",
+                "db_table": "related_posts",
+                "indexes": [
+                    models.Index(
+                        fields=["post", "-score"], name="related_posts_score_idx"
+                    )
+                ],
+                "unique_together": {("post", "related")},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0014_related_posts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostSignature",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="signature",
+                        serialize=False,
+                        to="forum.post",
+                    ),
+                ),
+                ("signature", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Post Signature",
+                "verbose_name_plural": "Post Signatures",
+                "db_table": "post_signatures",
+            },
+        ),
+        migrations.CreateModel(
+            name="PostBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.BigIntegerField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bands",
+                        to="forum.postsignature",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Post Band",
+                "verbose_name_plural": "Post Bands",
+                "db_table": "post_bands",
+                "indexes": [models.Index(fields=["key"], name="post_bands_key_idx")],
+            },
+        ),
+    ]
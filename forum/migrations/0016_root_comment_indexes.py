@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0015_post_signatures"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="comment",
+            name="comments_visible_score_idx",
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("parent__isnull", True)),
+                fields=["post", "-created_at", "-comment_id"],
+                name="comments_roots_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("parent__isnull", True)),
+                fields=["post", "-score", "-comment_id"],
+                name="comments_roots_score_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0016_root_comment_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostView",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("viewer", models.CharField(max_length=80)),
+                ("viewed_at", models.DateTimeField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="forum.post",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Post View",
+                "verbose_name_plural": "Post Views",
+                "db_table": "post_views",
+                "unique_together": {("post", "viewer")},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0017_post_views"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostVector",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="forum.post",
+                    ),
+                ),
+                ("vector", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Post Vector",
+                "verbose_name_plural": "Post Vectors",
+                "db_table": "post_vectors",
+            },
+        ),
+        migrations.CreateModel(
+            name="RelatedTerm",
+            fields=[
+                (
+                    "term",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("column", models.PositiveIntegerField(unique=True)),
+                ("idf", models.FloatField()),
+            ],
+            options={
+                "verbose_name": "Related Term",
+                "verbose_name_plural": "Related Terms",
+                "db_table": "related_terms",
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0018_related_vectors"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="PostView",
+        ),
+    ]
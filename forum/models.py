@@ -1,26 +1,235 @@
 """
 This module contains the models for the forum app. The models are as follows:
-1. Post: Represents a post in the forum. It has a title, text, user, created_at, and is_deleted fields.
-2. Comment: Represents a comment on a post. It has a post, user, text, created_at, and is_deleted fields.
+1. Post: Represents a post in the forum. It has a title, text, user, created_at, is_deleted and vote counter fields.
+2. Comment: Represents a comment on a post. It has a post, user, text, created_at, is_deleted and vote counter fields.
+   Replies to comments form threads, stored with a materialised path (see forum/threads.py).
 3. Vote: Abstract model representing a vote. It has a user and vote_type field.
 4. PostVote: Represents a vote on a post. It has a post field.
 5. CommentVote: Represents a vote on a comment. It has a comment field.
+6. SlugCounter: Records the last suffix given to post slugs generated from the same title.
+7. RelatedPost: Links a post to one of its most similar posts, computed in batches (see forum/related.py).
+   RelatedTerm and PostVector store the vocabulary and the TF-IDF vectors they were computed from.
+8. PostSignature and PostBand: MinHash signature of a post and its LSH band keys, used to find near-duplicate
+   posts (see forum/duplicates.py).
+Posts and comments carry a version, incremented whenever their row is changed, which keys their cached template
+fragments.
+Posts and comments are loaded for pages through PostQuerySet.for_listing() and CommentQuerySet.for_listing().
 
 Author: Georgios Tsakoumakis, Ionut-Valeriu Facaeru
 """
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.text import slugify
 from hitcount.models import HitCount
 from django.contrib.contenttypes.fields import GenericRelation
 from django.shortcuts import reverse
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from hitcount.utils import get_hitcount_model
+from .rankings import RANKING_FIELDS, post_rankings
 
 CustomUser = get_user_model()
 
+VOTE_COUNTER_FIELDS = ["upvote_count", "downvote_count", "score"]
+# Width of each comment ID in a materialised path, and the deepest reply the path has room for
+PATH_STEP = 10
+MAX_COMMENT_DEPTH = 25
+# Number of characters of a post's text shown by listings
+EXCERPT_LENGTH = 120
+# Condition of the partial indexes serving listings, which only show items that are not deleted
+VISIBLE = Q(is_deleted=False)
+
+
+def make_excerpt(text):
+    """
+    Shorten the text of a post for listings
+    :param text: Text of the post
+    :return: str - the first EXCERPT_LENGTH characters, followed by "..." if the text is longer
+    """
+    return text[:EXCERPT_LENGTH] + "..." if len(text) > EXCERPT_LENGTH else text
+
+
+def save_new_version(instance, save, *args, **kwargs):
+    """
+    Save a post or comment, incrementing the version of an existing row in the database so that a concurrent
+    increment by a vote is not overwritten. The fields written by votes are left out of the update for the same
+    reason, they are read back with the new version afterwards.
+    :param instance: Post or Comment object
+    :param save: Bound save method of the model's parent class
+    """
+    if instance._state.adding:
+        save(*args, **kwargs)
+        return
+    if kwargs.get("update_fields") is None:
+        kwargs["update_fields"] = [
+            field.name
+            for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in instance.vote_fields
+        ]
+    instance.version = F("version") + 1
+    save(*args, **kwargs)
+    instance.refresh_from_db(fields=["version", *instance.vote_fields])
+
+
+class VotableQuerySet(models.QuerySet):
+    """
+    Shared queryset methods for posts and comments. Listing pages load the author, the author's professional
+    profile and every count shown on the page with the rows themselves, so the number of SQL statements does not
+    grow with the number of items displayed.
+    """
+    vote_relation = None
+
+    def visible(self):
+        """
+        Exclude deleted items, matching the condition of the listing indexes
+        :return: QuerySet
+        """
+        return self.filter(VISIBLE)
+
+    def with_authors(self):
+        """
+        Join the author and the author's professional profile
+        :return: QuerySet
+        """
+        return self.select_related("user", "user__professionaluser")
+
+    def with_vote_totals(self):
+        """
+        Count the upvotes and downvotes of each item from the vote table. Pages read the vote counters instead,
+        this is used to check the counters against the votes.
+        :return: QuerySet annotated with total_upvotes and total_downvotes
+        """
+        vote_type = f"{self.vote_relation}__vote_type"
+        return self.annotate(
+            total_upvotes=Count(self.vote_relation, filter=Q(**{vote_type: Vote.VoteType.UPVOTE})),
+            total_downvotes=Count(self.vote_relation, filter=Q(**{vote_type: Vote.VoteType.DOWNVOTE})),
+        )
+
+
+class PostQuerySet(VotableQuerySet):
+    """
+    QuerySet for posts
+    """
+    vote_relation = "postvote"
+
+    def with_comment_counts(self):
+        """
+        Annotate the number of comments that are not deleted. A subquery is used so the count is not
+        multiplied by other joins.
+        :return: QuerySet annotated with comment_count
+        """
+        comments = (
+            Comment.objects.filter(post=OuterRef("pk"), is_deleted=False)
+            .order_by()
+            .values("post")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.annotate(
+            comment_count=Coalesce(Subquery(comments, output_field=IntegerField()), Value(0))
+        )
+
+    def with_hit_counts(self):
+        """
+        Annotate the number of views recorded by django-hitcount
+        :return: QuerySet annotated with hits
+        """
+        hit_counts = get_hitcount_model().objects.filter(
+            content_type__app_label=self.model._meta.app_label,
+            content_type__model=self.model._meta.model_name,
+            object_pk=OuterRef("pk"),
+        ).order_by().values("hits")[:1]
+        return self.annotate(
+            hits=Coalesce(Subquery(hit_counts, output_field=IntegerField()), Value(0))
+        )
+
+    def for_listing(self):
+        """
+        Visible posts with their authors, comment counts and hit counts, newest first. Listings show the stored
+        excerpt, the text is only loaded when accessed.
+        :return: QuerySet
+        """
+        return (
+            self.visible()
+            .defer("text")
+            .with_authors()
+            .with_comment_counts()
+            .with_hit_counts()
+            .order_by("-created_at")
+        )
+
+
+class CommentQuerySet(VotableQuerySet):
+    """
+    QuerySet for comments
+    """
+    vote_relation = "commentvote"
+
+    def for_listing(self):
+        """
+        Visible comments with their authors and posts, newest first. The text of the posts is only loaded when
+        accessed.
+        :return: QuerySet
+        """
+        return self.visible().with_authors().select_related("post").defer("post__text").order_by("-created_at")
+
+    def roots(self):
+        """
+        Comments made directly on a post rather than in reply to another comment
+        :return: QuerySet
+        """
+        return self.filter(parent__isnull=True)
+
+    def displayed_roots(self):
+        """
+        Root comments shown on a post page: those that are not deleted, and deleted ones whose threads still
+        have visible replies, shown as placeholders above them. Served by the partial indexes on root comments.
+        :return: QuerySet
+        """
+        visible_replies = self.model.objects.filter(thread=OuterRef("pk"), is_deleted=False)
+        return self.roots().filter(VISIBLE | Exists(visible_replies))
+
+    def threads(self, roots, max_depth=None, limit=None):
+        """
+        Every comment in the threads started by the given comments, deleted ones included, in thread order:
+        each comment is followed by its replies, oldest first. Served by the (thread, path) index.
+        :param roots: Root comments of the threads
+        :param max_depth: Deepest reply to include, relative to the roots, or None for whole threads
+        :param limit: Most comments included from each thread, the first ones in thread order, or None for all
+        :return: QuerySet
+        """
+        queryset = self.filter(thread__in=[root.pk for root in roots]).with_authors().order_by("path")
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=max_depth)
+        if limit is not None:
+            queryset = queryset.annotate(
+                thread_position=Window(RowNumber(), partition_by=F("thread"), order_by=F("path").asc())
+            ).filter(thread_position__lte=limit)
+        return queryset
+
+    def subtree(self, comment, max_depth=None, after=None):
+        """
+        Replies below a comment, at any depth, in thread order
+        :param comment: Comment object
+        :param max_depth: Deepest reply to include, relative to the comment, or None for the whole subtree
+        :param after: Path of a reply, only the replies after it in thread order are included
+        :return: QuerySet
+        """
+        queryset = (
+            self.filter(thread_id=comment.thread_id, path__startswith=comment.path, depth__gt=comment.depth)
+            .with_authors()
+            .order_by("path")
+        )
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=comment.depth + max_depth)
+        if after is not None:
+            queryset = queryset.filter(path__gt=after)
+        return queryset
+
 
 class Post(models.Model):
     """
@@ -30,52 +239,102 @@ class Post(models.Model):
     - title: Title of the post
     - slug: Slug of the post, generated from the title
     - text: Text of the post
+    - excerpt: Start of the text shown by listings, kept in step with the text when saving
     - user: User who created the post (foreign key to CustomUser)
     - created_at: Date and time the post was created
     - is_deleted: Boolean field indicating if the post is deleted
+    - upvote_count, downvote_count, score: Vote counters, kept in step with PostVote rows when voting
+    - hot_rank, controversy: Rankings of the hot and controversial listings, updated with the vote counters
+    - updated_at: Date and time the post, its vote counters or its comment count last changed
+    - version: Incremented whenever the row changes, keys the post's cached template fragments
     - hit_count_generic: Generic relation to the HitCount model for tracking post views
     """
     class Meta:
         verbose_name = "Post"
         verbose_name_plural = "Posts"
         db_table = "posts"
+        indexes = [
+            # Keyset pagination of the forum listing, the feed and a user's recent posts. Listings never show
+            # deleted posts, so they are left out of the indexes
+            models.Index(fields=["-created_at", "-post_id"], name="posts_visible_created_idx", condition=VISIBLE),
+            models.Index(fields=["user", "-created_at"], name="posts_user_created_idx", condition=VISIBLE),
+            # Ranked listings
+            models.Index(fields=["hot_rank", "post_id"], name="posts_hot_rank_idx", condition=VISIBLE),
+            models.Index(fields=["score", "post_id"], name="posts_score_idx", condition=VISIBLE),
+            models.Index(fields=["controversy", "post_id"], name="posts_controversy_idx", condition=VISIBLE),
+            # Time of the last change to the forum, for conditional requests
+            models.Index(fields=["updated_at"], name="posts_updated_at_idx"),
+        ]
 
     post_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=256)
     slug = models.SlugField(max_length=256, unique=True, blank=True)
     text = models.TextField(max_length=40000)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 3, blank=True, editable=False)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+    score = models.IntegerField(default=0)
+    hot_rank = models.FloatField(default=0)
+    controversy = models.FloatField(default=0)
+    version = models.PositiveIntegerField(default=0, editable=False)
     hit_count_generic = GenericRelation(
         HitCount,
         object_id_field="object_pk",
         related_query_name="hit_count_generic_relation",
     )
 
+    objects = PostQuerySet.as_manager()
+    # Fields only changed by voting, see forum/votes.py
+    vote_fields = VOTE_COUNTER_FIELDS + RANKING_FIELDS
+
     @property
     def votes(self):
         """
-        Calculate the total votes of the post
+        Get the total votes of the post from its vote counters
         :return: int representing the total votes
         """
-        return self.get_upvotes() - self.get_downvotes()
+        return self.score
 
     def save(self, *args, **kwargs):
         """
-        Save the post and perform validation checks before saving. If the slug is not set, generate it from the title.
-        """
-        if not self.slug:
-            self.slug = slugify(self.title)
-            # Ensure the slug is unique
-            while Post.objects.filter(slug=self.slug).exists():
-                self.slug = (
-                    slugify(self.title)
-                    + "-"
-                    + str(Post.objects.filter(slug=self.slug).count())
-                )
-        self.full_clean()
-        super(Post, self).save(*args, **kwargs)
+        Save the post and perform validation checks before saving. If the slug is not set, generate it from the title,
+        adding the next free suffix from the title's SlugCounter when the title has been used before.
+        Saving an existing post increments its version.
+        The excerpt is taken from the text.
+        """
+        self.excerpt = make_excerpt(self.text)
+        if self._state.adding:
+            # created_at is only set during the insert, the current time gives the same hot ranking
+            for field, value in post_rankings(self.upvote_count, self.downvote_count, timezone.now()).items():
+                setattr(self, field, value)
+        if self.slug:
+            self.full_clean()
+            save_new_version(self, super(Post, self).save, *args, **kwargs)
+            return
+
+        from .slugs import SLUG_ATTEMPTS, allocate_slug
+        # Uniqueness of the generated slug is left to the database, a concurrent post may take the same slug
+        self.full_clean(exclude=["slug"])
+        base = slugify(self.title)
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = allocate_slug(base)
+            try:
+                with transaction.atomic():
+                    super(Post, self).save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Other constraint failures, e.g. a missing user, are not retried
+                if not Post.objects.filter(slug=self.slug).exists():
+                    self.slug = ""
+                    raise
+                # The slug was taken by a post whose own title slugifies to it, e.g. "Tenant rights 2"
+                self.slug = ""
+                if attempt == SLUG_ATTEMPTS - 1:
+                    raise
 
     def delete(self, using=None, keep_parents=False):
         """
@@ -109,11 +368,7 @@ class Post(models.Model):
         Get all comments for this post in descending order of creation
         :return:  QuerySet of Comment objects
         """
-        return (
-            Comment.objects.filter(post=self)
-            .filter(is_deleted=False)
-            .order_by("-created_at")
-        )
+        return Comment.objects.for_listing().filter(post=self)
 
     def clean(self):
         """
@@ -140,35 +395,25 @@ class Post(models.Model):
 
     def upvote(self, user):
         """
-        Upvote the post by the user. If the user has already upvoted the post, update the vote type.
+        Upvote the post by the user. If the user has already downvoted the post, update the vote type.
         :param user: User object
         :return: None
         """
-        with transaction.atomic():
-            post_vote, created = PostVote.objects.select_for_update().get_or_create(
-                user=user, post=self, vote_type=PostVote.VoteType.UPVOTE
-            )
-            if not created and post_vote.vote_type != PostVote.VoteType.UPVOTE:
-                post_vote.vote_type = PostVote.VoteType.UPVOTE
-                post_vote.save()
+        from .votes import cast_vote
+        cast_vote(self, user, PostVote.VoteType.UPVOTE)
 
     def downvote(self, user):
         """
-        Downvote the post by the user. If the user has already downvoted the post, update the vote type.
+        Downvote the post by the user. If the user has already upvoted the post, update the vote type.
         :param user: User object
         :return: None
         """
-        with transaction.atomic():
-            post_vote, created = PostVote.objects.select_for_update().get_or_create(
-                user=user, post=self, vote_type=PostVote.VoteType.DOWNVOTE
-            )
-            if not created and post_vote.vote_type != PostVote.VoteType.DOWNVOTE:
-                post_vote.vote_type = PostVote.VoteType.DOWNVOTE
-                post_vote.save()
+        from .votes import cast_vote
+        cast_vote(self, user, PostVote.VoteType.DOWNVOTE)
 
     def get_upvotes(self):
         """
-        Get the number of upvotes for the post
+        Count the upvotes for the post from the vote table
         :return: int representing the number of upvotes
         """
         return PostVote.objects.filter(
@@ -177,7 +422,7 @@ class Post(models.Model):
 
     def get_downvotes(self):
         """
-        Get the number of downvotes for the post
+        Count the downvotes for the post from the vote table
         :return: int representing the number of downvotes
         """
         return PostVote.objects.filter(
@@ -195,26 +440,78 @@ class Comment(models.Model):
     - text: Text of the comment
     - created_at: Date and time the comment was created
     - is_deleted: Boolean field indicating if the comment is deleted
+    - upvote_count, downvote_count, score: Vote counters, kept in step with CommentVote rows when voting
+    - parent: Comment this comment replies to, empty for comments made directly on the post
+    - thread: Root comment of the thread the comment belongs to, itself for root comments
+    - path: IDs of the comment's ancestors and of the comment, each zero padded to PATH_STEP digits. Sorting a
+      thread by path lists every comment followed by its replies
+    - depth: Number of ancestors of the comment
+    - updated_at: Date and time the comment or its vote counters last changed
+    - version: Incremented whenever the row changes, keys the comment's cached template fragment
     """
     class Meta:
         verbose_name = "Comment"
         verbose_name_plural = "Comments"
         db_table = "comments"
+        indexes = [
+            # A post's visible comments, serving their count, and a user's recent comments
+            models.Index(
+                fields=["post", "-created_at", "-comment_id"], name="comments_visible_created_idx", condition=VISIBLE
+            ),
+            models.Index(fields=["user", "-created_at"], name="comments_user_created_idx", condition=VISIBLE),
+            # Pages of a post's threads, newest or top first. Deleted root comments are included, they are kept
+            # as placeholders while their threads have visible replies
+            models.Index(
+                fields=["post", "-created_at", "-comment_id"],
+                name="comments_roots_created_idx",
+                condition=Q(parent__isnull=True),
+            ),
+            models.Index(
+                fields=["post", "-score", "-comment_id"],
+                name="comments_roots_score_idx",
+                condition=Q(parent__isnull=True),
+            ),
+            # Loading a thread or a subtree in thread order
+            models.Index(fields=["thread", "path"], name="comments_thread_path_idx"),
+            # Time of the last change to a post's comments, for conditional requests
+            models.Index(fields=["post", "updated_at"], name="comments_post_updated_idx"),
+        ]
 
     comment_id = models.AutoField(primary_key=True)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     text = models.TextField(max_length=4000)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+    score = models.IntegerField(default=0)
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies")
+    thread = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    path = models.CharField(max_length=PATH_STEP * MAX_COMMENT_DEPTH, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
+    # Fields only changed by voting, see forum/votes.py
+    vote_fields = VOTE_COUNTER_FIELDS
 
     @property
     def votes(self):
         """
-        Calculate the total votes of the comment
+        Get the total votes of the comment from its vote counters
         :return: int representing the total votes
         """
-        return self.get_upvotes() - self.get_downvotes()
+        return self.score
+
+    @property
+    def can_reply(self):
+        """
+        Whether the thread has room for replies to the comment
+        :return: bool
+        """
+        return self.depth + 1 < MAX_COMMENT_DEPTH
 
     def clean(self):
         """
@@ -229,14 +526,33 @@ class Comment(models.Model):
             raise ValidationError(
                 _("Comment cannot exceed 40000 characters."), code="invalid"
             )
+        if self.parent is not None:
+            if self.parent.post_id != self.post_id:
+                raise ValidationError(_("Replies must be on the same post."), code="invalid")
+            if self.parent.depth + 1 >= MAX_COMMENT_DEPTH:
+                raise ValidationError(_("This thread cannot be nested any deeper."), code="invalid")
         return cleaned_data
 
     def save(self, *args, **kwargs):
         """
-        Save the comment and perform validation checks before saving
+        Save the comment and perform validation checks before saving.
+        A new comment is placed in its parent's thread, its path is set once its ID is known.
+        Saving an existing comment increments its version.
         """
         self.full_clean()
-        super(Comment, self).save(*args, **kwargs)
+        if self.path:
+            save_new_version(self, super(Comment, self).save, *args, **kwargs)
+            return
+
+        if self.parent is not None:
+            self.depth = self.parent.depth + 1
+            self.thread_id = self.parent.thread_id
+        with transaction.atomic():
+            super(Comment, self).save(*args, **kwargs)
+            if self.parent is None:
+                self.thread_id = self.pk
+            self.path = (self.parent.path if self.parent is not None else "") + str(self.pk).zfill(PATH_STEP)
+            Comment.objects.filter(pk=self.pk).update(path=self.path, thread_id=self.thread_id)
 
     def delete(self, using=None, keep_parents=False):
         """
@@ -257,41 +573,25 @@ class Comment(models.Model):
 
     def upvote(self, user):
         """
-        Upvote the comment by the user. If the user has already upvoted the comment, update the vote type.
+        Upvote the comment by the user. If the user has already downvoted the comment, update the vote type.
         :param user: User object
         :return: None
         """
-        with transaction.atomic():
-            (
-                comment_vote,
-                created,
-            ) = CommentVote.objects.select_for_update().get_or_create(
-                user=user, comment=self, vote_type=CommentVote.VoteType.UPVOTE
-            )
-            if not created and comment_vote.vote_type != CommentVote.VoteType.UPVOTE:
-                comment_vote.vote_type = CommentVote.VoteType.UPVOTE
-                comment_vote.save()
+        from .votes import cast_vote
+        cast_vote(self, user, CommentVote.VoteType.UPVOTE)
 
     def downvote(self, user):
         """
-        Downvote the comment by the user. If the user has already downvoted the comment, update the vote type.
+        Downvote the comment by the user. If the user has already upvoted the comment, update the vote type.
         :param user: User object
         :return: None
         """
-        with transaction.atomic():
-            (
-                comment_vote,
-                created,
-            ) = CommentVote.objects.select_for_update().get_or_create(
-                user=user, comment=self, vote_type=CommentVote.VoteType.DOWNVOTE
-            )
-            if not created and comment_vote.vote_type != CommentVote.VoteType.DOWNVOTE:
-                comment_vote.vote_type = CommentVote.VoteType.DOWNVOTE
-                comment_vote.save()
+        from .votes import cast_vote
+        cast_vote(self, user, CommentVote.VoteType.DOWNVOTE)
 
     def get_upvotes(self):
         """
-        Get the number of upvotes for the comment
+        Count the upvotes for the comment from the vote table
         :return: int representing the number of upvotes
         """
         return CommentVote.objects.filter(
@@ -300,7 +600,7 @@ class Comment(models.Model):
 
     def get_downvotes(self):
         """
-        Get the number of downvotes for the comment
+        Count the downvotes for the comment from the vote table
         :return: int representing the number of downvotes
         """
         return CommentVote.objects.filter(
@@ -449,3 +749,179 @@ class CommentVote(Vote):
         """
         self.full_clean()
         super(CommentVote, self).save(*args, **kwargs)
+
+
+class SlugCounter(models.Model):
+    """
+    SlugCounter model recording the last suffix given to post slugs generated from the same title, so that a
+    free slug is found with one statement however often the title is reused.
+    Fields:
+    - base: Slug generated from the title, without a suffix
+    - count: Last suffix given out, 0 when only the base slug has been used
+    """
+    class Meta:
+        verbose_name = "Slug Counter"
+        verbose_name_plural = "Slug Counters"
+        db_table = "slug_counters"
+
+    base = models.SlugField(max_length=256, primary_key=True)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """
+        String representation of the counter
+        :return: Base slug and last suffix
+        """
+        return f"{self.base} ({self.count})"
+
+
+class RelatedPostQuerySet(models.QuerySet):
+    """
+    QuerySet for related posts
+    """
+
+    def for_post(self, post):
+        """
+        The visible posts related to a post, most similar first, with one query on the (post, score) index
+        :param post: Post object
+        :return: QuerySet of RelatedPost objects with their related post's title and slug loaded
+        """
+        return (
+            self.filter(post=post, related__is_deleted=False)
+            .select_related("related")
+            .only("score", "related__title", "related__slug")
+            .order_by("-score")
+        )
+
+
+class RelatedPost(models.Model):
+    """
+    RelatedPost model linking a post to one of the posts most similar to it by the TF-IDF vectors of their text.
+    Rows are written by the related_posts management command, pages only read them.
+    Fields:
+    - post: Post the link is shown on
+    - related: Similar post
+    - score: Cosine similarity of the two posts
+    """
+    class Meta:
+        verbose_name = "Related Post"
+        verbose_name_plural = "Related Posts"
+        db_table = "related_posts"
+        unique_together = ["post", "related"]
+        indexes = [
+            models.Index(fields=["post", "-score"], name="related_posts_score_idx"),
+        ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="related_posts")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    objects = RelatedPostQuerySet.as_manager()
+
+    def __str__(self):
+        """
+        String representation of the link
+        :return: IDs of the two posts and their similarity
+        """
+        return f"{self.post_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class RelatedTerm(models.Model):
+    """
+    RelatedTerm model storing a word of the vocabulary of the last full computation of related posts, so that
+    new posts are turned into vectors comparable with the stored ones.
+    Fields:
+    - term: The word
+    - column: Column of the word in the TF-IDF vectors
+    - idf: Inverse document frequency of the word
+    """
+    class Meta:
+        verbose_name = "Related Term"
+        verbose_name_plural = "Related Terms"
+        db_table = "related_terms"
+
+    term = models.CharField(max_length=100, primary_key=True)
+    column = models.PositiveIntegerField(unique=True)
+    idf = models.FloatField()
+
+    def __str__(self):
+        """
+        String representation of the term
+        :return: The word and its inverse document frequency
+        """
+        return f"{self.term} ({self.idf:.3f})"
+
+
+class PostVector(models.Model):
+    """
+    PostVector model storing the TF-IDF vector of a post whose related posts have been computed. Every computed
+    post has one, so the newest of them marks where the next incremental computation starts.
+    Fields:
+    - post: Post the vector belongs to
+    - vector: Columns of the vector's non-zero values as little-endian 32 bit integers, followed by the values
+      as little-endian 32 bit floats
+    """
+    class Meta:
+        verbose_name = "Post Vector"
+        verbose_name_plural = "Post Vectors"
+        db_table = "post_vectors"
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="+")
+    vector = models.BinaryField()
+
+    def __str__(self):
+        """
+        String representation of the vector
+        :return: ID of the post
+        """
+        return f"Vector of post {self.post_id}"
+
+
+class PostSignature(models.Model):
+    """
+    PostSignature model storing the MinHash signature of a visible post's words.
+    Fields:
+    - post: Post the signature belongs to
+    - signature: Minimum hash of each permutation, as little-endian unsigned 32 bit integers
+    """
+    class Meta:
+        verbose_name = "Post Signature"
+        verbose_name_plural = "Post Signatures"
+        db_table = "post_signatures"
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="signature")
+    signature = models.BinaryField()
+
+    def __str__(self):
+        """
+        String representation of the signature
+        :return: ID of the post
+        """
+        return f"Signature of post {self.post_id}"
+
+
+class PostBand(models.Model):
+    """
+    PostBand model storing the key of one band of a post's MinHash signature. Posts sharing a key are candidate
+    near-duplicates.
+    Fields:
+    - post: Post the band belongs to
+    - key: Hash of the band's number and values
+    """
+    class Meta:
+        verbose_name = "Post Band"
+        verbose_name_plural = "Post Bands"
+        db_table = "post_bands"
+        indexes = [
+            models.Index(fields=["key"], name="post_bands_key_idx"),
+        ]
+
+    post = models.ForeignKey(PostSignature, on_delete=models.CASCADE, related_name="bands")
+    key = models.BigIntegerField()
+
+    def __str__(self):
+        """
+        String representation of the band
+        :return: ID of the post and the band's key
+        """
+        return f"{self.post_id}: {self.key}"
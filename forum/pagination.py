@@ -0,0 +1,255 @@
+"""
+Keyset (cursor) pagination for forum listings.
+
+Django's Paginator counts every row and then skips OFFSET rows to reach a page, so deep pages get slower as the
+forum grows. KeysetPaginator instead continues from the last row of the previous page with a WHERE clause on the
+ordering columns, which the database answers from an index at any depth. Pages are addressed by opaque cursor
+tokens. The first few pages can still be requested with ?page=, which uses a small OFFSET and no COUNT.
+
+Author: Georgios Tsakoumakis
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Ordering of the forum listing, the primary key makes the ordering unique
+NEWEST_FIRST = ("-created_at", "-post_id")
+# Orderings of a post's comments, selected with ?sort=
+COMMENT_ORDERINGS = {
+    "new": ("-created_at", "-comment_id"),
+    "top": ("-score", "-comment_id"),
+}
+# Number of comments rendered with a post and loaded by each "Load more comments"
+COMMENTS_PER_PAGE = 20
+# Highest page number that can be requested with ?page=
+MAX_PAGE_NUMBER = 5
+
+
+def encode_cursor(direction, values, number):
+    """
+    Build an opaque cursor token
+    :param direction: "next" to continue after the given row, "prev" to continue before it
+    :param values: Values of the ordering fields of the row
+    :param number: Page number of the page the cursor leads to
+    :return: str
+    """
+    # isoformat keeps the microseconds of datetimes, which DjangoJSONEncoder would round to milliseconds
+    values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    data = json.dumps([direction, number, values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Read a cursor token built by encode_cursor
+    :param token: Cursor token
+    :raises ValueError: If the token is malformed
+    :return: tuple(str, list, int) - direction, values of the ordering fields and page number
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, number, values = json.loads(data.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if direction not in ("next", "prev") or not isinstance(values, list) or not isinstance(number, int):
+        raise ValueError("Invalid cursor")
+    return direction, values, number
+
+
+def cached_count(count, key, timeout=300):
+    """
+    Count results, reusing the result for a while. Used to show an estimate of the
+    number of results without counting on every page.
+    :param count: Callable returning the number of results, for example QuerySet.count
+    :param key: String identifying what is counted, hashed into the cache key
+    :param timeout: Seconds the count is kept for
+    :return: int
+    """
+    cache_key = "forum-count:" + hashlib.sha256(key.encode("utf-8")).hexdigest()
+    cached = cache.get(cache_key)
+    if cached is None:
+        result = count()
+        cache.set(cache_key, result, timeout)
+        return result
+    return cached
+
+
+class KeysetPage:
+    """
+    A page of results with the cursor tokens leading to its neighbours.
+    """
+
+    def __init__(self, items, number, has_previous, has_next, paginator):
+        self.object_list = items
+        self.number = number
+        self.has_previous_page = has_previous
+        self.has_next_page = has_next
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_other_pages(self):
+        return self.has_previous_page or self.has_next_page
+
+    @property
+    def previous_cursor(self):
+        """
+        Token of the previous page, or None on the first page
+        """
+        if not self.has_previous_page:
+            return None
+        return encode_cursor("prev", self.paginator.key(self.object_list[0]), self.number - 1)
+
+    @property
+    def next_cursor(self):
+        """
+        Token of the next page, or None on the last page
+        """
+        if not self.has_next_page:
+            return None
+        return encode_cursor("next", self.paginator.key(self.object_list[-1]), self.number + 1)
+
+
+class KeysetPaginator:
+    """
+    Paginate an ordered queryset by continuing from the ordering values of a boundary row.
+    """
+
+    def __init__(self, queryset, per_page, ordering=NEWEST_FIRST, max_page_number=MAX_PAGE_NUMBER):
+        """
+        :param queryset: QuerySet to paginate
+        :param per_page: Number of items per page
+        :param ordering: Field names to order by, prefixed with "-" for descending order. The last field must be
+            unique, usually the primary key
+        :param max_page_number: Highest page number that can be requested by number instead of by cursor
+        """
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [field.lstrip("-") for field in ordering]
+        self.max_page_number = max_page_number
+
+    def key(self, item):
+        """
+        Get the ordering values of an item
+        :param item: Model instance from the queryset
+        :return: list
+        """
+        return [getattr(item, field) for field in self.fields]
+
+    def parse_key(self, values):
+        """
+        Convert ordering values read from a cursor back to Python values
+        :param values: List of JSON values
+        :raises ValueError: If the values do not match the ordering fields
+        :return: list
+        """
+        if len(values) != len(self.fields):
+            raise ValueError("Invalid cursor")
+        meta = self.queryset.model._meta
+        try:
+            return [meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except ValidationError as error:
+            raise ValueError("Invalid cursor") from error
+
+    def after(self, values, reverse=False):
+        """
+        Build the filter selecting the rows that come after a row in the ordering (before it if reverse is set).
+        For ordering (a, b) this is a > x OR (a = x AND b > y), with the comparisons flipped for descending fields.
+        :param values: Ordering values of the boundary row
+        :param reverse: Whether to select the rows before the boundary row instead
+        :return: Q object
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith("-")
+            lookup = "lt" if descending != reverse else "gt"
+            equal = {name: value for name, value in zip(self.fields[:index], values[:index])}
+            condition |= Q(**equal, **{f"{self.fields[index]}__{lookup}": values[index]})
+        return condition
+
+    def reversed_ordering(self):
+        """
+        Get the ordering with every direction flipped, used to read the rows before a cursor
+        :return: list of field names
+        """
+        return [field[1:] if field.startswith("-") else "-" + field for field in self.ordering]
+
+    def rows(self, limit, offset=0, values=None, reverse=False):
+        """
+        Fetch rows in the paginator's ordering. Subclasses can override this to paginate other sources.
+        :param limit: Maximum number of rows
+        :param offset: Number of rows to skip
+        :param values: Ordering values of a boundary row, only rows after it are returned
+        :param reverse: Whether to return the rows before the boundary row, closest first
+        :return: list
+        """
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self.after(values, reverse))
+        ordering = self.reversed_ordering() if reverse else self.ordering
+        return list(queryset.order_by(*ordering)[offset:offset + limit])
+
+    def first_pages(self, number):
+        """
+        Get one of the first pages by number, with a small OFFSET and no COUNT
+        :param number: Page number, clamped to between 1 and max_page_number
+        :return: KeysetPage
+        """
+        number = min(max(number, 1), self.max_page_number)
+        offset = (number - 1) * self.per_page
+        items = self.rows(self.per_page + 1, offset=offset)
+        if not items and number > 1:
+            # Past the end of the listing, show the first page instead of an empty one
+            return self.first_pages(1)
+        return KeysetPage(items[:self.per_page], number, number > 1, len(items) > self.per_page, self)
+
+    def page(self, cursor=None, number=None):
+        """
+        Get the page a cursor token leads to, or a page by number when there is no cursor.
+        Malformed cursors lead to the first page.
+        :param cursor: Cursor token from KeysetPage.next_cursor or previous_cursor
+        :param number: Page number from ?page=
+        :return: KeysetPage
+        """
+        try:
+            direction, values, page_number = decode_cursor(cursor) if cursor else (None, None, None)
+            values = self.parse_key(values) if cursor else None
+        except ValueError:
+            cursor = None
+
+        if not cursor:
+            try:
+                return self.first_pages(int(number or 1))
+            except (TypeError, ValueError):
+                return self.first_pages(1)
+
+        items = self.rows(self.per_page + 1, values=values, reverse=direction == "prev")
+        if not items:
+            # The rows around the cursor are gone, start again from the first page
+            return self.first_pages(1)
+
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == "next":
+            return KeysetPage(items, page_number, True, has_more, self)
+        items.reverse()
+        return KeysetPage(items, page_number if has_more else 1, has_more, True, self)
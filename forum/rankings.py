@@ -0,0 +1,101 @@
+"""
+Ranking of forum posts for the hot, top and controversial listings.
+
+Rankings are stored in indexed columns of the posts table, so a ranked page is read by scanning an index rather
+than by sorting every post on an expression. The vote service updates a post's rankings in the same statement
+that updates its vote counters.
+
+The hot ranking follows Reddit's: the order of magnitude of the score plus the age of the post in units of
+HOT_DECAY seconds. Newer posts start higher, so older posts sink without their rows being rewritten as time
+passes: a post needs ten times the score to keep up with one posted HOT_DECAY seconds later. The controversial
+ranking favours posts with many votes split evenly between upvotes and downvotes.
+
+The refresh_rankings command recomputes every post's rankings, for posts whose counters were corrected by
+reconcile_votes or after the formulas change.
+
+Author: Georgios Tsakoumakis
+"""
+
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+
+# Start of the hot ranking's time scale
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=dt_timezone.utc)
+# Seconds by which a post must be newer to rank as high as an older post with ten times its score
+HOT_DECAY = 45000
+RANKING_FIELDS = ["hot_rank", "controversy"]
+
+# Orderings of the forum listing, selected with ?sort=. The primary key makes each ordering unique
+SORTS = {
+    "new": ("-created_at", "-post_id"),
+    "hot": ("-hot_rank", "-post_id"),
+    "top": ("-score", "-post_id"),
+    "controversial": ("-controversy", "-post_id"),
+}
+# Sorts that can be limited to recent posts with ?t=
+WINDOWED_SORTS = {"top", "controversial"}
+# Periods of ?t=, None for all time
+WINDOWS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=30),
+    "year": timedelta(days=365),
+    "all": None,
+}
+
+
+def hot_rank(score, created_at):
+    """
+    Compute the hot ranking of a post
+    :param score: Upvotes minus downvotes
+    :param created_at: Date and time the post was created
+    :return: float
+    """
+    order = math.log10(max(abs(score), 1))
+    sign = (score > 0) - (score < 0)
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY, 7)
+
+
+def controversy(upvotes, downvotes):
+    """
+    Compute the controversial ranking of a post: the number of votes, raised to the ratio of the smaller side
+    to the larger one
+    :param upvotes: Number of upvotes
+    :param downvotes: Number of downvotes
+    :return: float - 0 when all votes are on one side
+    """
+    if upvotes <= 0 or downvotes <= 0:
+        return 0.0
+    balance = min(upvotes, downvotes) / max(upvotes, downvotes)
+    return float((upvotes + downvotes) ** balance)
+
+
+def post_rankings(upvotes, downvotes, created_at):
+    """
+    Compute every ranking of a post
+    :param upvotes: Number of upvotes
+    :param downvotes: Number of downvotes
+    :param created_at: Date and time the post was created
+    :return: dict mapping ranking fields to their values
+    """
+    return {
+        "hot_rank": hot_rank(upvotes - downvotes, created_at),
+        "controversy": controversy(upvotes, downvotes),
+    }
+
+
+def ranked_posts(queryset, sort, window=None):
+    """
+    Order posts for a listing
+    :param queryset: QuerySet of posts
+    :param sort: Key of SORTS
+    :param window: Key of WINDOWS, only used by WINDOWED_SORTS
+    :return: tuple(QuerySet, tuple) - posts, limited to the window, and the ordering to paginate them by
+    """
+    period = WINDOWS.get(window) if sort in WINDOWED_SORTS else None
+    if period is not None:
+        queryset = queryset.filter(created_at__gte=timezone.now() - period)
+    return queryset, SORTS[sort]
+
@@ -0,0 +1,319 @@
+"""
+Related posts, from TF-IDF vectors of the posts' text.
+
+Every visible post is turned into a TF-IDF vector over the words of its title and text, the title counting twice.
+Term frequencies are dampened with 1 + log(count) and vectors are scaled to unit length, so the similarity of two
+posts is the dot product of their vectors. The vectors of all posts form one SciPy sparse matrix, multiplied by
+its transpose in blocks of rows to find each post's RELATED_COUNT most similar posts. The results are stored as
+RelatedPost rows, so a post page reads its related posts with one indexed query and no similarity is computed
+while serving requests.
+
+The related_posts command recomputes every post's related posts, and stores the vocabulary with the inverse
+document frequency of each word (RelatedTerm) and the vector of each post (PostVector). With --new it only
+computes the posts newer than the newest post with a stored vector: they are turned into vectors with the stored
+vocabulary, compared with the stored vectors, and added to the related posts of the existing posts they are
+similar to. The text of the existing posts is not read again. Words that are not in the stored vocabulary are
+ignored until the next full computation. Every computed post gets a vector, even one without related posts, so
+it is not computed again.
+Deleted posts are left out of the vectors, pages skip links to posts deleted since.
+
+Author: Georgios Tsakoumakis
+"""
+
+import re
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Max
+from django.utils.html import strip_tags
+from .models import Post, PostVector, RelatedPost, RelatedTerm
+
+# Number of related posts stored for each post
+RELATED_COUNT = 5
+# Lowest similarity of two posts for them to be related
+MIN_SIMILARITY = 0.1
+# Number of posts whose similarities are computed at once
+BLOCK_SIZE = 250
+WORD = re.compile(r"[a-z0-9]{3,}")
+MAX_TERM_LENGTH = RelatedTerm._meta.get_field("term").max_length
+STOP_WORDS = frozenset(
+    """
+    about above after again against all also and any are because been before being below between both but can
+    could did does doing down during each few for from further had has have having her here hers him his how into
+    its just more most myself nor not now off once only other our ours out over own same she should some such
+    than that the their theirs them then there these they this those through too under until very was were what
+    when where which while who whom why will with would you your yours
+    """.split()
+)
+
+
+def tokenize(title, text):
+    """
+    Split a post into the words its vector is built from
+    :param title: Title of the post
+    :param text: Text of the post, which may contain HTML
+    :return: list of str - the title's words twice, then the text's words
+    """
+    words = WORD.findall(title.lower()) * 2 + WORD.findall(strip_tags(text).lower())
+    return [word for word in words if word not in STOP_WORDS and len(word) <= MAX_TERM_LENGTH]
+
+
+def count_matrix(documents, vocabulary, width=None):
+    """
+    Count the words of tokenized documents
+    :param documents: List of lists of words
+    :param vocabulary: Dict mapping words to columns
+    :param width: Number of columns of a stored vocabulary, whose missing words are ignored, or None to add
+        missing words to the vocabulary
+    :return: scipy.sparse.csr_matrix with one row per document
+    """
+    rows, columns, counts = [], [], []
+    for row, words in enumerate(documents):
+        for word, count in Counter(words).items():
+            if width is None:
+                column = vocabulary.setdefault(word, len(vocabulary))
+            else:
+                column = vocabulary.get(word)
+                if column is None:
+                    continue
+            rows.append(row)
+            columns.append(column)
+            counts.append(count)
+    return sparse.csr_matrix(
+        (np.array(counts, dtype=np.float64), (rows, columns)),
+        shape=(len(documents), len(vocabulary) if width is None else width),
+    )
+
+
+def weigh(matrix, idf):
+    """
+    Turn word counts into TF-IDF vectors of unit length
+    :param matrix: Word counts, as returned by count_matrix
+    :param idf: Inverse document frequency of each column
+    :return: scipy.sparse.csr_matrix
+    """
+    matrix = matrix.copy()
+    matrix.data = 1 + np.log(matrix.data)
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def tfidf_matrix(documents):
+    """
+    Build the TF-IDF vectors of tokenized documents
+    :param documents: List of lists of words
+    :return: tuple(scipy.sparse.csr_matrix, dict, numpy array) - one unit length row per document, the
+        vocabulary mapping words to columns and the inverse document frequency of each column
+    """
+    vocabulary = {}
+    counts = count_matrix(documents, vocabulary)
+    frequencies = np.bincount(counts.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + frequencies)) + 1
+    return weigh(counts, idf), vocabulary, idf
+
+
+def encode_vector(matrix, row):
+    """
+    :param matrix: scipy.sparse.csr_matrix
+    :param row: Index of a row
+    :return: bytes - stored form of the row
+    """
+    found = slice(matrix.indptr[row], matrix.indptr[row + 1])
+    return matrix.indices[found].astype("<i4").tobytes() + matrix.data[found].astype("<f4").tobytes()
+
+
+def decode_vector(data):
+    """
+    :param data: Stored form of a vector
+    :return: tuple(numpy array, numpy array) - columns and values of the vector
+    """
+    data = bytes(data)
+    size = len(data) // 8
+    return np.frombuffer(data, dtype="<i4", count=size), np.frombuffer(data, dtype="<f4", offset=size * 4)
+
+
+def stored_vectors(exclude, width):
+    """
+    Load the stored vectors of the visible posts
+    :param exclude: IDs of posts to leave out
+    :param width: Number of columns of the vectors
+    :return: tuple(list, scipy.sparse.csr_matrix) - post IDs and their vectors
+    """
+    ids, indptr, columns, values = [], [0], [], []
+    vectors = PostVector.objects.filter(post__is_deleted=False).exclude(post_id__in=exclude)
+    for post_id, data in vectors.values_list("post_id", "vector").iterator(chunk_size=2000):
+        row_columns, row_values = decode_vector(data)
+        ids.append(post_id)
+        columns.append(row_columns)
+        values.append(row_values)
+        indptr.append(indptr[-1] + len(row_columns))
+    matrix = sparse.csr_matrix(
+        (
+            np.concatenate(values).astype(np.float64) if values else np.zeros(0),
+            np.concatenate(columns) if columns else np.zeros(0, dtype=np.int32),
+            np.array(indptr),
+        ),
+        shape=(len(ids), width),
+    )
+    return ids, matrix
+
+
+def top_related(links):
+    """
+    Keep the most similar posts
+    :param links: Iterable of (post ID, similarity)
+    :return: list of (post ID, similarity), most similar first
+    """
+    return sorted(links, key=lambda link: (-link[1], link[0]))[:RELATED_COUNT]
+
+
+def new_post_ids():
+    """
+    Get the visible posts added since related posts were last computed: those newer than the newest post
+    with a stored vector
+    :return: list of post IDs
+    """
+    latest = PostVector.objects.aggregate(latest=Max("post_id"))["latest"] or 0
+    return list(Post.objects.visible().filter(post_id__gt=latest).values_list("post_id", flat=True))
+
+
+def find_related(matrix, ids, targets, incoming=None):
+    """
+    Find the most similar posts of some of the posts of a matrix
+    :param matrix: TF-IDF vectors of the posts
+    :param ids: Post ID of each row
+    :param targets: Rows of the posts to compute
+    :param incoming: Dict collecting, for each post, the targets similar to it, or None
+    :return: dict mapping the targets' post IDs to their related posts
+    """
+    links = {}
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(targets), BLOCK_SIZE):
+        block = targets[start:start + BLOCK_SIZE]
+        similarities = (matrix[block] @ transposed).tocsr()
+        for row, index in enumerate(block):
+            found = slice(similarities.indptr[row], similarities.indptr[row + 1])
+            columns, scores = similarities.indices[found], similarities.data[found]
+            keep = (columns != index) & (scores >= MIN_SIMILARITY)
+            columns, scores = columns[keep], scores[keep]
+            if incoming is not None:
+                for column, score in zip(columns.tolist(), scores.tolist()):
+                    incoming.setdefault(ids[column], []).append((ids[index], score))
+            if len(scores) > RELATED_COUNT:
+                best = np.argpartition(-scores, RELATED_COUNT)[:RELATED_COUNT]
+                columns, scores = columns[best], scores[best]
+            links[ids[index]] = top_related(zip([ids[column] for column in columns], scores.tolist()))
+    return links
+
+
+def store_links(links, replace_all=False):
+    """
+    Store the related posts of posts, replacing those stored before
+    :param links: Dict mapping post IDs to their related posts
+    :param replace_all: Whether the related posts of every other post are removed too
+    """
+    if replace_all:
+        RelatedPost.objects.all().delete()
+    else:
+        RelatedPost.objects.filter(post_id__in=links).delete()
+    RelatedPost.objects.bulk_create(
+        [
+            RelatedPost(post_id=post_id, related_id=related_id, score=score)
+            for post_id, related in links.items()
+            for related_id, score in related
+        ],
+        batch_size=1000,
+    )
+
+
+def compute_all():
+    """
+    Compute the related posts of every visible post, and store the vocabulary and vectors they were computed from
+    :return: int - number of posts whose related posts were stored
+    """
+    ids, documents = [], []
+    for post_id, title, text in Post.objects.visible().values_list("post_id", "title", "text").iterator():
+        ids.append(post_id)
+        documents.append(tokenize(title, text))
+    matrix, vocabulary, idf = tfidf_matrix(documents)
+    links = find_related(matrix, ids, list(range(len(ids)))) if ids else {}
+    with transaction.atomic():
+        RelatedTerm.objects.all().delete()
+        RelatedTerm.objects.bulk_create(
+            [RelatedTerm(term=term, column=column, idf=idf[column]) for term, column in vocabulary.items()],
+            batch_size=5000,
+        )
+        PostVector.objects.all().delete()
+        PostVector.objects.bulk_create(
+            [PostVector(post_id=post_id, vector=encode_vector(matrix, row)) for row, post_id in enumerate(ids)],
+            batch_size=1000,
+        )
+        store_links(links, replace_all=True)
+    return len(links)
+
+
+def compute_new(post_ids):
+    """
+    Compute the related posts of new posts from the stored vocabulary and vectors, and add each of them to the
+    related posts of the existing posts it is similar to
+    :param post_ids: IDs of the new posts
+    :return: int - number of posts whose related posts were stored
+    """
+    ids, documents = [], []
+    for post_id, title, text in Post.objects.visible().filter(pk__in=post_ids).values_list("post_id", "title", "text"):
+        ids.append(post_id)
+        documents.append(tokenize(title, text))
+    if not ids:
+        return 0
+    vocabulary, idf = {}, {}
+    words = set().union(*documents)
+    for term, column, term_idf in RelatedTerm.objects.filter(term__in=words).values_list("term", "column", "idf"):
+        vocabulary[term] = column
+        idf[column] = term_idf
+    width = (RelatedTerm.objects.aggregate(width=Max("column"))["width"] or 0) + 1
+    weights = np.zeros(width)
+    weights[list(idf)] = list(idf.values())
+    new = weigh(count_matrix(documents, vocabulary, width), weights)
+
+    existing_ids, existing = stored_vectors(ids, width)
+    matrix = sparse.vstack([existing, new]).tocsr()
+    all_ids = existing_ids + ids
+    incoming = {}
+    links = find_related(matrix, all_ids, list(range(len(existing_ids), len(all_ids))), incoming)
+
+    # Existing posts keep their related posts, joined by the new posts similar to them
+    incoming = {post_id: found for post_id, found in incoming.items() if post_id not in links}
+    if incoming:
+        current = {post_id: {} for post_id in incoming}
+        for post_id, related_id, score in RelatedPost.objects.filter(post_id__in=incoming).values_list(
+            "post_id", "related_id", "score"
+        ):
+            current[post_id][related_id] = score
+        for post_id, found in incoming.items():
+            current[post_id].update(found)
+            links[post_id] = top_related(current[post_id].items())
+
+    with transaction.atomic():
+        PostVector.objects.filter(post_id__in=ids).delete()
+        PostVector.objects.bulk_create(
+            [PostVector(post_id=post_id, vector=encode_vector(new, row)) for row, post_id in enumerate(ids)],
+            batch_size=1000,
+        )
+        store_links(links)
+    return len(links)
+
+
+def compute_related(post_ids=None):
+    """
+    Compute and store the related posts of posts. When only some posts are given, each of them is also added
+    to the related posts of the existing posts it is similar to. Without a stored vocabulary every post is
+    computed.
+    :param post_ids: IDs of the posts to compute, None for every visible post
+    :return: int - number of posts whose related posts were stored
+    """
+    if post_ids is None or not RelatedTerm.objects.exists():
+        return compute_all()
+    return compute_new(post_ids)
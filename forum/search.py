@@ -0,0 +1,407 @@
+"""
+Full-text search over forum posts and their comments.
+
+On PostgreSQL the posts and comments tables carry generated tsvector columns with partial GIN indexes that leave
+out deleted rows. Under the SQLite test/experimental configuration FTS5 tables mirror the searched text and are
+kept current by the signal handlers in forum/signals.py. Both are created by migration 0005_post_search.
+
+A post matches when its title, its text or one of its comments matches. Title matches rank above text matches,
+which rank above comment matches, and each result carries a highlighted snippet of the best matching text. Only
+the SEARCH_CANDIDATES best matching posts and the SEARCH_CANDIDATES best matching comments are ranked, so a
+common word does not aggregate every match on each page. Posts only matching past them are neither listed nor
+counted.
+Pages of matches are cached under a version number that is bumped whenever posts or comments are created or
+deleted, see forum/signals.py. The version is kept in the cache shared by every worker process (CACHES in the
+settings), so a bump in one worker invalidates the results cached by all of them.
+
+Author: Georgios Tsakoumakis
+"""
+
+import hashlib
+import json
+import time
+from functools import cached_property
+from django.core.cache import cache
+from django.db import connection
+from justitia.search import (
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
+    SNIPPET_WORDS,
+    fts5_query,
+    headline_options,
+    highlight,
+)
+from .models import Post
+from .pagination import KeysetPaginator, cached_count
+
+# Weight of comment matches relative to matches in the post itself
+COMMENT_WEIGHT = 0.5
+# Seconds a page of search results is cached for
+SEARCH_CACHE_TIMEOUT = 600
+SEARCH_VERSION_KEY = "forum-search-version"
+# Number of best matching posts, and of best matching comments, whose ranks are summed into results
+SEARCH_CANDIDATES = 1000
+
+# Ranks are summed per post, so a post matching in several places ranks higher. The best matching posts and
+# comments are picked first, so only they are aggregated and paginated.
+# {condition} and {order} are filled in by search_posts for keyset pagination.
+POSTGRES_SEARCH_SQL = """
+    WITH search AS (SELECT websearch_to_tsquery('english', %s) AS query),
+    post_hits AS (
+        SELECT p.post_id, NULL::integer AS comment_id, ts_rank_cd(p.search_vector, search.query)::float8 AS rank
+        FROM posts p, search
+        WHERE p.search_vector @@ search.query AND NOT p.is_deleted
+        ORDER BY rank DESC, p.post_id DESC
+        LIMIT %s
+    ),
+    comment_hits AS (
+        SELECT c.post_id, c.comment_id, ts_rank_cd(c.search_vector, search.query)::float8 * %s AS rank
+        FROM comments c, search
+        WHERE c.search_vector @@ search.query AND NOT c.is_deleted
+        ORDER BY rank DESC, c.comment_id DESC
+        LIMIT %s
+    ),
+    hits AS (
+        SELECT * FROM post_hits
+        UNION ALL
+        SELECT * FROM comment_hits
+    ),
+    ranked AS (
+        SELECT hits.post_id, SUM(hits.rank) AS rank,
+               (array_agg(hits.comment_id ORDER BY hits.comment_id IS NOT NULL, hits.rank DESC))[1] AS comment_id
+        FROM hits
+        JOIN posts p ON p.post_id = hits.post_id AND NOT p.is_deleted
+        GROUP BY hits.post_id
+    ),
+    page AS (
+        SELECT * FROM ranked
+        WHERE {condition}
+        ORDER BY {order}
+        LIMIT %s OFFSET %s
+    )
+    SELECT page.post_id, page.rank, page.comment_id,
+           ts_headline('english', COALESCE(c.text, p.text), search.query, %s) AS snippet
+    FROM page
+    JOIN posts p ON p.post_id = page.post_id
+    LEFT JOIN comments c ON c.comment_id = page.comment_id
+    CROSS JOIN search
+    ORDER BY {order}
+"""
+
+POSTGRES_COUNT_SQL = """
+    WITH search AS (SELECT websearch_to_tsquery('english', %s) AS query),
+    post_hits AS (
+        SELECT p.post_id FROM posts p, search
+        WHERE p.search_vector @@ search.query AND NOT p.is_deleted
+        ORDER BY ts_rank_cd(p.search_vector, search.query) DESC, p.post_id DESC
+        LIMIT %s
+    ),
+    comment_hits AS (
+        SELECT c.post_id FROM comments c, search
+        WHERE c.search_vector @@ search.query AND NOT c.is_deleted
+        ORDER BY ts_rank_cd(c.search_vector, search.query) DESC, c.comment_id DESC
+        LIMIT %s
+    )
+    SELECT COUNT(DISTINCT hits.post_id)
+    FROM (SELECT post_id FROM post_hits UNION ALL SELECT post_id FROM comment_hits) hits
+    JOIN posts p ON p.post_id = hits.post_id AND NOT p.is_deleted
+"""
+
+# bm25() is lower for better matches, so it is negated to rank higher matches first like ts_rank_cd.
+# The bare snippet column is taken from the row holding MAX(rank), the best match of each post.
+SQLITE_SEARCH_SQL = """
+    WITH hits AS (
+        SELECT * FROM (
+            SELECT rowid AS post_id, NULL AS comment_id, -bm25(posts_fts, 2.0, 1.0) AS rank,
+                   snippet(posts_fts, 1, %s, %s, '...', %s) AS snippet
+            FROM posts_fts
+            WHERE posts_fts MATCH %s
+            ORDER BY bm25(posts_fts, 2.0, 1.0), rowid DESC
+            LIMIT %s
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT c.post_id, c.comment_id, -bm25(comments_fts) * %s AS rank,
+                   snippet(comments_fts, 0, %s, %s, '...', %s) AS snippet
+            FROM comments_fts
+            JOIN comments c ON c.comment_id = comments_fts.rowid
+            WHERE comments_fts MATCH %s AND NOT c.is_deleted
+            ORDER BY bm25(comments_fts), c.comment_id DESC
+            LIMIT %s
+        )
+    ),
+    ranked AS (
+        SELECT hits.post_id, SUM(hits.rank) AS rank, MAX(hits.rank) AS best, hits.comment_id, hits.snippet
+        FROM hits
+        JOIN posts p ON p.post_id = hits.post_id AND NOT p.is_deleted
+        GROUP BY hits.post_id
+    )
+    SELECT post_id, rank, comment_id, snippet FROM ranked
+    WHERE {condition}
+    ORDER BY {order}
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_COUNT_SQL = """
+    SELECT COUNT(DISTINCT hits.post_id) FROM (
+        SELECT * FROM (
+            SELECT rowid AS post_id FROM posts_fts
+            WHERE posts_fts MATCH %s
+            ORDER BY bm25(posts_fts, 2.0, 1.0), rowid DESC
+            LIMIT %s
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT c.post_id FROM comments_fts
+            JOIN comments c ON c.comment_id = comments_fts.rowid
+            WHERE comments_fts MATCH %s AND NOT c.is_deleted
+            ORDER BY bm25(comments_fts), c.comment_id DESC
+            LIMIT %s
+        )
+    ) hits
+    JOIN posts p ON p.post_id = hits.post_id AND NOT p.is_deleted
+"""
+
+
+def normalise_query(query):
+    """
+    Normalise a search so that searches differing only in case or spacing share cached results
+    :param query: Search text entered by the user
+    :return: str
+    """
+    return " ".join((query or "").lower().split())
+
+
+def search_version():
+    """
+    Get the current version of the search results. Cached results are stored under the version they were
+    computed at, so bumping the version invalidates all of them at once.
+    :return: int
+    """
+    version = cache.get(SEARCH_VERSION_KEY)
+    if version is None:
+        # Start from the current time so a lost version never resurrects results cached under an old one
+        cache.add(SEARCH_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(SEARCH_VERSION_KEY)
+    return version
+
+
+def bump_search_version():
+    """
+    Invalidate all cached search results, called when posts or comments are created or deleted
+    """
+    try:
+        cache.incr(SEARCH_VERSION_KEY)
+    except ValueError:
+        cache.set(SEARCH_VERSION_KEY, time.time_ns(), None)
+
+
+def search_rows(query, limit, offset=0, after=None, reverse=False):
+    """
+    Run a search in the database
+    :param query: Normalised search text
+    :param limit: Maximum number of results
+    :param offset: Number of results to skip
+    :param after: (rank, post_id) of a result, only results ranked after it are returned
+    :param reverse: Whether to return the results ranked before "after" instead, closest first
+    :return: list of (post_id, rank, matched comment_id, snippet) tuples
+    """
+    condition, condition_params = "TRUE", []
+    if after is not None:
+        comparison = ">" if reverse else "<"
+        condition = f"(rank {comparison} %s OR (rank = %s AND post_id {comparison} %s))"
+        condition_params = [after[0], after[0], after[1]]
+    order = "rank ASC, post_id ASC" if reverse else "rank DESC, post_id DESC"
+
+    if connection.vendor == "postgresql":
+        sql = POSTGRES_SEARCH_SQL.format(condition=condition, order=order)
+        params = [
+            query, SEARCH_CANDIDATES, COMMENT_WEIGHT, SEARCH_CANDIDATES,
+            *condition_params, limit, offset, headline_options(),
+        ]
+    else:
+        match = fts5_query(query)
+        if not match:
+            return []
+        sql = SQLITE_SEARCH_SQL.format(condition=condition, order=order)
+        snippet_params = [HIGHLIGHT_START, HIGHLIGHT_STOP, SNIPPET_WORDS]
+        params = [
+            *snippet_params, match, SEARCH_CANDIDATES,
+            COMMENT_WEIGHT, *snippet_params, match, SEARCH_CANDIDATES,
+            *condition_params, limit, offset,
+        ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def search_posts(query, limit=20, offset=0, after=None, reverse=False):
+    """
+    Search posts and their comments, best matches first. Deleted posts and comments are never matched.
+    Each result is a Post loaded like the forum listing, with extra "rank", "snippet" and "matched_comment_id"
+    attributes. The snippet is safe to render, matched_comment_id is None when the post itself matched.
+    The matches are cached by normalised query and position, the posts themselves are always loaded fresh.
+    :param query: Search text entered by the user
+    :param limit: Maximum number of results
+    :param offset: Number of results to skip
+    :param after: (rank, post_id) of a result, only results ranked after it are returned
+    :param reverse: Whether to return the results ranked before "after" instead, closest first
+    :return: list of Post objects
+    """
+    query = normalise_query(query)
+    if not query:
+        return []
+
+    position = json.dumps([query, limit, offset, after, reverse])
+    cache_key = f"forum-search:{search_version()}:" + hashlib.sha256(position.encode("utf-8")).hexdigest()
+    rows = cache.get(cache_key)
+    if rows is None:
+        rows = search_rows(query, limit, offset, after, reverse)
+        cache.set(cache_key, rows, SEARCH_CACHE_TIMEOUT)
+
+    posts = Post.objects.for_listing().in_bulk([row[0] for row in rows])
+    results = []
+    for post_id, rank, comment_id, snippet in rows:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        post.rank = rank
+        post.matched_comment_id = comment_id
+        post.snippet = highlight(snippet or "")
+        results.append(post)
+    return results
+
+
+def count_posts(query):
+    """
+    Count the posts listed by a search, those among the best matching posts and comments
+    :param query: Search text entered by the user
+    :return: int
+    """
+    query = normalise_query(query)
+    if not query:
+        return 0
+    if connection.vendor == "postgresql":
+        sql, params = POSTGRES_COUNT_SQL, [query, SEARCH_CANDIDATES, SEARCH_CANDIDATES]
+    else:
+        match = fts5_query(query)
+        if not match:
+            return 0
+        sql, params = SQLITE_COUNT_SQL, [match, SEARCH_CANDIDATES, match, SEARCH_CANDIDATES]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+def index_post(post):
+    """
+    Update the SQLite search index of a post. PostgreSQL indexes posts through a generated column.
+    :param post: Post object
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM posts_fts WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            "INSERT INTO posts_fts(rowid, title, text) VALUES (%s, %s, %s)",
+            [post.pk, post.title, post.text],
+        )
+
+
+def index_comment(comment):
+    """
+    Update the SQLite search index of a comment. PostgreSQL indexes comments through a generated column.
+    :param comment: Comment object
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM comments_fts WHERE rowid = %s", [comment.pk])
+        cursor.execute(
+            "INSERT INTO comments_fts(rowid, text) VALUES (%s, %s)",
+            [comment.pk, comment.text],
+        )
+
+
+def unindex(table, pk):
+    """
+    Remove a hard deleted post or comment from the SQLite search index
+    :param table: "posts_fts" or "comments_fts"
+    :param pk: Primary key of the deleted row
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+
+
+class SearchPaginator(KeysetPaginator):
+    """
+    Keyset paginator over search results, ordered by rank and post ID.
+    """
+
+    def __init__(self, query, per_page, **kwargs):
+        """
+        :param query: Search text entered by the user
+        :param per_page: Number of results per page
+        """
+        super().__init__(Post.objects.none(), per_page, ordering=("-rank", "-post_id"), **kwargs)
+        self.query = query
+
+    def parse_key(self, values):
+        """
+        Check the (rank, post_id) values read from a cursor
+        :param values: List of JSON values
+        :raises ValueError: If the values are not a rank and a post ID
+        :return: list
+        """
+        if len(values) != 2:
+            raise ValueError("Invalid cursor")
+        rank, post_id = values
+        if not isinstance(rank, (int, float)) or not isinstance(post_id, int):
+            raise ValueError("Invalid cursor")
+        return [rank, post_id]
+
+    def rows(self, limit, offset=0, values=None, reverse=False):
+        return search_posts(self.query, limit, offset, after=values, reverse=reverse)
+
+
+class ForumSearch:
+    """
+    Search requested by a page, evaluated lazily. Nothing is queried until the template reads the page
+    of results or the result count, and each is computed at most once per request.
+    """
+
+    def __init__(self, request, per_page=5):
+        """
+        :param request: Request object, the query is read from "q" and the cursor from "cursor" or "page"
+        :param per_page: Number of results per page
+        """
+        self.request = request
+        self.query = normalise_query(request.GET.get("q"))
+        self.per_page = per_page
+
+    def __bool__(self):
+        return bool(self.query)
+
+    @cached_property
+    def page(self):
+        """
+        Page of results selected by the request's cursor or page number
+        :return: KeysetPage
+        """
+        paginator = SearchPaginator(self.query, self.per_page)
+        return paginator.page(self.request.GET.get("cursor"), self.request.GET.get("page"))
+
+    @cached_property
+    def result_count(self):
+        """
+        Number of matching posts. It is counted once per query and reused while paging, so it is an estimate.
+        :return: int
+        """
+        if not self.query:
+            return 0
+        return cached_count(
+            lambda: count_posts(self.query), f"search:{search_version()}:{self.query}"
+        )
@@ -0,0 +1,71 @@
+"""
+Signal handlers keeping data derived from posts and comments up to date: the SQLite search index,
+the version of cached search results, the title autocomplete trie, the MinHash signatures used to find
+near-duplicate posts and the version and updated_at of a post, whose pages show its comment count. Buffered post
+views are written and the periodic rebuild of the autocomplete trie is started after requests.
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.core.signals import request_finished
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .autocomplete import title_trie
+from .duplicates import index_signatures, unindex_signature
+from .hits import hit_buffer
+from .models import Post, Comment
+from .search import bump_search_version, index_comment, index_post, unindex
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    index_post(instance)
+    if created or instance.is_deleted:
+        bump_search_version()
+    if instance.is_deleted:
+        unindex_signature(instance)
+    elif created or update_fields is None or not {"title", "text"}.isdisjoint(update_fields):
+        # Edited posts are compared by their new text
+        index_signatures([instance])
+    if title_trie.is_built:
+        if instance.is_deleted:
+            title_trie.remove(instance.pk)
+        else:
+            title_trie.add(instance.pk, instance.title, instance.slug)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    unindex("posts_fts", instance.pk)
+    bump_search_version()
+    title_trie.remove(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    index_comment(instance)
+    if created or instance.is_deleted:
+        bump_search_version()
+        Post.objects.filter(pk=instance.post_id).update(version=F("version") + 1, updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    unindex("comments_fts", instance.pk)
+    bump_search_version()
+    Post.objects.filter(pk=instance.post_id).update(version=F("version") + 1, updated_at=timezone.now())
+
+
+@receiver(request_finished)
+def flush_hits(sender, **kwargs):
+    # The response has been sent, so writing the views does not delay it
+    if hit_buffer.is_due():
+        hit_buffer.flush()
+
+
+@receiver(request_finished)
+def rebuild_title_trie(sender, **kwargs):
+    # Only starts the periodic rebuild, which runs in a background thread
+    title_trie.rebuild_if_due()
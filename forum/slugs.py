@@ -0,0 +1,40 @@
+"""
+Slug allocation for posts.
+
+Slugs are generated from titles, and reused titles get a numbered suffix ("tenant-rights", "tenant-rights-1", ...).
+The last suffix given out for each title is kept in the SlugCounter table. It is claimed with a single
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement, so finding a free slug takes one query however many
+posts share the title. The row lock taken by the upsert also stops concurrent creators from claiming the same
+suffix. A generated slug can still be taken by a post whose own title slugifies to it, so Post.save() retries
+with the next suffix when the insert fails.
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.db import connection
+from .models import SlugCounter
+
+# Number of slugs tried before giving up on saving a post
+SLUG_ATTEMPTS = 5
+# Room kept at the end of a slug for its suffix
+SUFFIX_LENGTH = 11
+
+
+def allocate_slug(base):
+    """
+    Claim the next free slug for a base slug
+    :param base: Slug generated from the post's title
+    :return: str - the base slug the first time it is used, the base slug with the next suffix afterwards
+    """
+    base = base[:SlugCounter._meta.get_field("base").max_length - SUFFIX_LENGTH]
+    quote = connection.ops.quote_name
+    table = quote(SlugCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (base, count) VALUES (%s, 0) "
+            f"ON CONFLICT (base) DO UPDATE SET count = {table}.count + 1 "
+            f"RETURNING count",
+            [base],
+        )
+        count = cursor.fetchone()[0]
+    return f"{base}-{count}" if count else base
@@ -5,6 +5,7 @@ Author: Georgios Tsakoumakis
 """
 
 from django import template
+from forum.models import make_excerpt
 
 register = template.Library()
 
@@ -12,7 +13,6 @@ register = template.Library()
 @register.filter(name="first_line")
 def first_line(value):
     """
-    Return the first 'char_limit' characters of the given text.
+    Return the first EXCERPT_LENGTH characters of the given text. Listings of posts show their stored excerpt.
     """
-    char_limit = 120
-    return value[:char_limit] + "..." if len(value) > char_limit else value
+    return make_excerpt(value)
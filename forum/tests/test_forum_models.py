@@ -4,11 +4,22 @@ Test cases for the forum models.
 Author: Ionut-Valeriu Facaeru
 """
 
+import time
 import unittest
+from unittest import mock
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from forum.models import Post, Comment, PostVote, CommentVote
+from forum.autocomplete import REBUILD_INTERVAL, TitleTrie
+from forum.duplicates import band_keys, find_duplicates, minhash
+from forum.models import Post, Comment, PostVote, CommentVote, RelatedPost, PostSignature, PostBand, PATH_STEP
+from forum.threads import load_replies, load_threads
+from forum.rankings import controversy, hot_rank
+from forum.related import compute_related, new_post_ids
+from forum.utils import reconcile_vote_counters, refresh_rankings
+from forum.votes import cast_vote, clear_vote
 
 # Get the CustomUser model
 CustomUser = get_user_model()
@@ -108,6 +119,153 @@ class PostModelTests(TestCase):
         )
         self.assertNotEqual(post1.slug, post2.slug)
 
+    def test_post_slug_reused_title(self):
+        """
+        TFM34: Test that reused titles get numbered slugs with a constant number of queries,
+        and that a slug taken by another title is skipped.
+        """
+        slugs = [Post.objects.create(title='Tenant rights', text='Valid text.', user=self.user).slug
+                 for _ in range(3)]
+        self.assertEqual(slugs, ['tenant-rights', 'tenant-rights-1', 'tenant-rights-2'])
+        Post.objects.create(title='Tenant rights 3', text='Valid text.', user=self.user)
+
+        with CaptureQueriesContext(connection) as first:
+            Post.objects.create(title='Tenant rights', text='Valid text.', user=self.user)
+        with CaptureQueriesContext(connection) as second:
+            post = Post.objects.create(title='Tenant rights', text='Valid text.', user=self.user)
+        self.assertEqual(post.slug, 'tenant-rights-5')
+        self.assertFalse([query for query in second if 'slug' in query['sql'] and 'SELECT' in query['sql']])
+        count = lambda queries: len([query for query in queries if 'SAVEPOINT' not in query['sql']])
+        # The first insert collided with "tenant-rights-3", was checked to be a slug clash and was retried
+        self.assertEqual(count(first), count(second) + 3)
+
+    def test_post_save_other_integrity_error(self):
+        """
+        TFM45: Test that constraint failures other than a slug clash are raised without retrying.
+        """
+        error = IntegrityError('FOREIGN KEY constraint failed')
+        with mock.patch('django.db.models.Model.save', side_effect=error) as save:
+            with self.assertRaises(IntegrityError):
+                Post.objects.create(title='Tenant rights', text='Valid text.', user=self.user)
+        self.assertEqual(save.call_count, 1)
+
+    def test_listings_use_partial_indexes(self):
+        """
+        TFM39: Test that listings of visible posts and comments are read in order from the partial indexes.
+        """
+        post = Post.objects.create(title='Valid title', text='Valid text.', user=self.user)
+        Comment.objects.create(post=post, user=self.user, text='Valid comment.')
+        plans = {
+            'posts_visible_created_idx': Post.objects.for_listing()[:5].explain(),
+            'posts_user_created_idx': Post.objects.for_listing().filter(user=self.user)[:3].explain(),
+            'comments_roots_created_idx': Comment.objects.displayed_roots().filter(post=post)
+            .order_by('-created_at', '-comment_id')[:21].explain(),
+            'comments_roots_score_idx': Comment.objects.displayed_roots().filter(post=post)
+            .order_by('-score', '-comment_id')[:21].explain(),
+            'comments_user_created_idx': Comment.objects.for_listing().filter(user=self.user)[:3].explain(),
+        }
+        for index, plan in plans.items():
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_post_excerpt(self):
+        """
+        TFM40: Test that the excerpt of a post follows its text when saving.
+        """
+        post = Post.objects.create(title='Valid title', text='Short text.', user=self.user)
+        self.assertEqual(post.excerpt, 'Short text.')
+        post.text = 'a' * 121
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, 'a' * 120 + '...')
+        post.delete()
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, '[deleted]')
+
+    def test_related_posts(self):
+        """
+        TFM41: Test that posts are related by their words, and that new posts are added incrementally from the stored
+        vectors, to their own related posts and to those of the existing posts.
+        """
+        def related(post):
+            return [link.related for link in RelatedPost.objects.for_post(post)]
+
+        deposit = Post.objects.create(title='Landlord kept my deposit',
+                                      text='My landlord refuses to return the tenancy deposit.', user=self.user)
+        returned = Post.objects.create(title='Deposit not returned',
+                                       text='The tenancy ended and the landlord still has my deposit.', user=self.user)
+        dismissal = Post.objects.create(title='Unfair dismissal',
+                                        text='I was dismissed from work without notice.', user=self.user)
+        self.assertEqual(compute_related(), 3)
+        self.assertEqual(related(deposit), [returned])
+        self.assertEqual(related(dismissal), [])
+
+        dispute = Post.objects.create(title='Tenancy deposit dispute',
+                                      text='How do I get my deposit back from the landlord?', user=self.user)
+        self.assertEqual(new_post_ids(), [dispute.pk])
+        # New posts are compared with the stored vectors, the text of the existing posts is not read again
+        Post.objects.filter(pk=deposit.pk).update(title='Parking fine', text='I got a parking fine.')
+        compute_related(new_post_ids())
+        self.assertEqual(set(related(dispute)), {deposit, returned})
+        self.assertIn(dispute, related(deposit))
+        self.assertEqual(new_post_ids(), [])
+        returned.delete()
+        self.assertEqual(related(deposit), [dispute])
+
+    def test_find_duplicates(self):
+        """
+        TFM42: Test that near-duplicates of a new post are found with one query, and unrelated and deleted posts
+        are not.
+        """
+        text = ('My landlord refuses to return the deposit although the flat was left clean and the tenancy '
+                'ended two months ago. What can I do to get the deposit back?')
+        original = Post.objects.create(title='Landlord kept my deposit', text=text, user=self.user)
+        Post.objects.create(title='Unfair dismissal', text='I was dismissed from work without notice.',
+                            user=self.user)
+        self.assertTrue(PostSignature.objects.filter(post=original).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            duplicates = find_duplicates('Landlord kept my deposit', text.replace('two months', 'three weeks'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([post for post, similarity in duplicates], [original])
+        self.assertGreaterEqual(duplicates[0][1], 0.6)
+        self.assertEqual(find_duplicates('Parking fine', 'I got a parking fine outside my own house.'), [])
+        self.assertEqual(find_duplicates('Landlord kept my deposit', text, exclude=original.pk), [])
+
+        original.delete()
+        self.assertFalse(PostSignature.objects.filter(post=original).exists())
+        self.assertEqual(find_duplicates('Landlord kept my deposit', text), [])
+
+    def test_find_duplicates_most_matching_bands(self):
+        """
+        TFM47: Test that when more posts share a band key than are compared, those sharing the most band keys are
+        compared first.
+        """
+        text = ('My landlord refuses to return the deposit although the flat was left clean and the tenancy '
+                'ended two months ago. What can I do to get the deposit back?')
+        key = min(band_keys(minhash('Landlord kept my deposit', text)))
+        for number in range(3):
+            other = Post.objects.create(title=f'Parking fine {number}', text='I got a parking fine.', user=self.user)
+            PostBand.objects.create(post_id=other.pk, key=key)
+        original = Post.objects.create(title='Landlord kept my deposit', text=text, user=self.user)
+        with mock.patch('forum.duplicates.MAX_CANDIDATES', 2):
+            duplicates = find_duplicates('Landlord kept my deposit', text)
+        self.assertEqual([post for post, similarity in duplicates], [original])
+
+    def test_find_duplicates_after_edit(self):
+        """
+        TFM49: Test that an edited post is compared by its new text when looking for near-duplicates.
+        """
+        text = ('My landlord refuses to return the deposit although the flat was left clean and the tenancy '
+                'ended two months ago. What can I do to get the deposit back?')
+        edited = ('I was dismissed from work without notice after asking for the overtime I am owed, and my '
+                  'employer will not explain why. Is this unfair dismissal and what can I do about it?')
+        post = Post.objects.create(title='Landlord kept my deposit', text=text, user=self.user)
+        post.title = 'Dismissed without notice'
+        post.text = edited
+        post.save()
+        self.assertEqual(find_duplicates('Landlord kept my deposit', text), [])
+        self.assertEqual([found for found, similarity in find_duplicates('Dismissed without notice', edited)],
+                         [post])
+
     def test_post_delete(self):
         """
         TFM8: Test deleting a post.
@@ -194,6 +352,77 @@ class CommentModelTests(TestCase):
         self.assertTrue(comment.is_deleted)
         self.assertEqual(comment.text, '[deleted]')
 
+    def test_comment_replies_form_threads(self):
+        """
+        TFM35: Test that replies are placed in their parent's thread and a thread loads in order with one query.
+        """
+        root = Comment.objects.create(post=self.post, user=self.user, text='Root')
+        first = Comment.objects.create(post=self.post, user=self.user, text='First reply', parent=root)
+        second = Comment.objects.create(post=self.post, user=self.user, text='Second reply', parent=root)
+        nested = Comment.objects.create(post=self.post, user=self.user, text='Nested reply', parent=first)
+        other = Comment.objects.create(post=self.post, user=self.user, text='Other thread')
+        self.assertEqual((root.thread_id, root.depth), (root.pk, 0))
+        self.assertEqual((nested.thread_id, nested.depth), (root.pk, 2))
+        self.assertEqual(nested.path, root.path + first.path[-PATH_STEP:] + nested.path[-PATH_STEP:])
+
+        with self.assertNumQueries(1):
+            thread = load_threads([other, root])
+        self.assertEqual(thread, [other, root, first, nested, second])
+        self.assertEqual([comment.depth for comment in thread], [0, 0, 1, 2, 1])
+        self.assertEqual(list(Comment.objects.subtree(first)), [nested])
+        self.assertEqual(list(Comment.objects.threads([root], max_depth=1)), [root, first, second])
+
+    def test_comment_thread_cut_and_deleted_replies(self):
+        """
+        TFM36: Test that deep threads are cut with their hidden replies loadable, and that deleted comments
+        are only kept while they have replies.
+        """
+        comment = root = Comment.objects.create(post=self.post, user=self.user, text='Root')
+        for depth in range(3):
+            comment = Comment.objects.create(post=self.post, user=self.user, text=f'Depth {depth + 1}',
+                                             parent=comment)
+        deleted_leaf = Comment.objects.create(post=self.post, user=self.user, text='Leaf', parent=root)
+        deleted_leaf.delete()
+        parent = Comment.objects.get(text='Depth 1')
+        parent.delete()
+
+        thread = load_threads([root], max_depth=2)
+        self.assertEqual([c.text for c in thread], ['Root', '[deleted]', 'Depth 2'])
+        self.assertTrue(thread[-1].has_more_replies)
+        self.assertEqual([c.text for c in load_replies(thread[-1])], ['Depth 3'])
+
+    def test_long_thread_continues(self):
+        """
+        TFM46: Test that long threads are cut after a number of comments, and that the rest is loaded page by
+        page from the last comment shown.
+        """
+        root = Comment.objects.create(post=self.post, user=self.user, text='Root')
+        for index in range(5):
+            Comment.objects.create(post=self.post, user=self.user, text=f'Reply {index}', parent=root)
+        other = Comment.objects.create(post=self.post, user=self.user, text='Other thread')
+
+        with self.assertNumQueries(1):
+            thread = load_threads([root, other], limit=3)
+        self.assertEqual([c.text for c in thread[:3]], ['Root', 'Reply 0', 'Reply 1'])
+        more = thread[3]
+        self.assertTrue(more.continues_thread)
+        self.assertEqual((more.comment_id, more.after, more.depth), (root.pk, thread[2].path, 1))
+        self.assertEqual([c.text for c in thread[4:]], ['Other thread'])
+
+        replies = load_replies(root, after=more.after, limit=2)
+        self.assertEqual([c.text for c in replies[:2]], ['Reply 2', 'Reply 3'])
+        self.assertTrue(replies[2].continues_thread)
+        self.assertEqual([c.text for c in load_replies(root, after=replies[2].after, limit=2)], ['Reply 4'])
+
+    def test_reply_must_be_on_same_post(self):
+        """
+        TFM37: Test that a reply to a comment on another post is rejected.
+        """
+        other_post = Post.objects.create(title='Other', text='Other text.', user=self.user)
+        root = Comment.objects.create(post=other_post, user=self.user, text='Root')
+        with self.assertRaises(ValidationError):
+            Comment.objects.create(post=self.post, user=self.user, text='Reply', parent=root)
+
 
 class PostVoteModelTests(TestCase):
     """
@@ -309,6 +538,114 @@ class PostVoteModelTests(TestCase):
         self.assertTrue(postvote1.vote_type)
         self.assertTrue(postvote2.vote_type)
 
+    def test_post_vote_counters(self):
+        """
+        TFM28: Test that voting keeps the post vote counters in step, including switching votes.
+        """
+        other_user = get_user_model().objects.create_user(
+            username='otheruser',
+            password='Password123!',
+            email='otheruser@example.com'
+        )
+        self.post.upvote(self.user)
+        self.post.upvote(other_user)
+        self.assertEqual((self.post.upvote_count, self.post.downvote_count, self.post.votes), (2, 0, 2))
+        self.post.downvote(self.user)
+        self.post.downvote(self.user)
+        self.assertEqual((self.post.upvote_count, self.post.downvote_count, self.post.votes), (1, 1, 0))
+        self.assertEqual(PostVote.objects.filter(post=self.post).count(), 2)
+
+    def test_save_keeps_concurrent_votes(self):
+        """
+        TFM43: Test that saving a post loaded before a vote keeps the vote's counters and rankings.
+        """
+        stale = Post.objects.get(pk=self.post.pk)
+        self.post.upvote(self.user)
+        voted = Post.objects.get(pk=self.post.pk)
+        stale.text = 'Edited text.'
+        stale.save()
+        saved = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(saved.text, 'Edited text.')
+        self.assertEqual((saved.upvote_count, saved.score, saved.hot_rank), (1, 1, voted.hot_rank))
+        self.assertEqual((stale.upvote_count, stale.score), (1, 1))
+
+    def test_reconcile_post_vote_counters(self):
+        """
+        TFM29: Test that reconciling fixes post vote counters that drifted from the vote table.
+        """
+        PostVote.objects.create(user=self.user, post=self.post, vote_type='down')
+        self.assertEqual(reconcile_vote_counters(Post), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.upvote_count, self.post.downvote_count, self.post.score), (0, 1, -1))
+        self.assertEqual(reconcile_vote_counters(Post), 0)
+
+    def test_reconcile_recounts_in_update(self):
+        """
+        TFM50: Test that reconciling recounts the votes within the UPDATE of each batch, without reading the
+        counts first.
+        """
+        second = Post.objects.create(title='Second post', text='Second text.', user=self.user)
+        PostVote.objects.create(user=self.user, post=self.post, vote_type='down')
+        PostVote.objects.create(user=self.user, post=second, vote_type='up')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reconcile_vote_counters(Post, batch_size=1), 2)
+        # Only the bounds of the primary keys are read
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+        second.refresh_from_db()
+        self.assertEqual((second.upvote_count, second.downvote_count, second.score), (1, 0, 1))
+        self.assertEqual(reconcile_vote_counters(Post, batch_size=1), 0)
+
+        comment = Comment.objects.create(post=self.post, user=self.user, text='Comment text.')
+        CommentVote.objects.create(user=self.user, comment=comment, vote_type='up')
+        self.assertEqual(reconcile_vote_counters(Comment), 1)
+        comment.refresh_from_db()
+        self.assertEqual((comment.upvote_count, comment.score), (1, 1))
+
+    def test_toggle_and_clear_post_vote(self):
+        """
+        TFM31: Test that repeating a vote with toggle clears it, and that clearing a vote updates the counters.
+        """
+        self.assertEqual(cast_vote(self.post, self.user, 'up', toggle=True), (1, 'up'))
+        self.assertEqual(cast_vote(self.post, self.user, 'up', toggle=True), (0, None))
+        self.assertFalse(PostVote.objects.filter(post=self.post).exists())
+        self.assertEqual(cast_vote(self.post, self.user, 'down'), (-1, 'down'))
+        self.assertEqual(clear_vote(self.post, self.user), 0)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.upvote_count, self.post.downvote_count, self.post.score), (0, 0, 0))
+
+    def test_switch_post_vote_query_count(self):
+        """
+        TFM32: Test that switching a vote upserts the existing row and returns the new score in three statements.
+        """
+        cast_vote(self.post, self.user, 'up')
+        with CaptureQueriesContext(connection) as queries:
+            score, vote = cast_vote(self.post, self.user, 'down')
+        statements = [query for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 3)
+        self.assertEqual((score, vote), (-1, 'down'))
+        self.assertEqual(PostVote.objects.get(post=self.post, user=self.user).vote_type, 'down')
+
+    def test_vote_updates_rankings(self):
+        """
+        TFM38: Test that votes keep a post's hot and controversial rankings in step with its counters.
+        """
+        other = get_user_model().objects.create_user(
+            username='otheruser',
+            password='Password123!',
+            email='otheruser@example.com'
+        )
+        created = Post.objects.get(pk=self.post.pk)
+        cast_vote(self.post, self.user, 'up')
+        cast_vote(self.post, other, 'down')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.hot_rank, hot_rank(0, self.post.created_at))
+        self.assertEqual(self.post.controversy, controversy(1, 1))
+        cast_vote(self.post, other, 'up')
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.hot_rank, created.hot_rank)
+        self.assertEqual(self.post.controversy, 0)
+        self.assertEqual(refresh_rankings(), 0)
+
 
 class CommentVoteModelTests(TestCase):
     """
@@ -431,5 +768,93 @@ class CommentVoteModelTests(TestCase):
         self.assertEqual(commentvote.comment, self.comment)
         self.assertTrue(commentvote.vote_type)
 
+    def test_comment_vote_counters(self):
+        """
+        TFM30: Test that voting keeps the comment vote counters in step.
+        """
+        self.comment.downvote(self.user)
+        self.assertEqual((self.comment.upvote_count, self.comment.downvote_count, self.comment.votes), (0, 1, -1))
+        self.comment.upvote(self.user)
+        self.assertEqual((self.comment.upvote_count, self.comment.downvote_count, self.comment.votes), (1, 0, 1))
+
+
+class TitleTrieTests(unittest.TestCase):
+    """
+    Test case for the title autocomplete trie.
+    """
+
+    def test_add_and_remove_titles(self):
+        """
+        TFM33: Test that suggestions follow added and removed titles, and that removed prefixes are pruned.
+        """
+        trie = TitleTrie()
+        trie.add(1, 'Tenant rights', 'tenant-rights')
+        trie.add(2, 'Tenancy tenant deposit', 'tenancy-tenant-deposit')
+        self.assertEqual(trie.suggest('ten'), [(2, 'Tenancy tenant deposit', 'tenancy-tenant-deposit'),
+                                               (1, 'Tenant rights', 'tenant-rights')])
+        self.assertEqual([post_id for post_id, _, _ in trie.suggest('tenant ri')], [1])
+        trie.remove(2)
+        self.assertEqual([post_id for post_id, _, _ in trie.suggest('ten')], [1])
+        self.assertEqual(trie.suggest('depo'), [])
+        trie.remove(1)
+        self.assertEqual(trie.root.children, {})
+        self.assertEqual(trie.words, {})
+
+    def test_edit_title_and_rebuild_once(self):
+        """
+        TFM44: Test that adding a post again replaces its edited title, and that an old trie is only rebuilt
+        by one caller at a time.
+        """
+        trie = TitleTrie()
+        trie.add(1, 'Tenant rights', 'tenant-rights')
+        trie.add(1, 'Landlord duties', 'tenant-rights')
+        self.assertEqual(trie.suggest('ten'), [])
+        self.assertEqual(trie.suggest('land'), [(1, 'Landlord duties', 'tenant-rights')])
+
+        self.assertFalse(trie.rebuild_if_due())
+        trie.built_at = time.monotonic() - REBUILD_INTERVAL - 1
+        with trie.rebuild_lock, mock.patch.object(trie, 'rebuild') as rebuild:
+            self.assertFalse(trie.rebuild_if_due())
+        rebuild.assert_not_called()
+        with mock.patch.object(trie, 'rebuild') as rebuild, mock.patch('forum.autocomplete.search_version'):
+            thread = trie.rebuild_if_due()
+            self.assertIsNotNone(thread)
+            thread.join()
+        rebuild.assert_called_once()
+        self.assertFalse(trie.rebuild_lock.locked())
+
+    def test_rebuild_keeps_concurrent_changes(self):
+        """
+        TFM48: Test that titles added, edited or removed while the trie is rebuilt are kept in the new trie, and
+        that nodes only keep their newest posts.
+        """
+        trie = TitleTrie()
+
+        def rows():
+            yield 1, 'Tenant rights', 'tenant-rights'
+            trie.add(1, 'Landlord duties', 'tenant-rights')
+            trie.add(3, 'Parking fine', 'parking-fine')
+            trie.remove(2)
+            yield 2, 'Tenancy deposit', 'tenancy-deposit'
+
+        with mock.patch('forum.autocomplete.Post') as post:
+            post.objects.visible.return_value.values_list.return_value.iterator.return_value = rows()
+            trie.rebuild()
+        self.assertEqual(trie.suggest('ten'), [])
+        self.assertEqual(trie.suggest('land'), [(1, 'Landlord duties', 'tenant-rights')])
+        self.assertEqual(trie.suggest('park'), [(3, 'Parking fine', 'parking-fine')])
+        self.assertEqual(trie.suggest('depo'), [])
+        self.assertIsNone(trie.changes)
+
+        trie = TitleTrie()
+        with mock.patch('forum.autocomplete.NODE_POSTS', 3):
+            for post_id in range(1, 6):
+                trie.add(post_id, f'Tenant question {post_id}', f'tenant-question-{post_id}')
+            trie.add(6, 'Tenancy tenant rights', 'tenancy-tenant-rights')
+        self.assertEqual(trie.root.children['t'].post_ids, [4, 5, 6])
+        self.assertEqual([post_id for post_id, _, _ in trie.suggest('ten')], [6, 5, 4])
+        self.assertEqual([post_id for post_id, _, _ in trie.suggest('question ten', limit=2)], [5, 4])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -5,10 +5,24 @@ Author: Ionut-Valeriu Facaeru
 """
 
 import unittest
-from django.test import TestCase, Client
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from forum.autocomplete import title_trie
+from forum.hits import hit_buffer, view_key
 from forum.models import Post, Comment, PostVote, CommentVote
+from forum.pagination import COMMENTS_PER_PAGE
+from forum.related import compute_related
+from forum.threads import DISPLAY_DEPTH
+from forum.utils import refresh_rankings
+from forum.votes import cast_vote
+from users.models import ProfessionalUser
 
 CustomUser = get_user_model()
 
@@ -22,6 +36,10 @@ class ForumViewsTestCase(TestCase):
         """
         TFV1: Set up a test client, user, staff user, post, and comment for use in the tests.
         """
+        cache.clear()
+        # Views buffered by one test must not be counted in another, or written once the database is gone
+        hit_buffer.pending.clear()
+        self.addCleanup(hit_buffer.pending.clear)
         self.client = Client()
         self.user = get_user_model().objects.create_user(
             username='testuser',
@@ -253,6 +271,20 @@ class ForumViewsTestCase(TestCase):
         self.assertRedirects(response, reverse('post_detail', args=[self.post.slug]))
         self.assertTrue(PostVote.objects.filter(user=self.user, post=self.post, vote_type=PostVote.VoteType.DOWNVOTE).exists())
 
+    def test_vote_post_form_toggles(self):
+        """
+        TFV51: Test voting again with the same vote type through the form removes the vote, as through JSON.
+        """
+        self.client.force_login(self.user)
+        for expected in (True, False):
+            self.client.post(reverse('vote_post', args=[self.post.slug]), {'vote_type': PostVote.VoteType.UPVOTE})
+            self.client.post(reverse('vote_comment', args=[self.post.slug, self.comment.comment_id]),
+                             {'vote_type': CommentVote.VoteType.UPVOTE})
+            self.assertEqual(PostVote.objects.filter(user=self.user, post=self.post).exists(), expected)
+            self.assertEqual(CommentVote.objects.filter(user=self.user, comment=self.comment).exists(), expected)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.score, 0)
+
     def test_vote_post_invalid_form(self):
         """
         TFV19: Test voting on a post with an invalid form.
@@ -297,6 +329,595 @@ class ForumViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertTemplateUsed(response, 'errors/400.html')
 
+    def count_queries(self, url):
+        """
+        Request a page and return the number of SQL statements it ran.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def create_posts(self, count):
+        """
+        Create posts, each with a comment, by different users.
+        """
+        for number in range(count):
+            user = get_user_model().objects.create_user(
+                username=f'author{number}',
+                password='Password123!',
+                email=f'author{number}@example.com'
+            )
+            post = Post.objects.create(title=f'Test Post {number}', text='Text', user=user)
+            Comment.objects.create(post=post, user=user, text='Comment')
+
+    def test_forums_page_query_count(self):
+        """
+        TFV24: Test the forums page runs the same number of queries however many posts it shows.
+        """
+        single = self.count_queries(reverse('forums'))
+        self.create_posts(4)
+        self.assertEqual(self.count_queries(reverse('forums')), single)
+
+    def test_search_query_count(self):
+        """
+        TFV25: Test the search page runs the same number of queries however many posts it shows.
+        """
+        self.client.force_login(self.user)
+        url = reverse('search') + '?q=Test'
+        single = self.count_queries(url)
+        self.create_posts(4)
+        cache.clear()
+        self.assertEqual(self.count_queries(url), single)
+
+    def test_feed_query_count(self):
+        """
+        TFV26: Test the latest posts feed is built with a single query, after the query of its validators.
+        """
+        self.create_posts(4)
+        self.assertEqual(self.count_queries('/latest/feed/'), 2)
+
+    def test_forums_page_counts(self):
+        """
+        TFV27: Test the forums page shows the comment and view counts of each post.
+        """
+        Comment.objects.create(post=self.post, user=self.user, text='Deleted comment').delete()
+        self.client.get(reverse('post_detail', kwargs={'slug': self.post.slug}))
+        hit_buffer.flush()
+        response = self.client.get(reverse('forums'))
+        post = response.context['page_obj'][0]
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.hits, 1)
+        self.assertContains(response, '1 comment • 1 view')
+
+    def test_vote_post_json(self):
+        """
+        TFV28: Test voting on a post through the JSON endpoint, voting twice removes the vote.
+        """
+        self.client.force_login(self.user)
+        url = reverse('vote_post_json', args=[self.post.slug])
+        response = self.client.post(url, {'vote_type': PostVote.VoteType.UPVOTE})
+        self.assertEqual(response.json(), {'score': 1, 'vote': 'up'})
+        response = self.client.post(url, {'vote_type': PostVote.VoteType.DOWNVOTE})
+        self.assertEqual(response.json(), {'score': -1, 'vote': 'down'})
+        response = self.client.post(url, {'vote_type': PostVote.VoteType.DOWNVOTE})
+        self.assertEqual(response.json(), {'score': 0, 'vote': None})
+        self.assertFalse(PostVote.objects.filter(post=self.post).exists())
+
+    def test_vote_comment_json(self):
+        """
+        TFV29: Test voting on a comment through the JSON endpoint.
+        """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('vote_comment_json', args=[self.post.slug, self.comment.comment_id]),
+            {'vote_type': CommentVote.VoteType.DOWNVOTE}
+        )
+        self.assertEqual(response.json(), {'score': -1, 'vote': 'down'})
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.votes, -1)
+
+    def test_vote_json_errors(self):
+        """
+        TFV30: Test the JSON vote endpoints reject anonymous users, invalid votes and comments of other posts.
+        """
+        url = reverse('vote_post_json', args=[self.post.slug])
+        response = self.client.post(url, {'vote_type': PostVote.VoteType.UPVOTE})
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.user)
+        response = self.client.post(url, {'vote_type': 'invalid_vote_type'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        other_post = Post.objects.create(title='Other Post', text='Text', user=self.user)
+        response = self.client.post(
+            reverse('vote_comment_json', args=[other_post.slug, self.comment.comment_id]),
+            {'vote_type': CommentVote.VoteType.UPVOTE}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_forums_cursor_pagination(self):
+        """
+        TFV31: Test walking the forum listing forwards and backwards with cursors, without counting posts.
+        """
+        self.create_posts(11)
+        titles = list(Post.objects.order_by('-created_at', '-post_id').values_list('title', flat=True))
+        pages = []
+        url = reverse('forums')
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse([query for query in queries if 'COUNT(*)' in query['sql']])
+            page_obj = response.context['page_obj']
+            pages.append([post.title for post in page_obj])
+            self.assertEqual(page_obj.number, len(pages))
+            url = reverse('forums') + f'?cursor={page_obj.next_cursor}' if page_obj.has_next() else None
+        self.assertEqual(sum(pages, []), titles)
+
+        response = self.client.get(reverse('forums') + f'?cursor={page_obj.previous_cursor}')
+        self.assertEqual([post.title for post in response.context['page_obj']], pages[1])
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_forums_page_number(self):
+        """
+        TFV32: Test the first pages can still be requested by number and invalid cursors show the first page.
+        """
+        self.create_posts(6)
+        titles = list(Post.objects.order_by('-created_at', '-post_id').values_list('title', flat=True))
+        response = self.client.get(reverse('forums') + '?page=2')
+        self.assertEqual([post.title for post in response.context['page_obj']], titles[5:])
+        self.assertFalse(response.context['page_obj'].has_next())
+        response = self.client.get(reverse('forums') + '?cursor=invalid')
+        self.assertEqual([post.title for post in response.context['page_obj']], titles[:5])
+        response = self.client.get(reverse('forums') + '?page=abc')
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_search_ranking(self):
+        """
+        TFV33: Test search ranks title matches first, matches comments, highlights snippets and skips deleted posts.
+        """
+        self.client.force_login(self.user)
+        title_match = Post.objects.create(title='Tenancy deposit', text='Landlord kept money.', user=self.user)
+        text_match = Post.objects.create(title='Renting', text='My tenancy ended early.', user=self.user)
+        comment_match = Post.objects.create(title='Flat problems', text='Mould everywhere.', user=self.user)
+        Comment.objects.create(post=comment_match, user=self.user, text='Check your tenancy agreement.')
+        deleted = Post.objects.create(title='Tenancy question', text='Deleted tenancy post.', user=self.user)
+        deleted.delete()
+        Comment.objects.create(post=self.post, user=self.user, text='Tenancy comment to delete.').delete()
+
+        response = self.client.get(reverse('search') + '?q=tenancy')
+        results = list(response.context['search'].page)
+        self.assertEqual([post.pk for post in results], [title_match.pk, text_match.pk, comment_match.pk])
+        self.assertEqual(response.context['search'].result_count, 3)
+        self.assertIsNone(results[0].matched_comment_id)
+        self.assertIsNotNone(results[2].matched_comment_id)
+        self.assertIn('<mark>tenancy</mark>', results[1].snippet)
+        self.assertContains(response, 'Check your <mark>tenancy</mark> agreement.')
+
+    def test_search_candidates(self):
+        """
+        TFV54: Test search only ranks the best matching posts and comments, and counts the posts it lists.
+        """
+        self.client.force_login(self.user)
+        strong = Post.objects.create(title='Tenancy deposit', text='Tenancy deposit returned.', user=self.user)
+        medium = Post.objects.create(title='Tenancy', text='Landlord kept money.', user=self.user)
+        Post.objects.create(title='Renting', text='My tenancy ended early.', user=self.user)
+        comment_match = Post.objects.create(title='Flat problems', text='Mould everywhere.', user=self.user)
+        Comment.objects.create(post=comment_match, user=self.user, text='Check your tenancy agreement.')
+        with mock.patch('forum.search.SEARCH_CANDIDATES', 2):
+            response = self.client.get(reverse('search') + '?q=tenancy')
+        self.assertEqual({post.pk for post in response.context['search'].page},
+                         {strong.pk, medium.pk, comment_match.pk})
+        self.assertEqual(response.context['search'].result_count, 3)
+
+    def test_search_pagination_and_escaping(self):
+        """
+        TFV34: Test search results can be paged with cursors and search syntax in the query is ignored.
+        """
+        self.client.force_login(self.user)
+        for number in range(7):
+            Post.objects.create(title=f'Contract {number}', text='Contract law ' * (number + 1), user=self.user)
+        response = self.client.get(reverse('search') + '?q=contract')
+        first = response.context['search'].page
+        self.assertEqual(len(first), 5)
+        response = self.client.get(reverse('search') + f'?q=contract&cursor={first.next_cursor}')
+        second = response.context['search'].page
+        self.assertEqual(len(second), 2)
+        self.assertFalse({post.pk for post in first} & {post.pk for post in second})
+        response = self.client.get(reverse('search') + f'?q=contract&cursor={second.previous_cursor}')
+        self.assertEqual([post.pk for post in response.context['search'].page], [post.pk for post in first])
+        response = self.client.get(reverse('search') + '?q=' + 'contract" OR NEAR(*')
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_search_work_outside_search_page(self):
+        """
+        TFV35: Test that pages other than the search page do no search work, even with search parameters.
+        """
+        self.client.force_login(self.user)
+        with mock.patch('forum.views.ForumSearch') as forum_search, \
+                mock.patch('forum.search.search_posts') as search_posts, \
+                mock.patch('forum.search.count_posts') as count_posts:
+            for url in ['/', reverse('forums'), reverse('dashboard')]:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, {'search': '', 'q': 'tenancy'})
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse([query for query in queries if '_fts' in query['sql']], url)
+            forum_search.assert_not_called()
+            search_posts.assert_not_called()
+            count_posts.assert_not_called()
+
+    def test_search_is_lazy(self):
+        """
+        TFV36: Test the search object only queries when the results are read, and only once.
+        """
+        self.client.force_login(self.user)
+        with mock.patch('forum.search.search_posts', return_value=[]) as search_posts:
+            response = self.client.get(reverse('search'), {'q': 'tenancy'})
+            search = response.context['search']
+            self.assertEqual(search_posts.call_count, 1)
+            search.page
+            self.assertEqual(search_posts.call_count, 1)
+
+    def test_search_results_cached(self):
+        """
+        TFV37: Test repeated searches are served from the cache until a post is created.
+        """
+        self.client.force_login(self.user)
+        Post.objects.create(title='Tenancy deposit', text='Landlord kept money.', user=self.user)
+        response = self.client.get(reverse('search'), {'q': 'Tenancy'})
+        self.assertEqual(len(response.context['search'].page), 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('search'), {'q': '  tenancy '})
+        self.assertEqual(len(response.context['search'].page), 1)
+        self.assertFalse([query for query in queries if '_fts' in query['sql']])
+
+        Post.objects.create(title='Tenancy agreement', text='Is it binding?', user=self.user)
+        response = self.client.get(reverse('search'), {'q': 'tenancy'})
+        self.assertEqual(len(response.context['search'].page), 2)
+        self.assertEqual(response.context['search'].result_count, 2)
+
+    def test_autocomplete(self):
+        """
+        TFV38: Test title suggestions follow created, edited and deleted posts.
+        """
+        self.client.force_login(self.user)
+        deposit = Post.objects.create(title='Tenancy deposit', text='Landlord kept money.', user=self.user)
+        title_trie.rebuild()
+        url = reverse('autocomplete')
+        response = self.client.get(url, {'q': 'dep'})
+        self.assertEqual(response.json(), {'suggestions': [{'title': 'Tenancy deposit', 'url': deposit.get_url()}]})
+        agreement = Post.objects.create(title='Tenancy agreement', text='Is it binding?', user=self.user)
+        titles = [suggestion['title'] for suggestion in self.client.get(url, {'q': 'tenan'}).json()['suggestions']]
+        self.assertEqual(titles, ['Tenancy agreement', 'Tenancy deposit'])
+        self.assertEqual(len(self.client.get(url, {'q': 'tenancy ag'}).json()['suggestions']), 1)
+        agreement.title = 'Tenancy contract'
+        agreement.save()
+        self.assertEqual(self.client.get(url, {'q': 'tenancy ag'}).json(), {'suggestions': []})
+        self.assertEqual(len(self.client.get(url, {'q': 'tenancy con'}).json()['suggestions']), 1)
+        agreement.delete()
+        titles = [suggestion['title'] for suggestion in self.client.get(url, {'q': 'tenan'}).json()['suggestions']]
+        self.assertEqual(titles, ['Tenancy deposit'])
+        self.assertEqual(self.client.get(url, {'q': 'a'}).json(), {'suggestions': []})
+
+    def test_post_detail_comment_pages(self):
+        """
+        TFV39: Test the post page shows the first page of comments and the rest are loaded as fragments.
+        """
+        for index in range(COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(post=self.post, user=self.user, text=f'Comment number {index}')
+        response = self.client.get(reverse('post_detail', kwargs={'slug': self.post.slug}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertContains(response, f'Comment number {COMMENTS_PER_PAGE + 4}')
+        self.assertNotContains(response, 'This is a test comment.')
+        self.assertContains(response, 'Load more comments')
+
+        url = reverse('comments', kwargs={'slug': self.post.slug})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'cursor': comments.next_cursor})
+        comment_queries = [query['sql'] for query in queries
+                           if 'FROM "comments"' in query['sql'] and 'comments_changed_at' not in query['sql']]
+        # The page of root comments, then the comments of their threads, after the query of the validators
+        self.assertEqual(len(comment_queries), 2)
+        self.assertIn(f'LIMIT {COMMENTS_PER_PAGE + 1}', comment_queries[0])
+        self.assertTemplateNotUsed(response, 'forumpost.html')
+        self.assertEqual(len(response.context['comments']), 6)
+        self.assertContains(response, 'This is a test comment.')
+        self.assertNotContains(response, 'Load more comments')
+
+    def test_comments_sorted_by_score(self):
+        """
+        TFV40: Test comments can be sorted by score.
+        """
+        top = Comment.objects.create(post=self.post, user=self.user, text='Top comment')
+        top.upvote(self.staff_user)
+        response = self.client.get(reverse('post_detail', kwargs={'slug': self.post.slug}), {'sort': 'top'})
+        self.assertEqual(response.context['comments'][0], top)
+        response = self.client.get(reverse('comments', kwargs={'slug': self.post.slug}), {'sort': 'unknown'})
+        self.assertEqual(response.context['sort'], 'new')
+
+    def test_reply_to_comment(self):
+        """
+        TFV41: Test replying to a comment shows the reply below it, and replies to other posts are refused.
+        """
+        self.client.force_login(self.user)
+        url = reverse('create_comment', kwargs={'slug': self.post.slug})
+        response = self.client.post(url, {'comment': 'A reply', 'parent': self.comment.comment_id})
+        self.assertRedirects(response, reverse('post_detail', kwargs={'slug': self.post.slug}))
+        reply = Comment.objects.get(text='A reply')
+        self.assertEqual(reply.parent, self.comment)
+
+        response = self.client.get(reverse('post_detail', kwargs={'slug': self.post.slug}))
+        self.assertEqual(response.context['thread'], [self.comment, reply])
+        self.assertEqual(len(response.context['comments']), 1)
+
+        other_post = Post.objects.create(title='Other post', text='Other text.', user=self.user)
+        other_comment = Comment.objects.create(post=other_post, user=self.user, text='Elsewhere')
+        response = self.client.post(url, {'comment': 'Misplaced', 'parent': other_comment.comment_id})
+        self.assertEqual(response.status_code, 404)
+
+    def test_continue_thread(self):
+        """
+        TFV42: Test replies below the shown depth are loaded by the comments fragment.
+        """
+        comment = self.comment
+        for depth in range(DISPLAY_DEPTH + 1):
+            comment = Comment.objects.create(post=self.post, user=self.user, text=f'Depth {depth + 1}',
+                                             parent=comment)
+        response = self.client.get(reverse('post_detail', kwargs={'slug': self.post.slug}))
+        self.assertContains(response, 'Continue this thread')
+        self.assertNotContains(response, f'Depth {DISPLAY_DEPTH + 1}')
+
+        cut = response.context['thread'][-1]
+        response = self.client.get(reverse('comments', kwargs={'slug': self.post.slug}), {'replies': cut.pk})
+        self.assertContains(response, f'Depth {DISPLAY_DEPTH + 1}')
+        response = self.client.get(reverse('comments', kwargs={'slug': self.post.slug}), {'replies': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_deleted_root_with_replies(self):
+        """
+        TFV52: Test a deleted root comment is shown as a placeholder above its visible replies, and is left out
+        once it has none.
+        """
+        reply = Comment.objects.create(post=self.post, user=self.user, text='Visible reply', parent=self.comment)
+        self.comment.delete()
+        url = reverse('post_detail', kwargs={'slug': self.post.slug})
+        response = self.client.get(url)
+        self.assertContains(response, 'Visible reply')
+        self.assertContains(response, '[deleted]')
+        self.assertEqual(len(response.context['comments']), 1)
+
+        reply.delete()
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['comments']), 0)
+        self.assertNotContains(response, '[deleted]')
+        response = self.client.get(reverse('comments', kwargs={'slug': self.post.slug}),
+                                   {'replies': self.comment.pk, 'after': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_post_detail_professional_flairs(self):
+        """
+        TFV43: Test the post page shows professional flairs without a query per comment.
+        """
+        professional = get_user_model().objects.create_user(
+            username='lawyer',
+            password='Password123!',
+            email='lawyer@example.com'
+        )
+        ProfessionalUser.objects.create(user=professional, flair='Tenancy Solicitor')
+        url = reverse('post_detail', kwargs={'slug': self.post.slug})
+        # The first view also creates the post's hit counter
+        self.count_queries(url)
+        single = self.count_queries(url)
+        for index in range(10):
+            Comment.objects.create(post=self.post, user=professional if index % 2 else self.user,
+                                   text=f'Comment {index}')
+        self.assertEqual(self.count_queries(url), single)
+        self.assertContains(self.client.get(url), 'Tenancy Solicitor', count=5)
+
+    @override_settings(FORUM_BUFFER_HITS=True)
+    def test_post_views_buffered(self):
+        """
+        TFV44: Test post views are counted once per viewer, kept in the buffer and written in bulk.
+        """
+        url = reverse('post_detail', kwargs={'slug': self.post.slug})
+        other = Post.objects.create(title='Other post', text='Other text.', user=self.user)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['post'].hits, 1)
+        self.assertFalse([query for query in queries if 'hitcount' in query['sql']])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).context['post'].hits, 2)
+        self.client.get(reverse('post_detail', kwargs={'slug': other.slug}))
+        self.assertEqual(hit_buffer.buffered(self.post.pk), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(hit_buffer.flush(), 3)
+        # Missing counters are created, then one UPDATE per distinct number of new views
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(self.client.get(url).context['post'].hits, 2)
+        self.assertEqual(Post.objects.with_hit_counts().get(pk=self.post.pk).hits, 2)
+
+    def test_post_views_deduplicated_in_cache(self):
+        """
+        TFV53: Test a viewer is counted once within the hit window without writing to the database while serving
+        the view, and counted again once the window has passed.
+        """
+        url = reverse('post_detail', kwargs={'slug': self.post.slug})
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).context['post'].hits, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).context['post'].hits, 1)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('INSERT', 'UPDATE'))])
+
+        # The viewer's key expires with the window
+        cache.delete(view_key(self.post.pk, f'user:{self.user.pk}'))
+        self.assertEqual(self.client.get(url).context['post'].hits, 2)
+        self.assertEqual(hit_buffer.buffered(self.post.pk), 0)
+
+    def test_forums_ranked_listings(self):
+        """
+        TFV45: Test the forums page can list posts by hot, top and controversial rankings.
+        """
+        voters = [get_user_model().objects.create_user(username=f'voter{index}', password='Password123!',
+                                                       email=f'voter{index}@example.com') for index in range(4)]
+        popular = Post.objects.create(title='Popular', text='Popular text.', user=self.user)
+        disputed = Post.objects.create(title='Disputed', text='Disputed text.', user=self.user)
+        for voter in voters:
+            cast_vote(self.post, voter, 'up')
+        for voter in voters[:2]:
+            cast_vote(popular, voter, 'up')
+            cast_vote(disputed, voter, 'down')
+        for voter in voters[2:]:
+            cast_vote(disputed, voter, 'up')
+        Post.objects.filter(pk=self.post.pk).update(created_at=timezone.now() - timedelta(days=3))
+        refresh_rankings()
+
+        def titles(**params):
+            response = self.client.get(reverse('forums'), params)
+            return [post.title for post in response.context['page_obj']]
+
+        self.assertEqual(titles(), ['Disputed', 'Popular', 'Test Post'])
+        self.assertEqual(titles(sort='hot'), ['Popular', 'Disputed', 'Test Post'])
+        self.assertEqual(titles(sort='top'), ['Test Post', 'Popular', 'Disputed'])
+        self.assertEqual(titles(sort='top', t='day'), ['Popular', 'Disputed'])
+        self.assertEqual(titles(sort='controversial')[0], 'Disputed')
+        self.assertEqual(titles(sort='unknown'), titles(sort='new'))
+
+        for index in range(5):
+            Post.objects.create(title=f'Filler {index}', text='Filler text.', user=self.user)
+        response = self.client.get(reverse('forums'), {'sort': 'hot'})
+        next_page = self.client.get(reverse('forums'), {'sort': 'hot', 'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(next_page.context['page_obj']), 3)
+
+    def test_fragments_cached_until_version_changes(self):
+        """
+        TFV46: Test post cards are served from the fragment cache until a save, vote or new comment increments their
+        version, that views do not change their key, and that post text, comments and per-user parts are rendered
+        outside the cache.
+        """
+        self.client.get(reverse('post_detail', args=[self.post.slug]))
+        self.client.get(reverse('forums'))
+        # Changed without going through save(), so the versions stay the same
+        Post.objects.filter(pk=self.post.pk).update(title='Changed Title', text='Changed text.')
+        Comment.objects.filter(pk=self.comment.pk).update(text='Changed comment.')
+        # Counted views are shown at once but keep the cached card
+        response = self.client.get(reverse('post_detail', args=[self.post.slug]), HTTP_USER_AGENT='Other browser')
+        self.assertContains(response, 'Changed text.')
+        self.assertContains(response, 'Changed comment.')
+        response = self.client.get(reverse('forums'))
+        self.assertNotContains(response, 'Changed Title')
+        self.assertContains(response, '2 views')
+
+        self.client.login(username='testuser', password='Password123!')
+        response = self.client.get(reverse('post_detail', args=[self.post.slug]))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'reply-button')
+
+        cast_vote(self.post, self.staff_user, 'up')
+        self.assertContains(self.client.get(reverse('forums')), 'Changed Title')
+        # Versions so far: the comment created in setUp and the vote
+        self.post.refresh_from_db()
+        self.post.save()
+        self.assertEqual(self.post.version, 3)
+
+        self.comment.refresh_from_db()
+        self.comment.delete()
+        Comment.objects.create(post=self.post, user=self.user, text='Another comment.')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 5)
+
+        get_user_model().objects.filter(pk=self.user.pk).update(first_name='Renamed')
+        self.assertContains(self.client.get(reverse('post_detail', args=[self.post.slug])), 'Renamed')
+
+    def test_conditional_requests(self):
+        """
+        TFV47: Test the feed, the forums page and post pages answer revalidation with a 304 response until what
+        they show changes.
+        """
+        def revalidate(url, response, queries=None):
+            headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+            if queries is None:
+                return self.client.get(url, **headers).status_code
+            with CaptureQueriesContext(connection) as context:
+                status = self.client.get(url, **headers).status_code
+            self.assertEqual(len(context.captured_queries), queries)
+            return status
+
+        feed = self.client.get('/latest/feed/')
+        self.assertEqual(revalidate('/latest/feed/', feed, queries=1), 304)
+        response = self.client.get('/latest/feed/', HTTP_IF_MODIFIED_SINCE=feed['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        url = reverse('post_detail', args=[self.post.slug])
+        page = self.client.get(url)
+        listing = self.client.get(reverse('forums'))
+        self.assertEqual(revalidate(url, page), 304)
+        self.assertEqual(revalidate(reverse('forums'), listing), 304)
+
+        # A vote on a comment changes the post page but not the listing or the feed
+        cast_vote(self.comment, self.staff_user, 'up')
+        self.assertEqual(revalidate(url, page), 200)
+        self.assertEqual(revalidate(reverse('forums'), listing), 304)
+        self.assertEqual(revalidate('/latest/feed/', feed), 304)
+
+        # A new comment changes the post's comment count
+        page = self.client.get(url)
+        Comment.objects.create(post=self.post, user=self.user, text='Another comment.')
+        self.assertEqual(revalidate(url, page), 200)
+        self.assertEqual(revalidate(reverse('forums'), listing), 200)
+        self.assertEqual(revalidate('/latest/feed/', feed), 200)
+
+        # Pages differ between users
+        page = self.client.get(url)
+        self.client.force_login(self.user)
+        self.assertEqual(revalidate(url, page), 200)
+
+    def test_listings_do_not_load_post_text(self):
+        """
+        TFV48: Test the forums, search and profile pages list posts without loading their text, the forums and
+        profile pages show the excerpt.
+        """
+        text = 'Long text ' + 'lorem ' * 6000
+        Post.objects.create(title='Long Post', text=text, user=self.user)
+        self.client.force_login(self.user)
+        for url in [reverse('forums'), reverse('search') + '?q=Long', reverse('profile', args=[self.user.username])]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            if 'search' not in url:
+                self.assertContains(response, text[:120] + '...')
+            self.assertNotContains(response, text[:200])
+            self.assertFalse([query for query in queries if '"posts"."text"' in query['sql']])
+
+    def test_post_detail_related_posts(self):
+        """
+        TFV49: Test the post page lists similar posts with one query.
+        """
+        similar = Post.objects.create(title='Test Post Again', text='This is another test post.', user=self.user)
+        compute_related()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post_detail', args=[self.post.slug]))
+        self.assertContains(response, 'Similar questions')
+        self.assertContains(response, reverse('post_detail', args=[similar.slug]))
+        self.assertEqual(len([query for query in queries if 'related_posts' in query['sql']]), 1)
+
+    def test_create_post_warns_about_duplicates(self):
+        """
+        TFV50: Test that a near-duplicate post is only created once the user submits it again.
+        """
+        self.client.login(username='testuser', password='Password123!')
+        data = {'title': 'Test Post', 'text': 'This is a test post!'}
+        response = self.client.post(reverse('create_post'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('post_detail', args=[self.post.slug]))
+        self.assertContains(response, 'name="confirm"')
+        self.assertEqual(Post.objects.filter(title='Test Post').count(), 1)
+
+        response = self.client.post(reverse('create_post'), {**data, 'confirm': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.filter(title='Test Post').count(), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Threaded comments.
+
+Every comment stores its materialised path: the zero padded IDs of its ancestors followed by its own ID, and the
+root comment of its thread. A thread, or any part of one, is loaded with one query on the (thread, path) index,
+ordered by path so that every comment comes after its parent and before its later siblings. The rows are
+assembled into a tree in a single pass and flattened back into display order, each comment keeping its depth
+for indentation.
+
+Deep threads are cut at DISPLAY_DEPTH levels. One more level is loaded to find the comments whose replies are
+hidden, these get a "Continue this thread" link which loads their replies with load_replies().
+Long threads are cut after THREAD_PAGE_SIZE comments in thread order, so a page does not grow with the size of
+its threads. They end with a "Continue this thread" link loading the comments after the last one shown.
+
+Author: Georgios Tsakoumakis
+"""
+
+from .models import Comment
+
+# Levels of replies shown below a comment before the thread is cut
+DISPLAY_DEPTH = 6
+# Comments of a thread shown at once
+THREAD_PAGE_SIZE = 50
+
+
+class MoreReplies:
+    """
+    Stands for the comments of a thread left out after its last shown comment, rendered as a
+    "Continue this thread" link.
+    """
+    continues_thread = True
+
+    def __init__(self, comment_id, after, depth):
+        """
+        :param comment_id: ID of the comment whose replies are continued
+        :param after: Path of the last comment shown, the link loads the replies after it
+        :param depth: Depth the link is indented to
+        """
+        self.comment_id = comment_id
+        self.after = after
+        self.depth = depth
+
+
+def build_tree(comments, base_depth, max_depth):
+    """
+    Assemble comments sorted by path into trees in a single pass. Each comment gets a children list and a
+    has_more_replies flag, set when it has replies deeper than max_depth.
+    :param comments: Iterable of Comment objects sorted by path
+    :param base_depth: Depth of the top comments of the trees
+    :param max_depth: Levels of replies kept below the top comments
+    :return: list of the top comments
+    """
+    nodes = {}
+    tops = []
+    for comment in comments:
+        parent = nodes.get(comment.parent_id)
+        if comment.depth - base_depth > max_depth:
+            # Only loaded to tell whether the parent has hidden replies
+            if parent is not None:
+                parent.has_more_replies = True
+            continue
+        comment.children = []
+        comment.has_more_replies = False
+        nodes[comment.pk] = comment
+        if parent is None:
+            tops.append(comment)
+        else:
+            parent.children.append(comment)
+    return tops
+
+
+def flatten(comments):
+    """
+    List trees of comments in display order. Deleted comments are kept as placeholders only while they have
+    replies left to show.
+    :param comments: Top comments of the trees, as returned by build_tree
+    :return: list of Comment objects
+    """
+    result = []
+    for comment in comments:
+        replies = flatten(comment.children)
+        if comment.is_deleted and not replies and not comment.has_more_replies:
+            continue
+        result.append(comment)
+        result.extend(replies)
+    return result
+
+
+def load_threads(roots, max_depth=DISPLAY_DEPTH, limit=THREAD_PAGE_SIZE):
+    """
+    Load the threads started by a page of root comments, with one query
+    :param roots: Root comments, in the order the threads are shown
+    :param max_depth: Levels of replies shown below each root comment
+    :param limit: Most comments shown from each thread, the root included
+    :return: list of Comment objects in display order, followed by a MoreReplies object for each cut thread
+    """
+    roots = list(roots)
+    if not roots:
+        return []
+    # One more comment per thread is loaded to tell whether the thread is cut
+    comments, loaded, last_path = [], {}, {}
+    for comment in Comment.objects.threads(roots, max_depth + 1, limit + 1):
+        loaded[comment.thread_id] = loaded.get(comment.thread_id, 0) + 1
+        if loaded[comment.thread_id] <= limit:
+            comments.append(comment)
+            last_path[comment.thread_id] = comment.path
+    order = {root.pk: index for index, root in enumerate(roots)}
+    tops = build_tree(comments, 0, max_depth)
+    # Paths sort the threads by root ID, put them back in the order of the page
+    tops = [top for top in tops if top.pk in order]
+    tops.sort(key=lambda top: order[top.pk])
+    result = []
+    for top in tops:
+        thread = flatten([top])
+        if loaded[top.pk] > limit:
+            # The root stays as a placeholder even if the visible replies are all past the cut
+            thread = thread or [top]
+            thread.append(MoreReplies(top.pk, last_path[top.pk], top.depth + 1))
+        result.extend(thread)
+    return result
+
+
+def load_replies(comment, max_depth=DISPLAY_DEPTH, after=None, limit=THREAD_PAGE_SIZE):
+    """
+    Load the replies below a comment, with one query
+    :param comment: Comment object
+    :param max_depth: Levels of replies shown below the comment's direct replies
+    :param after: Path of the last reply already shown, only the replies after it are loaded
+    :param limit: Most replies shown
+    :return: list of Comment objects in display order, followed by a MoreReplies object if replies are left out
+    """
+    replies = list(Comment.objects.subtree(comment, max_depth + 2, after)[:limit + 1])
+    shown = replies[:limit]
+    result = flatten(build_tree(shown, comment.depth + 1, max_depth))
+    if len(replies) > limit:
+        result.append(MoreReplies(comment.pk, shown[-1].path, comment.depth + 1))
+    return result
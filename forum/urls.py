@@ -10,14 +10,22 @@ from . import views
 urlpatterns = [
     path("", views.forums, name="forums"),
     path("post/<slug>/", views.post_detail, name="post_detail"),
+    path("post/<slug>/comments/", views.comments, name="comments"),
     path("create_post/", views.create_post, name="create_post"),
     path("search/", views.search, name="search"),
+    path("search/autocomplete/", views.autocomplete, name="autocomplete"),
     path("create_comment/<slug>/", views.create_comment, name="create_comment"),
     path("delete_post/<slug>/", views.delete_post, name="delete_post"),
     path("vote_post/<slug>/", views.vote_post, name="vote_post"),
+    path("vote_post/<slug>/json/", views.vote_post_json, name="vote_post_json"),
     path(
         "vote_comment/<slug>/<int:comment_id>/", views.vote_comment, name="vote_comment"
     ),
+    path(
+        "vote_comment/<slug>/<int:comment_id>/json/",
+        views.vote_comment_json,
+        name="vote_comment_json",
+    ),
     path(
         "delete_comment/<slug>/<int:comment_id>/",
         views.delete_comment,
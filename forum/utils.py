@@ -4,19 +4,64 @@ Utility functions for the forum app.
 Author: Georgios Tsakoumakis
 """
 
-from hitcount.utils import get_hitcount_model
-from hitcount.views import HitCountMixin
-
-
-def update_views(request, object):
-    context = {}
-    hit_count = get_hitcount_model().objects.get_for_object(object)
-    hits = hit_count.hits
-    hitcontext = context["hitcount"] = {"pk": hit_count.pk}
-    hit_count_response = HitCountMixin.hit_count(request, hit_count)
-
-    if hit_count_response.hit_counted:
-        hits = hits + 1
-        hitcontext["hit_count"] = hit_count_response.hit_counted
-        hitcontext["hit_message"] = hit_count_response.hit_message
-        hitcontext["total_hits"] = hits
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Post, Vote
+from .rankings import RANKING_FIELDS, post_rankings
+
+
+def reconcile_vote_counters(model, batch_size=1000):
+    """
+    Recount the votes of every post or comment and fix counters that have drifted from the vote table. Each batch
+    recounts and writes in a single UPDATE from correlated subqueries on the vote table, so a vote cast while
+    reconciling is not overwritten by a count read before it.
+    :param model: Post or Comment
+    :param batch_size: Number of consecutive primary keys fixed per UPDATE
+    :return: int - number of corrected rows
+    """
+    relation = model._meta.get_field(model.objects.all().vote_relation)
+    target = relation.field.name
+
+    def total(vote_type):
+        votes = (
+            relation.related_model.objects.filter(**{target: OuterRef("pk"), "vote_type": vote_type})
+            .order_by()
+            .values(target)
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        return Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+
+    upvotes, downvotes = total(Vote.VoteType.UPVOTE), total(Vote.VoteType.DOWNVOTE)
+    bounds = model.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return 0
+    corrected = 0
+    for start in range(bounds["first"], bounds["last"] + 1, batch_size):
+        with transaction.atomic():
+            corrected += (
+                model.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+                .exclude(upvote_count=upvotes, downvote_count=downvotes, score=upvotes - downvotes)
+                .update(upvote_count=upvotes, downvote_count=downvotes, score=upvotes - downvotes)
+            )
+    return corrected
+
+
+def refresh_rankings(batch_size=1000):
+    """
+    Recompute the rankings of every post and store the ones that changed
+    :param batch_size: Number of posts read and updated per batch
+    :return: int - number of updated posts
+    """
+    changed = []
+    posts = Post.objects.only("pk", "created_at", "upvote_count", "downvote_count", *RANKING_FIELDS)
+    for post in posts.iterator(chunk_size=batch_size):
+        rankings = post_rankings(post.upvote_count, post.downvote_count, post.created_at)
+        if any(getattr(post, field) != value for field, value in rankings.items()):
+            for field, value in rankings.items():
+                setattr(post, field, value)
+            changed.append(post)
+    with transaction.atomic():
+        Post.objects.bulk_update(changed, RANKING_FIELDS, batch_size=batch_size)
+    return len(changed)
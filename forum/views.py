@@ -5,81 +5,151 @@ Author: Georgios Tsakoumakis, Jonathan Muse, Ziad El Krekshi
 """
 
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Comment, PostVote, CommentVote
-from .utils import update_views
+from django.urls import reverse
+from django.views.decorators.http import condition, require_POST
+from .models import Post, Comment, RelatedPost
+from .hits import record_view
+from .votes import cast_vote
 from .forms import CreatePostForm, CreateCommentForm, PostVoteForm, CommentVoteForm
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from .rankings import SORTS, WINDOWED_SORTS, WINDOWS, ranked_posts
+from .pagination import COMMENT_ORDERINGS, COMMENTS_PER_PAGE, KeysetPaginator
+from .search import ForumSearch
+from .threads import load_replies, load_threads
+from .autocomplete import suggest_titles
+from .duplicates import find_duplicates
+from .conditional import listing_etag, listing_last_modified, post_etag, post_last_modified
 from users.decorators import ban_forbidden
 
 
 @ban_forbidden(redirect_url="/banned/")
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def forums(request):
     """
     This view is responsible for rendering the forum page.
-    It displays all the posts in the forum.
+    It displays all the posts in the forum, newest first or ranked as selected by ?sort= and ?t=.
+    A client whose copy is still current gets a 304 response, see forum/conditional.py.
     :param request: Request object
     :return: Rendered forum page
     """
     vote_form = PostVoteForm()
-    posts = Post.objects.filter(is_deleted=False).order_by("-created_at")
-    paginator = Paginator(posts, 5)  # Show 5 posts per page
-
-    page_number = request.GET.get("page")
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    sort = request.GET.get("sort")
+    if sort not in SORTS:
+        sort = "new"
+    window = request.GET.get("t")
+    if window not in WINDOWS:
+        window = "all"
+    posts, ordering = ranked_posts(Post.objects.for_listing(), sort, window)
+    paginator = KeysetPaginator(posts, 5, ordering=ordering)  # Show 5 posts per page
+    page_obj = paginator.page(request.GET.get("cursor"), request.GET.get("page"))
 
     context = {
         "vote_form": vote_form,
         "page_obj": page_obj,
+        "sort": sort,
+        "window": window,
+        "sorts": list(SORTS),
+        "windows": list(WINDOWS) if sort in WINDOWED_SORTS else [],
     }
     return render(request, "forum.html", context)
 
 
+def comment_context(request, post):
+    """
+    Get the page of a post's threads selected by the ?sort= and ?cursor= parameters.
+    The root comments are paginated, each is shown with its replies. Deleted root comments are shown as
+    placeholders while their threads have visible replies.
+    :param request: Request object
+    :param post: Post object
+    :return: dict - page of root comments, the comments of their threads in display order and the sort order used
+    """
+    sort = request.GET.get("sort")
+    if sort not in COMMENT_ORDERINGS:
+        sort = "new"
+    roots = Comment.objects.displayed_roots().filter(post=post)
+    paginator = KeysetPaginator(roots, COMMENTS_PER_PAGE, ordering=COMMENT_ORDERINGS[sort])
+    page = paginator.page(request.GET.get("cursor"))
+    return {"comments": page, "thread": load_threads(page), "sort": sort}
+
+
 @ban_forbidden(redirect_url="/banned/")
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_detail(request, slug):
     """
     This view is responsible for rendering the post detail page.
-    It displays the post and all the comments associated with it.
+    It displays the post, its related posts and the first page of its comments, the rest are loaded by the
+    comments view.
+    A client whose copy is still current gets a 304 response, see forum/conditional.py.
     :param request: Request object
     :param slug: Slug of the post
     :return: Rendered post detail page
     """
-    post = get_object_or_404(Post, slug=slug)
-    comments = post.get_comments()
+    post = get_object_or_404(Post.objects.with_authors(), slug=slug)
     # Comment creation form
     comment_form = CreateCommentForm()
     post_vote_form = PostVoteForm()
     comment_vote_form = CommentVoteForm()
+    post.hits = record_view(request, post)
     context = {
         "post": post,
-        "comments": comments,
         "comment_form": comment_form,
         "post_vote_form": post_vote_form,
         "comment_vote_form": comment_vote_form,
+        "related_posts": RelatedPost.objects.for_post(post),
+        **comment_context(request, post),
     }
-    update_views(request, post)
-
     return render(request, "forumpost.html", context)
 
 
+@ban_forbidden(redirect_url="/banned/")
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+def comments(request, slug):
+    """
+    This view is responsible for loading more comments of a post.
+    It renders the page of threads after the cursor as an HTML fragment, appended to the post page by the
+    "Load more comments" button. With ?replies=<comment_id> it renders the replies below a comment instead,
+    for the "Continue this thread" button of deep and long threads, from the reply after the path given by
+    ?after= if set.
+    :param request: Request object
+    :param slug: Slug of the post
+    :return: Rendered list of comments
+    """
+    post = get_object_or_404(Post, slug=slug)
+    context = {"post": post, "comment_vote_form": CommentVoteForm()}
+    replies = request.GET.get("replies")
+    if replies is not None:
+        try:
+            comment = get_object_or_404(Comment, comment_id=int(replies), post=post)
+        except ValueError:
+            raise Http404("Comment not found")
+        after = request.GET.get("after")
+        if after is not None and not after.isdigit():
+            raise Http404("Comment not found")
+        context["thread"] = load_replies(comment, after=after)
+    else:
+        context.update(comment_context(request, post))
+    return render(request, "comments.html", context)
+
+
 @ban_forbidden(redirect_url="/banned/")
 def create_post(request):
     """
     This view is responsible for rendering the post creation page.
-    It allows users to create a new post.
+    It allows users to create a new post. A post that is a near-duplicate of existing posts is only created once
+    the user submits it again, after being shown links to them.
     :param request: Request object
     :return: Rendered post creation page
     """
     if not request.user.is_authenticated:
         return redirect("login")
+    duplicates = []
     if request.method == "POST":
         form = CreatePostForm(request.POST)
-        if form.is_valid():
+        if form.is_valid() and not request.POST.get("confirm"):
+            duplicates = find_duplicates(form.cleaned_data["title"], form.cleaned_data["text"])
+        if form.is_valid() and not duplicates:
             post = form.save(commit=False)
             # Set the user of the post to the current user
             post.user = request.user
@@ -87,7 +157,7 @@ def create_post(request):
             return redirect("post_detail", slug=post.slug)
     else:
         form = CreatePostForm()
-    return render(request, "postcreation.html", {"form": form})
+    return render(request, "postcreation.html", {"form": form, "duplicates": duplicates})
 
 
 @ban_forbidden(redirect_url="/banned/")
@@ -104,8 +174,7 @@ def create_comment(request, slug):
         return redirect("login")
 
     # Context variables
-    post = get_object_or_404(Post, slug=slug)
-    comments = post.get_comments()
+    post = get_object_or_404(Post.objects.with_authors().with_hit_counts(), slug=slug)
     post_vote_form = PostVoteForm()
     comment_vote_form = CommentVoteForm()
 
@@ -113,27 +182,24 @@ def create_comment(request, slug):
         form = CreateCommentForm(request.POST)
         if form.is_valid():
             comment = form.cleaned_data["comment"]
-            Comment.objects.create(user=request.user, post=post, text=comment)
-            return redirect("post_detail", slug=slug)
-        else:
-            context = {
-                "post": post,
-                "comments": comments,
-                "comment_form": form,
-                "post_vote_form": post_vote_form,
-                "comment_vote_form": comment_vote_form,
-            }
-            return render(request, "forumpost.html", context)
+            parent_id = form.cleaned_data.get("parent")
+            # Replies must be to a comment on the same post
+            parent = get_object_or_404(Comment, comment_id=parent_id, post=post) if parent_id else None
+            try:
+                Comment.objects.create(user=request.user, post=post, parent=parent, text=comment)
+                return redirect("post_detail", slug=slug)
+            except ValidationError as error:
+                form.add_error(None, error)
     else:
         form = CreateCommentForm()
-        context = {
-            "post": post,
-            "comments": comments,
-            "comment_form": form,
-            "post_vote_form": post_vote_form,
-            "comment_vote_form": comment_vote_form,
-        }
-        return render(request, "forumpost.html", context)
+    context = {
+        "post": post,
+        "comment_form": form,
+        "post_vote_form": post_vote_form,
+        "comment_vote_form": comment_vote_form,
+        **comment_context(request, post),
+    }
+    return render(request, "forumpost.html", context)
 
 
 @login_required
@@ -172,6 +238,7 @@ def delete_comment(request, slug, comment_id):
 def vote_post(request, slug):
     """
     This view is responsible for voting on a post.
+    Voting again with the same vote type removes the vote, as when voting from forum.js.
     :param request: Request object
     :param slug: Slug of the post
     :return: Redirect to the post detail page
@@ -180,11 +247,7 @@ def vote_post(request, slug):
     if request.method == "POST":
         vote_form = PostVoteForm(request.POST)
         if vote_form.is_valid():
-            vote_type = vote_form.cleaned_data["vote_type"]
-            if vote_type == PostVote.VoteType.UPVOTE:
-                post.upvote(request.user)
-            elif vote_type == PostVote.VoteType.DOWNVOTE:
-                post.downvote(request.user)
+            cast_vote(post, request.user, vote_form.cleaned_data["vote_type"], toggle=True)
         else:
             # 400 Bad Request
             return render(request, "errors/400.html", status=400)
@@ -196,6 +259,7 @@ def vote_post(request, slug):
 def vote_comment(request, slug, comment_id):
     """
     This view is responsible for voting on a comment.
+    Voting again with the same vote type removes the vote, as when voting from forum.js.
     :param request: Request object
     :param slug: Slug of the post the comment belongs to
     :param comment_id: ID of the comment
@@ -205,44 +269,86 @@ def vote_comment(request, slug, comment_id):
     if request.method == "POST":
         vote_form = CommentVoteForm(request.POST)
         if vote_form.is_valid():
-            vote_type = vote_form.cleaned_data["vote_type"]
-            if vote_type == CommentVote.VoteType.UPVOTE:
-                comment.upvote(request.user)
-            elif vote_type == CommentVote.VoteType.DOWNVOTE:
-                comment.downvote(request.user)
+            cast_vote(comment, request.user, vote_form.cleaned_data["vote_type"], toggle=True)
         else:
             # 400 Bad Request
             return render(request, "errors/400.html", status=400)
     return redirect("post_detail", slug=slug)
 
 
+def vote_json(request, target, form_class):
+    """
+    Record a vote sent by forum.js and describe the result in JSON.
+    Voting again with the same vote type removes the vote.
+    :param request: Request object
+    :param target: Post or Comment object
+    :param form_class: PostVoteForm or CommentVoteForm
+    :return: JSON response with the new score and the user's current vote
+    """
+    vote_form = form_class(request.POST)
+    if not vote_form.is_valid():
+        return JsonResponse({"error": "Invalid vote type"}, status=400)
+    score, vote = cast_vote(
+        target, request.user, vote_form.cleaned_data["vote_type"], toggle=True
+    )
+    return JsonResponse({"score": score, "vote": vote})
+
+
+@require_POST
+@ban_forbidden(redirect_url="/banned/")
+def vote_post_json(request, slug):
+    """
+    This view is responsible for voting on a post without reloading the page.
+    :param request: Request object
+    :param slug: Slug of the post
+    :return: JSON response with the new score and the user's current vote
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User is not authenticated"}, status=403)
+    post = get_object_or_404(Post.objects.only("pk"), slug=slug)
+    return vote_json(request, post, PostVoteForm)
+
+
+@require_POST
+@ban_forbidden(redirect_url="/banned/")
+def vote_comment_json(request, slug, comment_id):
+    """
+    This view is responsible for voting on a comment without reloading the page.
+    :param request: Request object
+    :param slug: Slug of the post the comment belongs to
+    :param comment_id: ID of the comment
+    :return: JSON response with the new score and the user's current vote
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User is not authenticated"}, status=403)
+    comment = get_object_or_404(
+        Comment.objects.only("pk"), comment_id=comment_id, post__slug=slug
+    )
+    return vote_json(request, comment, CommentVoteForm)
+
+
 @login_required
 @ban_forbidden(redirect_url="/banned/")
 def search(request):
     """
-    This view is responsible for searching posts. It filters posts based on the query provided.
+    This view is responsible for searching posts. Posts are ranked by how well their title, text and comments
+    match the query provided.
     :param request: Request object
     :return: Rendered search page
     """
-    query = request.GET.get('q')
+    return render(request, 'search.html', {'search': ForumSearch(request)})
 
-    # Check if a query was provided
-    if query:
-        all_posts = Post.objects.filter(title__icontains=query).order_by('-created_at')
-    else:
-        all_posts = Post.objects.none()  # Return an empty queryset if no query
-
-    paginator = Paginator(all_posts, 5)  # Show 5 posts per page.
-    page_number = request.GET.get('page')
-
-    try:
-        # Get the posts for the requested page
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        # If page_number is not an integer, deliver the first page
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        # If the page is out of range, deliver the last page of results
-        page_obj = paginator.page(paginator.num_pages)
-
-    return render(request, 'search.html', {'page_obj': page_obj, 'query': query})
+
+@login_required
+@ban_forbidden(redirect_url="/banned/")
+def autocomplete(request):
+    """
+    This view suggests post titles for the text typed in the search box.
+    :param request: Request object
+    :return: JSON response with a list of suggested titles and their URLs
+    """
+    suggestions = [
+        {"title": title, "url": reverse("post_detail", kwargs={"slug": slug})}
+        for _, title, slug in suggest_titles(request.GET.get("q", ""))
+    ]
+    return JsonResponse({"suggestions": suggestions})
@@ -0,0 +1,151 @@
+"""
+Vote service for posts and comments.
+
+A vote is recorded with at most three statements in one transaction: the target row is locked while the user's
+current vote is read, the vote is written with an INSERT ... ON CONFLICT (user, target) DO UPDATE upsert (or
+deleted when it is cleared), and the target's vote counters are adjusted by an UPDATE that returns the new score.
+Votes are written with bulk_create, which skips the existence checks run by PostVote.clean() and
+CommentVote.clean(). The unique (user, target) constraint enforces one vote per user instead.
+A post's hot and controversial rankings are computed from the locked counters and set by the same UPDATE, which
+also increments the target's version so that its cached template fragments are rendered again, and sets its
+updated_at for conditional requests.
+
+Author: Georgios Tsakoumakis
+"""
+
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from .models import Post, Comment, PostVote, CommentVote, Vote
+from .rankings import post_rankings
+
+# Vote model and the name of its foreign key to the target, for each votable model
+VOTE_MODELS = {
+    Post: (PostVote, "post"),
+    Comment: (CommentVote, "comment"),
+}
+
+
+def get_user_vote(target, user):
+    """
+    Get the current vote of a user on a post or comment
+    :param target: Post or Comment object
+    :param user: User object
+    :return: str - vote type, or None if the user has not voted
+    """
+    vote_model, target_field = VOTE_MODELS[type(target)]
+    return (
+        vote_model.objects.filter(user=user, **{target_field: target})
+        .values_list("vote_type", flat=True)
+        .first()
+    )
+
+
+def _lock_target(target, user):
+    """
+    Lock a post or comment for the rest of the transaction and read its vote counters and the user's current vote.
+    Votes on the same target are serialised by the lock, so the counter changes are always computed from the
+    vote that is actually replaced.
+    :param target: Post or Comment object
+    :param user: User object
+    :return: dict - score, upvote_count, downvote_count, created_at and current_vote
+    """
+    vote_model, target_field = VOTE_MODELS[type(target)]
+    current_vote = vote_model.objects.filter(
+        user=user, **{target_field: OuterRef("pk")}
+    ).values("vote_type")[:1]
+    return (
+        type(target).objects.select_for_update(of=("self",))
+        .filter(pk=target.pk)
+        .annotate(current_vote=Subquery(current_vote))
+        .values("score", "upvote_count", "downvote_count", "created_at", "current_vote")
+        .get()
+    )
+
+
+def _update_counters(target, locked, current):
+    """
+    Move a post or comment's vote counters from one vote type to another in a single UPDATE statement.
+    Posts also get their rankings for the new counters. The target's version is incremented and its updated_at
+    set to the current time.
+    :param target: Post or Comment object
+    :param locked: Counters and current vote read by _lock_target
+    :param current: New vote type, or None
+    :return: tuple(int, int, int, int) - new upvote count, downvote count, score and version
+    """
+    previous = locked["current_vote"]
+    upvotes = (current == Vote.VoteType.UPVOTE) - (previous == Vote.VoteType.UPVOTE)
+    downvotes = (current == Vote.VoteType.DOWNVOTE) - (previous == Vote.VoteType.DOWNVOTE)
+    rankings = {}
+    if isinstance(target, Post):
+        rankings = post_rankings(
+            locked["upvote_count"] + upvotes, locked["downvote_count"] + downvotes, locked["created_at"]
+        )
+        for field, value in rankings.items():
+            setattr(target, field, value)
+    meta = type(target)._meta
+    quote = connection.ops.quote_name
+    assignments = "".join(f", {quote(field)} = %s" for field in rankings)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(meta.db_table)} "
+            f"SET upvote_count = upvote_count + %s, downvote_count = downvote_count + %s, score = score + %s, "
+            f"version = version + 1, updated_at = %s{assignments} "
+            f"WHERE {quote(meta.pk.column)} = %s "
+            f"RETURNING upvote_count, downvote_count, score, version",
+            [
+                upvotes,
+                downvotes,
+                upvotes - downvotes,
+                connection.ops.adapt_datetimefield_value(timezone.now()),
+                *rankings.values(),
+                target.pk,
+            ],
+        )
+        return cursor.fetchone()
+
+
+def cast_vote(target, user, vote_type, toggle=False):
+    """
+    Record a user's vote on a post or comment and update the target's vote counters.
+    The counters are also set on the target object, so it does not need to be reloaded.
+    :param target: Post or Comment object
+    :param user: User object
+    :param vote_type: Vote type to record, or None to clear the user's vote
+    :param toggle: Whether repeating the user's current vote clears it
+    :return: tuple(int, str or None) - new score and the user's current vote type
+    """
+    vote_model, target_field = VOTE_MODELS[type(target)]
+    with transaction.atomic():
+        locked = _lock_target(target, user)
+        previous = locked["current_vote"]
+        if toggle and vote_type == previous:
+            vote_type = None
+        if vote_type == previous:
+            target.score = locked["score"]
+            return target.score, previous
+
+        if vote_type is None:
+            vote_model.objects.filter(user=user, **{target_field: target}).delete()
+        else:
+            vote_model.objects.bulk_create(
+                [vote_model(user=user, vote_type=vote_type, **{target_field: target})],
+                update_conflicts=True,
+                unique_fields=["user", target_field],
+                update_fields=["vote_type"],
+            )
+        target.upvote_count, target.downvote_count, target.score, target.version = _update_counters(
+            target, locked, vote_type
+        )
+    return target.score, vote_type
+
+
+def clear_vote(target, user):
+    """
+    Remove a user's vote from a post or comment
+    :param target: Post or Comment object
+    :param user: User object
+    :return: int - new score
+    """
+    score, _ = cast_vote(target, user, None)
+    return score
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings, read from the working directory when the server starts. The command line in the Dockerfile
+sets the workers and the bind address.
+
+Author: Georgios Tsakoumakis
+"""
+
+
+def worker_exit(server, worker):
+    """
+    Write the post views still buffered by a worker when it exits, see forum/hits.py
+    :param server: Gunicorn arbiter
+    :param worker: Exiting worker
+    """
+    from forum.hits import hit_buffer
+    hit_buffer.flush()
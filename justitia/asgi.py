@@ -2,6 +2,7 @@
 ASGI config for justitia project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are handled by Django, WebSocket connections are routed to the consumers below.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -13,4 +14,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "justitia.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, consumers use the ORM
+from chatbot.consumers import ChatConsumer  # noqa: E402
+
+websocket_routes = {
+    "/ws/chatbot/": ChatConsumer.as_asgi,
+}
+
+
+async def application(scope, receive, send):
+    """
+    Route WebSocket connections by path and everything else to Django.
+    """
+    if scope["type"] == "websocket":
+        consumer = websocket_routes.get(scope["path"])
+        if consumer is None:
+            await receive()
+            await send({"type": "websocket.close"})
+            return
+        await consumer(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -1,4 +1,7 @@
 from django.contrib.syndication.views import Feed
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from forum.conditional import feed_etag, feed_last_modified
 from forum.models import Post
 
 
@@ -6,14 +9,20 @@ class LatestPostsFeed(Feed):
     """
     RSS Feed for the latest posts on Justitia.
     Install Feeder or another RSS reader extension to view and subscribe to this feed.
+    Readers polling for changes get a 304 response after a single query while no post has changed.
     """
 
     title = "Justitia - Latest Posts"
     link = "/forum/"
     description = "The latest posts on Justitia."
 
+    @method_decorator(condition(etag_func=feed_etag, last_modified_func=feed_last_modified))
+    def __call__(self, request, *args, **kwargs):
+        return super().__call__(request, *args, **kwargs)
+
     def items(self):
-        return Post.objects.filter(is_deleted=False).order_by("-created_at")[:5]
+        # The feed carries whole posts, not the excerpts shown by listings
+        return Post.objects.for_listing().defer(None)[:5]
 
     def item_title(self, item):
         return item.title
@@ -0,0 +1,53 @@
+"""
+Full-text search helpers shared by the chatbot and forum searches.
+
+On PostgreSQL the searched tables carry generated tsvector columns with GIN indexes.
+Under the SQLite test/experimental configuration FTS5 tables mirror the searched text instead.
+
+Author: Georgios Tsakoumakis
+"""
+
+import re
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Markers placed around matched terms by the database, replaced with <mark> tags after escaping
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+SNIPPET_WORDS = 16
+
+
+def headline_options(max_words=SNIPPET_WORDS):
+    """
+    Build the options of PostgreSQL's ts_headline, using the highlight markers
+    :param max_words: Maximum number of words in a snippet
+    :return: str
+    """
+    return "StartSel=%s, StopSel=%s, MaxWords=%d, MinWords=5" % (
+        HIGHLIGHT_START,
+        HIGHLIGHT_STOP,
+        max_words,
+    )
+
+
+def fts5_query(query):
+    """
+    Convert free text into an FTS5 query matching every word, so that user input cannot inject FTS5 syntax.
+    :param query: Search text entered by the user
+    :return: str - FTS5 query, empty if the text contains no words
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join('"%s"' % word for word in words)
+
+
+def highlight(snippet):
+    """
+    Escape a snippet returned by the database and wrap the matched terms in <mark> tags.
+    :param snippet: Snippet containing the highlight markers
+    :return: SafeString
+    """
+    return mark_safe(
+        escape(snippet)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_STOP, "</mark>")
+    )
@@ -76,7 +76,6 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "forum.context_processors.search_function",
             ],
         },
     },
@@ -102,6 +101,13 @@ if (
             "NAME": BASE_DIR / "db.sqlite3",
         }
     }
+    # A single process, the cache does not need to be shared
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
 else:
     DATABASES = {
         "default": {
@@ -113,6 +119,14 @@ else:
             "PORT": os.getenv("DB_PORT"),
         }
     }
+    # Shared by every worker process: the search version must be seen by all of them for cached search
+    # results and the autocomplete trie to follow changes made in another worker
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        }
+    }
 
 
 # Password validation
@@ -161,6 +175,10 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 # else:
 # STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
+# Post views are buffered in each process and written in bulk, see forum/hits.py. Tests write them at once, so
+# none are left waiting for a database that is torn down at the end of the run
+FORUM_BUFFER_HITS = "test" not in sys.argv
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 
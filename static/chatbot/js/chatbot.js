@@ -15,7 +15,7 @@ input.addEventListener('keydown', function (event) {
     }
 });
 
-// Function to display messages in the chat container
+// Function to display messages in the chat container, returns the created element
 function displayMessage(message, isUser) {
     let chatContainer = document.getElementById("chat-container");
     let chatMessages = document.getElementById("chat-messages");
@@ -35,4 +35,5 @@ function displayMessage(message, isUser) {
 
     chatMessages.appendChild(messageElement);
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    return messageElement;
 }
\ No newline at end of file
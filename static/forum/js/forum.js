@@ -6,20 +6,125 @@ document.addEventListener("DOMContentLoaded", function() {
         adjustFontSize(element);
     });
 
-    function adjustFontSize(element) {
-        const textLength = element.textContent.length;
-        if (textLength <= 2) {
-            element.style.fontSize = '2rem';
-        } else if (textLength === 3) {
-            element.style.fontSize = '1.4rem';
-        } else if (textLength === 4) {
-            element.style.fontSize = '1.2rem';
-        } else {
-            element.style.fontSize = '1.0rem';
+    // Send votes in the background instead of reloading the page
+    document.querySelectorAll('form[data-vote-url]').forEach(form => {
+        form.addEventListener('submit', submitVote);
+    });
+
+    document.querySelectorAll('input[data-autocomplete-url]').forEach(input => {
+        input.addEventListener('input', suggestTitles);
+    });
+
+    // The button is replaced by every page of comments it loads, so clicks are handled on the document
+    document.addEventListener('click', event => {
+        const button = event.target.closest('.load-more-comments');
+        if (button) {
+            loadMoreComments(event, button);
         }
-    }
+    });
 });
 
+// Function to append the next page of comments in place of the "Load more comments" button
+function loadMoreComments(event, button) {
+    if (!window.fetch) {
+        // Fall back to opening the next page of comments
+        return;
+    }
+    event.preventDefault();
+    fetch(button.dataset.fragmentUrl, {credentials: 'same-origin'})
+        .then(response => response.ok ? response.text() : null)
+        .then(html => {
+            if (html === null) {
+                window.location = button.href;
+                return;
+            }
+            const fragment = document.createRange().createContextualFragment(html);
+            fragment.querySelectorAll('.upvote-count').forEach(adjustFontSize);
+            fragment.querySelectorAll('form[data-vote-url]').forEach(form => {
+                form.addEventListener('submit', submitVote);
+            });
+            button.replaceWith(fragment);
+        });
+}
+
+// Function to suggest post titles while typing in the search box
+let suggestTimer = null;
+
+function suggestTitles(event) {
+    const input = event.currentTarget;
+    const list = document.getElementById(input.getAttribute('list'));
+    clearTimeout(suggestTimer);
+    // Wait for a pause in typing so that every keystroke does not send a request
+    suggestTimer = setTimeout(() => {
+        if (input.value.trim().length < 2) {
+            list.replaceChildren();
+            return;
+        }
+        fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value), {credentials: 'same-origin'})
+            .then(response => response.ok ? response.json() : {suggestions: []})
+            .then(result => {
+                list.replaceChildren(...result.suggestions.map(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = suggestion.title;
+                    return option;
+                }));
+            });
+    }, 150);
+}
+
+function adjustFontSize(element) {
+    const textLength = element.textContent.length;
+    if (textLength <= 2) {
+        element.style.fontSize = '2rem';
+    } else if (textLength === 3) {
+        element.style.fontSize = '1.4rem';
+    } else if (textLength === 4) {
+        element.style.fontSize = '1.2rem';
+    } else {
+        element.style.fontSize = '1.0rem';
+    }
+}
+
+// Function to vote on a post or comment and update its score in place
+function submitVote(event) {
+    const form = event.currentTarget;
+    const button = event.submitter;
+    if (!button || !window.fetch) {
+        // Fall back to the regular form submission
+        return;
+    }
+    event.preventDefault();
+
+    const data = new FormData(form);
+    data.append(button.name, button.value);
+    fetch(form.dataset.voteUrl, {
+        method: 'POST',
+        body: data,
+        headers: {'X-CSRFToken': data.get('csrfmiddlewaretoken')},
+        credentials: 'same-origin'
+    })
+        .then(response => {
+            if (response.status === 403) {
+                // Not logged in, let the regular form redirect to the login page
+                form.submit();
+                return null;
+            }
+            return response.ok ? response.json() : null;
+        })
+        .then(result => {
+            if (result === null) {
+                return;
+            }
+            const score = document.getElementById(form.dataset.scoreId);
+            if (score) {
+                score.textContent = result.score;
+                adjustFontSize(score);
+            }
+            form.querySelector('.button_upvote').classList.toggle('active', result.vote === 'up');
+            form.querySelector('.button_downvote').classList.toggle('active', result.vote === 'down');
+        });
+}
+
 // Function to show when upvote/downvote button is pressed down
 $(document).ready(function () {
     $('.vote-section').each(function () {
@@ -64,9 +169,29 @@ function addCommentForm() {
     }
 }
 
+// Function to add a reply form below a comment
+function addReplyForm(button) {
+    const comment = button.closest('.comment-box');
+    if (comment.nextElementSibling && comment.nextElementSibling.classList.contains('reply-form')) {
+        return;
+    }
+    const template = document.getElementById('comment-form-template');
+    const clone = template.cloneNode(true);
+    clone.removeAttribute('id');
+    clone.style.display = 'block';
+    clone.classList.add('cloned-comment-form', 'reply-form', 'main-box');
+    clone.style.setProperty('--depth', comment.style.getPropertyValue('--depth'));
+    clone.querySelector('input[name="parent"]').value = button.dataset.commentId;
+    comment.after(clone);
+}
+
 // Function to remove comment form
 function removeForm(button) {
     const form = button.closest('.cloned-comment-form');
+    if (form && form.classList.contains('reply-form')) {
+        form.remove();
+        return;
+    }
     const mainBox = document.getElementById('comment-box');
 
     if (form) {
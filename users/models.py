@@ -64,15 +64,26 @@ class CustomUser(AbstractUser):
         """
         return self.username
 
+    @property
+    def professional(self):
+        """
+        Get the professional profile of the user. The profile is read from select_related("professionaluser")
+        when the user was loaded with it, otherwise with one query. Either way the result, including its absence,
+        is cached on the user instance, so is_professional and flair do not query again.
+        :return: ProfessionalUser or None
+        """
+        try:
+            return self.professionaluser
+        except ProfessionalUser.DoesNotExist:
+            return None
+
     @property
     def is_professional(self):
         """
         Check if the user is a professional user
         :return: bool
         """
-        # Query the ProfessionalUser model to check if the user is a professional
-        exists = ProfessionalUser.objects.filter(user=self).exists()
-        return exists
+        return self.professional is not None
 
     @property
     def flair(self):
@@ -80,10 +91,8 @@ class CustomUser(AbstractUser):
         Get the flair of the professional user
         :return: str - flair
         """
-        # If user exists in professional user model, return its flair
-        if self.is_professional:
-            return ProfessionalUser.objects.get(user=self).flair
-        return None
+        professional = self.professional
+        return professional.flair if professional is not None else None
 
 
 class ProfessionalUser(models.Model):
@@ -356,6 +356,25 @@ class ProfessionalUserModelTest(TestCase):
         )
         self.assertEqual(professional_user.user.reason_banned, "")
 
+    def test_professional_status_queried_once(self):
+        """
+        TUM42: Test that is_professional and flair reuse a prefetched profile and query at most once otherwise.
+        """
+        ProfessionalUser.objects.create(user=self.user, flair="Experienced Attorney")
+        other = CustomUser.objects.create_user(
+            username='standarduser',
+            email='standard@example.com',
+            password='Password123!'
+        )
+        with self.assertNumQueries(1):
+            users = list(CustomUser.objects.select_related("professionaluser").order_by("id"))
+            self.assertEqual([(user.is_professional, user.flair) for user in users],
+                             [(True, "Experienced Attorney"), (False, None)])
+        other = CustomUser.objects.get(pk=other.pk)
+        with self.assertNumQueries(1):
+            self.assertFalse(other.is_professional)
+            self.assertIsNone(other.flair)
+
 
 class EducationModelTest(TestCase):
     """
@@ -446,19 +446,11 @@ def profile(request, username):
     :param username: Username of the user whose profile is being viewed
     :return: Rendered user profile page
     """
-    user = CustomUser.objects.get(username=username)
+    user = CustomUser.objects.select_related("professionaluser").get(username=username)
     educations = Education.objects.filter(prof_id__user=user)
     employments = Employments.objects.filter(prof_id__user=user)
-    recent_posts = (
-        Post.objects.filter(user=user)
-        .filter(is_deleted=False)
-        .order_by("-created_at")[:3]
-    )
-    recent_comments = (
-        Comment.objects.filter(user=user)
-        .filter(is_deleted=False)
-        .order_by("-created_at")[:3]
-    )
+    recent_posts = Post.objects.for_listing().filter(user=user)[:3]
+    recent_comments = Comment.objects.for_listing().filter(user=user)[:3]
     context = {
         "viewed_user": user,
         "recent_posts": recent_posts,